@@ -1,5 +1,5 @@
 from flask import Flask, send_from_directory, request, redirect, render_template_string, jsonify, Response, flash, url_for
-import os, re, json, time, sqlite3, sys, shutil, signal
+import os, re, json, time, sqlite3, sys, shutil, signal, math
 from datetime import datetime
 from werkzeug.utils import secure_filename
 
@@ -52,6 +52,7 @@ def purge_legacy_quizzes():
                 lp = os.path.join(LOGO_FOLDER, logo)
                 if os.path.exists(lp):
                     os.remove(lp)
+                LOGO_INDEX.invalidate()
 
         else:
             kept.append(q)
@@ -229,6 +230,62 @@ for d in [
     os.makedirs(d, exist_ok=True)
 
 
+# =========================
+# LOGO / BACKGROUND INDEX
+# =========================
+# The library and /dynamic.css ask "does this logo / background exist?"
+# on every render. Each folder's file names are kept in memory instead
+# and listed again only when the folder's mtime changes, so a render
+# costs one stat per folder rather than one per quiz (slow on network
+# home directories). DLMS's own uploads and deletes invalidate the index,
+# in case the filesystem reports mtimes coarsely or late.
+import threading
+
+
+class AssetIndex:
+    def __init__(self, folder):
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._names = frozenset()
+
+    def names(self):
+        """
+        The folder's file names as a frozenset: one stat, plus a listing
+        if the folder changed.
+        """
+        try:
+            mtime = os.stat(self.folder).st_mtime_ns
+        except OSError:
+            mtime = None
+
+        with self._lock:
+            if mtime is None:
+                self._names = frozenset()
+            elif mtime != self._mtime:
+                try:
+                    self._names = frozenset(os.listdir(self.folder))
+                except OSError:
+                    self._names = frozenset()
+            self._mtime = mtime
+            return self._names
+
+    def __contains__(self, name):
+        return bool(name) and name in self.names()
+
+    def invalidate(self):
+        """
+        List the folder again on the next lookup, whatever its mtime.
+        """
+        with self._lock:
+            self._mtime = None
+
+
+LOGO_INDEX = AssetIndex(LOGO_FOLDER)
+BACKGROUND_INDEX = AssetIndex(BACKGROUND_FOLDER)
+STATIC_BACKGROUND_INDEX = AssetIndex(os.path.join(app.static_folder, "bg"))
+
+
 
 PORTAL_CONFIG = os.path.join(CONFIG_FOLDER, "portal.json")
 QUIZ_REGISTRY = os.path.join(CONFIG_FOLDER, "quizzes.json")
@@ -330,6 +387,7 @@ def finalize_logo_from_request(app, ts, *, logo_file=None, temp_logo_name=None):
 
         os.rename(src, dst)
         assert os.path.exists(dst), f"Logo finalize invariant violated: {dst}"
+        LOGO_INDEX.invalidate()
 
         print(f"[LOGO] Finalized logo → {dst}")
         return logo_filename
@@ -345,6 +403,7 @@ def finalize_logo_from_request(app, ts, *, logo_file=None, temp_logo_name=None):
 
             logo_file.save(dst)
             assert os.path.exists(dst), f"Logo upload invariant violated: {dst}"
+            LOGO_INDEX.invalidate()
 
             print(f"[LOGO] Uploaded logo → {dst}")
             return logo_filename
@@ -420,7 +479,7 @@ def user_static(filename):
 def shutdown_app():
     print("[SYSTEM] Shutdown requested via UI")
 
-    pid = os.getpid()
+    pid = SERVER_MASTER_PID or os.getpid()
 
     def shutdown():
         print("[SYSTEM] Sending SIGINT to self")
@@ -466,12 +525,9 @@ def dynamic_css():
     if not bg:
         css_bg = "none"
     else:
-        user_bg = os.path.join(APP_DATA_DIR, "static", "bg", bg)
-        static_bg = os.path.join(app.static_folder, "bg", bg)
-
-        if os.path.exists(user_bg):
+        if bg in BACKGROUND_INDEX:
             css_bg = f"url('/user-bg/{bg}')"
-        elif os.path.exists(static_bg):
+        elif bg in STATIC_BACKGROUND_INDEX:
             css_bg = f"url('/static/bg/{bg}')"
         else:
             css_bg = "none"
@@ -779,6 +835,7 @@ def cleanup_temp_logos(max_age_minutes=30):
 
             if age_minutes > max_age_minutes:
                 os.remove(path)
+                LOGO_INDEX.invalidate()
                 print(f"[CLEANUP] Removed abandoned temp logo: {fname}")
 
         except Exception as e:
@@ -1020,6 +1077,42 @@ def save_law_registry(registry):
 
 
 
+# =========================
+# ATOMIC FILE WRITES
+# =========================
+# Quiz JSON / HTML and the registry are written to a temporary file in
+# the same folder and renamed over the old one, so a player or the
+# library never reads a half-written file.
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path, encoding="utf-8"):
+    folder = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(
+        dir=folder,
+        prefix=f".{os.path.basename(path)}.",
+        suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w", encoding=encoding) as f:
+            yield f
+        # mkstemp creates the file as 0600; keep the mode of the old file
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except OSError:
+            mode = 0o644
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
 # =========================
 # QUIZ REGISTRY
 # =========================
@@ -1036,7 +1129,7 @@ def load_registry():
 def save_registry(registry):
     try:
         os.makedirs(os.path.dirname(QUIZ_REGISTRY), exist_ok=True)
-        with open(QUIZ_REGISTRY, "w", encoding="utf-8") as f:
+        with atomic_write(QUIZ_REGISTRY) as f:
             json.dump(registry, f, indent=4)
     except Exception as e:
         print(f"[REGISTRY ERROR] save_registry failed: {e}")
@@ -3654,6 +3747,59 @@ def serve_quiz(filename):
 # =========================
 # EDIT QUIZ - FORM
 # =========================
+# The editor shows one page of questions at a time, loaded with a single
+# joined query (iter_quiz_questions), so a quiz with thousands of
+# questions opens as fast as a short one. ?question=N opens the page
+# holding question N; /api/quiz/<id>/questions?find= backs the
+# jump-to-question box.
+EDIT_QUIZ_PAGE_SIZE = 50
+EDIT_QUIZ_FIND_LIMIT = 20
+
+
+def find_quiz_questions(cur, quiz_id, number=None, text=None, limit=EDIT_QUIZ_FIND_LIMIT):
+    """
+    Questions matching a question number or a piece of question text
+    (case-insensitive), as (id, number, text, editor page), in order.
+    """
+    if number is not None:
+        where, args = "question_number = ?", (number,)
+    else:
+        escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        where, args = "question_text LIKE ? ESCAPE '\\'", (f"%{escaped}%",)
+
+    rows = cur.execute(
+        f"""
+        SELECT id, question_number, question_text, pos
+        FROM (
+            SELECT id, question_number, question_text,
+                   ROW_NUMBER() OVER (ORDER BY question_number, id) - 1 AS pos
+            FROM questions
+            WHERE quiz_id = ?
+        )
+        WHERE {where}
+        ORDER BY pos
+        LIMIT ?
+        """,
+        (quiz_id, *args, limit)
+    ).fetchall()
+
+    return [
+        (qid, qnum, qtext, pos // EDIT_QUIZ_PAGE_SIZE + 1)
+        for qid, qnum, qtext, pos in rows
+    ]
+
+
+def edit_quiz_redirect(quiz_id, page=None):
+    """
+    Back to the editor page the form was posted from.
+    """
+    if page is None:
+        page = request.form.get("page", type=int)
+    if page and page > 1:
+        return redirect(f"/edit_quiz/{quiz_id}?page={page}")
+    return redirect(f"/edit_quiz/{quiz_id}")
+
+
 @app.route("/edit_quiz/<int:quiz_id>")
 def edit_quiz(quiz_id):
     conn = get_db()
@@ -3669,35 +3815,28 @@ def edit_quiz(quiz_id):
         conn.close()
         return "Quiz not found", 404
 
-    questions = cur.execute(
-        """
-        SELECT id, question_number, question_text
-        FROM questions
-        WHERE quiz_id = ?
-        ORDER BY question_number, id
-        """,
+    total = cur.execute(
+        "SELECT COUNT(*) FROM questions WHERE quiz_id = ?",
         (quiz_id,)
-    ).fetchall()
-
-    question_list = []
-
-    for q in questions:
-        choices = cur.execute(
-            """
-            SELECT id, label, text, is_correct
-            FROM choices
-            WHERE question_id = ?
-            ORDER BY label
-            """,
-            (q["id"],)
-        ).fetchall()
+    ).fetchone()[0]
+    pages = max(1, -(-total // EDIT_QUIZ_PAGE_SIZE))
+
+    page = request.args.get("page", 1, type=int)
+    jump = request.args.get("question", type=int)
+    if jump is not None:
+        found = find_quiz_questions(cur, quiz_id, number=jump, limit=1)
+        if found:
+            page = found[0][3]
+        else:
+            flash(f"Question {jump} was not found.", "error")
+    page = min(max(page, 1), pages)
 
-        question_list.append({
-            "id": q["id"],
-            "number": q["question_number"],
-            "text": q["question_text"],
-            "choices": choices
-        })
+    questions = list(iter_quiz_questions(
+        cur,
+        quiz_id,
+        offset=(page - 1) * EDIT_QUIZ_PAGE_SIZE,
+        limit=EDIT_QUIZ_PAGE_SIZE
+    ))
 
     conn.close()
 
@@ -3738,8 +3877,36 @@ def edit_quiz(quiz_id):
                 Optional. Uploading a new logo will replace the current quiz logo.
             </p>                     
 
+            <input type="hidden" name="page" value="{{ page }}">
+
+            {% set pager %}
+            <div class="edit-pager" style="display:flex; flex-wrap:wrap; gap:8px; align-items:center; margin-top:14px;">
+                {% if page > 1 %}
+                    <a href="/edit_quiz/{{ quiz['id'] }}?page=1">⏮ First</a>
+                    <a href="/edit_quiz/{{ quiz['id'] }}?page={{ page - 1 }}">◀ Previous</a>
+                {% endif %}
+                <span>Page {{ page }} of {{ pages }} ({{ total }} questions)</span>
+                {% if page < pages %}
+                    <a href="/edit_quiz/{{ quiz['id'] }}?page={{ page + 1 }}">Next ▶</a>
+                    <a href="/edit_quiz/{{ quiz['id'] }}?page={{ pages }}">Last ⏭</a>
+                {% endif %}
+            </div>
+            {% endset %}
+
+            <div style="margin-top:14px;">
+                <label>
+                    <b>Jump to question:</b>
+                    <input type="text" id="jump-query" placeholder="Number or text"
+                           style="width:260px; padding:6px;">
+                </label>
+                <button type="button" onclick="jumpToQuestion()">🔎 Find</button>
+                <ul id="jump-results" style="margin-top:6px;"></ul>
+            </div>
+
+            {{ pager }}
+
             {% for q in questions %}
-            <div class="card question-block" style="margin-top:18px;">
+            <div class="card question-block" id="q-{{ q.number }}" style="margin-top:18px;">
                 <h3>Question {{ q.number }}</h3>
 
                 <button type="submit"
@@ -3750,7 +3917,7 @@ def edit_quiz(quiz_id):
                     🗑 Delete Question
                 </button>
 
-                <textarea name="question_{{ q.id }}" style="width:100%; min-height:90px;">{{ q.text }}</textarea>
+                <textarea name="question_{{ q.id }}" style="width:100%; min-height:90px;">{{ q.question }}</textarea>
 
                 <ul>
                 {% for c in q.choices %}
@@ -3758,12 +3925,12 @@ def edit_quiz(quiz_id):
                         <b>{{ c["label"] }}.</b>
 
                         <input type="text"
-                               name="choice_{{ c['id'] }}"
+                               name="choice_{{ c.id }}"
                                value="{{ c['text'] }}"
                                style="width:65%; padding:6px;">
 
                         <input type="checkbox"
-                               name="correct_{{ c['id'] }}"
+                               name="correct_{{ c.id }}"
                                {% if c["is_correct"] %}checked{% endif %}>
                         Correct
 
@@ -3786,11 +3953,10 @@ def edit_quiz(quiz_id):
                     <label>
                         Add answer choices:
                         <input type="number"
-                               name="choice_count"
+                               name="choice_count_{{ q.id }}"
                                value="1"
                                min="1"
                                max="10"
-                               
                                style="width:70px; padding:5px;">
                     </label>
 
@@ -3803,6 +3969,8 @@ def edit_quiz(quiz_id):
             </div>
             {% endfor %}
 
+            {{ pager }}
+
             <br>
 
             <button type="submit" name="action" value="add_question">
@@ -3810,6 +3978,7 @@ def edit_quiz(quiz_id):
             </button>
 
             <button type="submit">💾 Save Changes</button>
+            <span id="save-status" style="margin-left:10px; font-size:13px; opacity:.85;"></span>
         </form>
 
         <!-- ✅ OUTSIDE FORMS: SAFE DELETE + ADD CHOICES + DELETE CHOICES -->
@@ -3817,17 +3986,20 @@ def edit_quiz(quiz_id):
         <form id="delete-question-{{ q.id }}"
               method="POST"
               action="/delete_question/{{ quiz['id'] }}/{{ q.id }}">
+            <input type="hidden" name="page" value="{{ page }}">
         </form>
 
         <form id="add-choices-{{ q.id }}"
               method="POST"
               action="/add_choices/{{ quiz['id'] }}/{{ q.id }}">
+            <input type="hidden" name="page" value="{{ page }}">
         </form>
 
             {% for c in q.choices %}
             <form id="delete-choice-{{ c.id }}"
                   method="POST"
                   action="/delete_choice/{{ quiz['id'] }}/{{ c.id }}">
+                <input type="hidden" name="page" value="{{ page }}">
             </form>
             {% endfor %}
         {% endfor %}
@@ -3837,7 +4009,36 @@ def edit_quiz(quiz_id):
 </div>
 
 <script>
-document.getElementById("edit-quiz-form").addEventListener("submit", function(e) {
+const editForm = document.getElementById("edit-quiz-form");
+
+// JSON Patch "replace" operations for the fields that differ from what
+// the page was loaded with
+function changedFields() {
+    const ops = [];
+
+    const title = editForm.elements["quiz_title"];
+    if (title.value !== title.defaultValue && title.value.trim()) {
+        ops.push({op: "replace", path: "/title", value: title.value.trim()});
+    }
+
+    editForm.querySelectorAll("[name^='question_'], [name^='choice_'], [name^='correct_']").forEach(el => {
+        const m = /^(question|choice|correct)_(\\d+)$/.exec(el.name);
+        if (!m) return;
+
+        if (m[1] === "correct") {
+            if (el.checked !== el.defaultChecked) {
+                ops.push({op: "replace", path: `/choices/${m[2]}/is_correct`, value: el.checked});
+            }
+        } else if (el.value !== el.defaultValue) {
+            const kind = m[1] === "question" ? "questions" : "choices";
+            ops.push({op: "replace", path: `/${kind}/${m[2]}/text`, value: el.value});
+        }
+    });
+
+    return ops;
+}
+
+editForm.addEventListener("submit", async function(e) {
     const questions = document.querySelectorAll(".question-block");
 
     for (let i = 0; i < questions.length; i++) {
@@ -3850,12 +4051,111 @@ document.getElementById("edit-quiz-form").addEventListener("submit", function(e)
             return;
         }
     }
+
+    // Adding questions / choices and new logos go through the full form post
+    const logo = editForm.elements["quiz_logo"];
+    if ((e.submitter && e.submitter.name === "action") || (logo && logo.files.length)) {
+        editForm.dataset.posting = "1";
+        return;
+    }
+
+    e.preventDefault();
+    const status = document.getElementById("save-status");
+    const ops = changedFields();
+
+    if (!ops.length) {
+        status.textContent = "No changes to save.";
+        return;
+    }
+
+    status.textContent = "Saving…";
+
+    let res;
+    try {
+        res = await fetch("/api/quiz/{{ quiz['id'] }}", {
+            method: "PATCH",
+            headers: {"Content-Type": "application/json-patch+json"},
+            body: JSON.stringify(ops)
+        });
+    } catch (err) {
+        editForm.dataset.posting = "1";
+        editForm.submit();  // no JSON API reachable: post the whole form
+        return;
+    }
+
+    const body = await res.json().catch(() => ({}));
+    if (!res.ok) {
+        status.textContent = "";
+        alert(body.error || "Saving failed.");
+        return;
+    }
+
+    editForm.querySelectorAll("input, textarea").forEach(el => {
+        if (el.type === "checkbox") {
+            el.defaultChecked = el.checked;
+        } else if (el.type !== "file") {
+            el.defaultValue = el.value;
+        }
+    });
+
+    status.textContent = `✅ Saved ${ops.length} change${ops.length === 1 ? "" : "s"} ` +
+        `in ${Math.round(body.ms)} ms.`;
+});
+
+// Warn before the pager or a search result leaves unsaved edits behind
+window.addEventListener("beforeunload", function(e) {
+    if (!editForm.dataset.posting && changedFields().length) {
+        e.preventDefault();
+        e.returnValue = "";
+    }
+});
+
+async function jumpToQuestion() {
+    const query = document.getElementById("jump-query").value.trim();
+    const results = document.getElementById("jump-results");
+    results.replaceChildren();
+
+    if (!query) {
+        return;
+    }
+
+    if (/^\\d+$/.test(query)) {
+        location.href = `/edit_quiz/{{ quiz['id'] }}?question=${query}#q-${query}`;
+        return;
+    }
+
+    const res = await fetch(`/api/quiz/{{ quiz['id'] }}/questions?find=${encodeURIComponent(query)}`);
+    const body = await res.json().catch(() => ({}));
+    const matches = body.matches || [];
+
+    if (!matches.length) {
+        const li = document.createElement("li");
+        li.textContent = body.error || "No matching questions.";
+        results.append(li);
+        return;
+    }
+
+    matches.forEach(m => {
+        const li = document.createElement("li");
+        const link = document.createElement("a");
+        link.href = `/edit_quiz/{{ quiz['id'] }}?page=${m.page}#q-${m.number}`;
+        link.textContent = `Question ${m.number}`;
+        li.append(link, ` (page ${m.page}): ${m.text}`);
+        results.append(li);
+    });
+}
+
+document.getElementById("jump-query").addEventListener("keydown", function(e) {
+    if (e.key === "Enter") {
+        e.preventDefault();  // the box sits inside the edit form
+        jumpToQuestion();
+    }
 });
 </script>
 
 </body>
 </html>
-""", quiz=quiz, questions=question_list)
+""", quiz=quiz, questions=questions, page=page, pages=pages, total=total)
 
 
 # =========================
@@ -4129,76 +4429,6 @@ def law_export_case_review_txt(case_id):
 
 
 
-
-
-def rebuild_quiz_json_from_db(quiz_id):
-    conn = get_db()
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-
-    registry = load_registry()
-    quiz_entry = next((q for q in registry if q.get("id") == quiz_id), None)
-
-    if not quiz_entry or not quiz_entry.get("html"):
-        conn.close()
-        print("[EDIT] Could not find quiz registry entry for JSON rebuild:", quiz_id)
-        return False
-
-    json_name = quiz_entry["html"].replace(".html", ".json")
-    json_path = os.path.join(DATA_FOLDER, json_name)
-
-    questions = cur.execute(
-        """
-        SELECT id, question_number, question_text
-        FROM questions
-        WHERE quiz_id = ?
-        ORDER BY question_number, id
-        """,
-        (quiz_id,)
-    ).fetchall()
-
-    quiz_data = []
-
-    for q in questions:
-        choices = cur.execute(
-            """
-            SELECT label, text, is_correct
-            FROM choices
-            WHERE question_id = ?
-            ORDER BY label
-            """,
-            (q["id"],)
-        ).fetchall()
-
-        correct_letters = [
-            c["label"]
-            for c in choices
-            if c["is_correct"]
-        ]
-
-        quiz_data.append({
-            "number": q["question_number"],
-            "question": q["question_text"],
-            "choices": [
-                {
-                    "label": c["label"],
-                    "text": c["text"],
-                    "is_correct": bool(c["is_correct"])
-                }
-                for c in choices
-            ],
-            "correct": correct_letters
-        })
-
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(quiz_data, f, indent=4)
-
-    conn.close()
-    print("[EDIT] Rebuilt quiz JSON:", json_path)
-    return True
-
-
-
 def rebuild_quiz_html_from_registry(quiz_id):
     registry = load_registry()
     quiz_entry = next((q for q in registry if q.get("id") == quiz_id), None)
@@ -4228,121 +4458,537 @@ def rebuild_quiz_html_from_registry(quiz_id):
 
 
 # =========================
-# EDIT QUIZ - SAVE CHANGES
+# QUIZ ARTIFACTS - INCREMENTAL UPDATES
 # =========================
-@app.route("/edit_quiz/<int:quiz_id>", methods=["POST"])
-def save_edited_quiz(quiz_id):
-    conn = get_db()
-    cur = conn.cursor()
+# Every edit bumps quizzes.version in its own transaction. Afterwards
+# update_quiz_artifacts brings the quiz JSON up to that version: when
+# the file is exactly one edit behind, only the blocks of the questions
+# the edit touched are re-encoded and spliced into it; otherwise (several
+# edits behind, a renumbering delete, an unfamiliar file layout) the
+# whole file is rebuilt. The quiz HTML only holds the title, logo and
+# JSON name, so question edits leave it alone.
 
-    action = request.form.get("action", "")
+import threading
 
-    ts = int(time.time())
+# More changed questions than this and a full rebuild is as cheap
+QUIZ_JSON_SPLICE_MAX = 500
 
-    quiz_logo = request.files.get("quiz_logo")
+_quiz_artifact_locks = {}
+_quiz_artifact_locks_guard = threading.Lock()
 
-    logo_filename = finalize_logo_from_request(
-        app,
-        ts,
-        logo_file=quiz_logo
-    )
 
-    # =========================
-    # SAVE CURRENT FORM VALUES FIRST
-    # =========================
-    new_title = request.form.get("quiz_title", "").strip()
+def bump_quiz_version(cur, quiz_id):
+    """
+    Inside the caller's transaction. Returns the new version.
+    """
+    cur.execute("UPDATE quizzes SET version = version + 1 WHERE id = ?", (quiz_id,))
+    row = cur.execute("SELECT version FROM quizzes WHERE id = ?", (quiz_id,)).fetchone()
+    return row[0] if row else None
 
-    if new_title:
-        cur.execute(
-            "UPDATE quizzes SET title = ? WHERE id = ?",
-            (new_title, quiz_id)
-        )
 
-        registry = load_registry()
-        for q in registry:
-            if q.get("id") == quiz_id:
-                q["title"] = new_title
+def _quiz_artifact_lock(quiz_id):
+    with _quiz_artifact_locks_guard:
+        return _quiz_artifact_locks.setdefault(quiz_id, threading.Lock())
 
-                if logo_filename:
-                    q["logo"] = logo_filename
 
-        save_registry(registry)
+def _quiz_position_runs(cur, quiz_id, question_ids):
+    """
+    Positions (0-based, in question-number order) of question_ids,
+    grouped into runs of consecutive positions: [(first, count), ...].
+    """
+    positions = []
+    for chunk in _id_chunks(question_ids):
+        positions.extend(row[0] for row in cur.execute(
+            f"""
+            SELECT pos
+            FROM (
+                SELECT id, ROW_NUMBER() OVER (ORDER BY question_number, id) - 1 AS pos
+                FROM questions
+                WHERE quiz_id = ?
+            )
+            WHERE id IN ({','.join('?' * len(chunk))})
+            """,
+            (quiz_id, *chunk)
+        ))
+    positions.sort()
 
-    questions = cur.execute(
-        "SELECT id FROM questions WHERE quiz_id = ?",
-        (quiz_id,)
-    ).fetchall()
+    runs = []
+    for pos in positions:
+        if runs and runs[-1][0] + runs[-1][1] == pos:
+            runs[-1][1] += 1
+        else:
+            runs.append([pos, 1])
+    return runs
 
-    for q in questions:
-        question_id = q[0]
-        new_question_text = request.form.get(f"question_{question_id}", "").strip()
 
-        cur.execute(
-            "UPDATE questions SET question_text = ? WHERE id = ?",
-            (new_question_text, question_id)
-        )
+def _splice_quiz_json(cur, quiz_id, json_path, question_ids, total):
+    """
+    Re-encode only question_ids' blocks into the existing file. False if
+    the file does not line up with the database (then rebuild it all).
+    """
+    blocks = read_quiz_json_blocks(json_path)
+    if blocks is None:
+        return False
 
-    choices = cur.execute(
-        """
-        SELECT c.id
-        FROM choices c
-        JOIN questions q ON q.id = c.question_id
-        WHERE q.quiz_id = ?
-        """,
-        (quiz_id,)
-    ).fetchall()
+    runs = _quiz_position_runs(cur, quiz_id, question_ids)
 
-    for c in choices:
-        choice_id = c[0]
-        new_choice_text = request.form.get(f"choice_{choice_id}", "").strip()
-        is_correct = 1 if request.form.get(f"correct_{choice_id}") else 0
+    # Questions added at the end are the only ones the file may lack
+    if len(blocks) != total:
+        appended = total - len(blocks)
+        if appended < 0 or not runs or runs[-1][0] + runs[-1][1] != total or runs[-1][1] < appended:
+            return False
 
-        cur.execute(
-            """
-            UPDATE choices
-            SET text = ?, is_correct = ?
-            WHERE id = ?
-            """,
-            (new_choice_text, is_correct, choice_id)
-        )
+    for first, count in runs:
+        for offset, q in enumerate(iter_quiz_questions(cur, quiz_id, offset=first, limit=count)):
+            pos = first + offset
+            if pos < len(blocks):
+                blocks[pos] = quiz_json_block(q)
+            else:
+                blocks.append(quiz_json_block(q))
 
-    # =========================
-    # ADD NEW QUESTION
-    # =========================
-    if action == "add_question":
-        row = cur.execute(
-            "SELECT MAX(question_number) FROM questions WHERE quiz_id = ?",
-            (quiz_id,)
-        ).fetchone()
+    write_quiz_json_blocks(json_path, blocks)
+    return True
 
-        next_qnum = (row[0] or 0) + 1
 
-        cur.execute(
-            """
-            INSERT INTO questions (quiz_id, question_number, question_text)
-            VALUES (?, ?, ?)
-            """,
-            (quiz_id, next_qnum, "New question")
-        )
+def update_quiz_artifacts(quiz_id, question_ids=None, html=False):
+    """
+    Bring a quiz's JSON up to its current version after an edit.
+    question_ids are the questions the edit touched (None: rebuild the
+    whole file). html=True also rebuilds the quiz HTML (title or logo
+    changed). Returns the version the JSON now reflects.
+    """
+    registry_entry = next((q for q in load_registry() if q.get("id") == quiz_id), None)
+    if not registry_entry or not registry_entry.get("html"):
+        print("[EDIT] Could not find quiz registry entry for JSON rebuild:", quiz_id)
+        return None
 
-        question_id = cur.lastrowid
+    json_path = os.path.join(DATA_FOLDER, registry_entry["html"].replace(".html", ".json"))
 
-        for label in ["A", "B", "C", "D"]:
-            cur.execute(
-                """
-                INSERT INTO choices (question_id, label, text, is_correct)
-                VALUES (?, ?, ?, ?)
-                """,
-                (question_id, label, f"Option {label}", 0)
-            )
+    with _quiz_artifact_lock(quiz_id):
+        conn = get_db()
+        try:
+            cur = conn.cursor()
+            row = cur.execute(
+                "SELECT version, json_version FROM quizzes WHERE id = ?",
+                (quiz_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            version, json_version = row
+
+            if json_version >= version and os.path.exists(json_path):
+                mode = "current"
+            else:
+                mode = "rebuilt"
+                if (
+                    question_ids is not None
+                    and json_version == version - 1
+                    and len(question_ids) <= QUIZ_JSON_SPLICE_MAX
+                    and os.path.exists(json_path)
+                ):
+                    total = cur.execute(
+                        "SELECT COUNT(*) FROM questions WHERE quiz_id = ?",
+                        (quiz_id,)
+                    ).fetchone()[0]
+                    if _splice_quiz_json(cur, quiz_id, json_path, question_ids, total):
+                        mode = "spliced"
 
-        conn.commit()
-        conn.close()
+                if mode == "rebuilt":
+                    write_quiz_json(json_path, iter_quiz_questions(cur, quiz_id))
 
-        rebuild_quiz_json_from_db(quiz_id)
+                cur.execute(
+                    "UPDATE quizzes SET json_version = ? WHERE id = ? AND json_version < ?",
+                    (version, quiz_id, version)
+                )
+                conn.commit()
+        finally:
+            conn.close()
+
+    print(f"[EDIT] Quiz JSON v{version} ({mode}, {len(question_ids) if question_ids is not None else 'all'} questions):", json_path)
+
+    if html:
+        rebuild_quiz_html_from_registry(quiz_id)
+
+    return version
+
+
+# =========================
+# EDIT QUIZ - PATCH (changed fields only)
+# =========================
+# The editor sends only the fields that changed, as JSON Patch "replace"
+# operations (RFC 6902; the other operations are not supported):
+#
+#   [{"op": "replace", "path": "/title", "value": "New title"},
+#    {"op": "replace", "path": "/questions/<id>/text", "value": "..."},
+#    {"op": "replace", "path": "/choices/<id>/text", "value": "..."},
+#    {"op": "replace", "path": "/choices/<id>/is_correct", "value": true}]
+#
+# Each kind of change is one executemany, all in one transaction, and
+# only the artifacts that depend on what changed are rebuilt: the quiz
+# JSON for question / choice edits, the registry and quiz HTML for a new
+# title. Rows whose value did not change are not rewritten.
+QUIZ_PATCH_PATH = re.compile(r"^/(?:(title)|(questions|choices)/(\d+)/(text|is_correct))$")
+
+# Ids per "IN (...)" list, well under SQLite's bound-variable limit
+SQL_IN_CHUNK = 500
+
+
+class QuizPatchError(ValueError):
+    pass
+
+
+def parse_quiz_patch(ops):
+    """
+    Turn a list of patch operations into (title or None, {question_id:
+    text}, {choice_id: text}, {choice_id: is_correct}). Later operations
+    on the same field win. Raises QuizPatchError on anything else.
+    """
+    if not isinstance(ops, list):
+        raise QuizPatchError("Expected a list of patch operations.")
+
+    title = None
+    question_texts = {}
+    choice_texts = {}
+    choice_correct = {}
+
+    for op in ops:
+        if not isinstance(op, dict) or op.get("op") != "replace":
+            raise QuizPatchError("Only \"replace\" operations are supported.")
+
+        m = QUIZ_PATCH_PATH.match(str(op.get("path", "")))
+        if not m:
+            raise QuizPatchError(f"Unknown path: {op.get('path')}")
+
+        value = op.get("value")
+        if m.group(1):
+            title = str(value or "").strip() or None
+        elif m.group(4) == "is_correct":
+            if m.group(2) != "choices":
+                raise QuizPatchError(f"Unknown path: {op.get('path')}")
+            if not isinstance(value, bool):
+                raise QuizPatchError(f"{op.get('path')} must be true or false.")
+            choice_correct[int(m.group(3))] = value
+        elif m.group(2) == "questions":
+            question_texts[int(m.group(3))] = str(value or "").strip()
+        else:
+            choice_texts[int(m.group(3))] = str(value or "").strip()
+
+    return title, question_texts, choice_texts, choice_correct
+
+
+def _id_chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), SQL_IN_CHUNK):
+        yield ids[start:start + SQL_IN_CHUNK]
+
+
+def apply_quiz_patch(cur, quiz_id, question_texts, choice_texts, choice_correct):
+    """
+    Write the changes inside the caller's transaction. Every id must
+    belong to quiz_id. Returns (questions changed, choices changed, ids
+    of the questions whose correct answers were edited, ids of all the
+    questions the patch touches).
+    """
+    # Looked up by primary key, so the cost follows the size of the patch
+    # rather than the size of the quiz
+    for chunk in _id_chunks(question_texts):
+        rows = cur.execute(
+            f"SELECT quiz_id FROM questions WHERE id IN ({','.join('?' * len(chunk))})",
+            chunk
+        ).fetchall()
+        if len(rows) != len(chunk) or any(row[0] != quiz_id for row in rows):
+            raise QuizPatchError("Some questions are not part of this quiz.")
+
+    choice_questions = {}
+    for chunk in _id_chunks(set(choice_texts) | set(choice_correct)):
+        rows = cur.execute(
+            f"""
+            SELECT c.id, c.question_id, q.quiz_id
+            FROM choices c
+            JOIN questions q ON q.id = c.question_id
+            WHERE c.id IN ({','.join('?' * len(chunk))})
+            """,
+            chunk
+        ).fetchall()
+        if len(rows) != len(chunk) or any(row[2] != quiz_id for row in rows):
+            raise QuizPatchError("Some answer choices are not part of this quiz.")
+        choice_questions.update((row[0], row[1]) for row in rows)
+
+    cur.executemany(
+        "UPDATE questions SET question_text = ? WHERE id = ? AND question_text IS NOT ?",
+        [(text, qid, text) for qid, text in question_texts.items()]
+    )
+    questions_changed = max(cur.rowcount, 0)
+
+    cur.executemany(
+        "UPDATE choices SET text = ? WHERE id = ? AND text IS NOT ?",
+        [(text, cid, text) for cid, text in choice_texts.items()]
+    )
+    choices_changed = max(cur.rowcount, 0)
+
+    cur.executemany(
+        "UPDATE choices SET is_correct = ? WHERE id = ? AND is_correct IS NOT ?",
+        [(int(flag), cid, int(flag)) for cid, flag in choice_correct.items()]
+    )
+    choices_changed += max(cur.rowcount, 0)
+
+    touched = set(question_texts)
+    touched.update(choice_questions[cid] for cid in choice_texts)
+    touched.update(choice_questions[cid] for cid in choice_correct)
+
+    return (
+        questions_changed,
+        choices_changed,
+        {choice_questions[cid] for cid in choice_correct},
+        touched,
+    )
+
+
+def first_question_without_answer(cur, quiz_id, question_ids=None):
+    """
+    Number of the first question (of question_ids, or of the whole quiz)
+    that has no correct choice, else None. One query per chunk.
+    """
+    sql = """
+        SELECT q.question_number
+        FROM questions q
+        WHERE q.quiz_id = ? {only}
+        AND NOT EXISTS (
+            SELECT 1 FROM choices c WHERE c.question_id = q.id AND c.is_correct = 1
+        )
+        ORDER BY q.question_number
+        LIMIT 1
+    """
+    if question_ids is None:
+        row = cur.execute(sql.format(only=""), (quiz_id,)).fetchone()
+        return row[0] if row else None
+
+    for chunk in _id_chunks(question_ids):
+        row = cur.execute(
+            sql.format(only=f"AND q.id IN ({','.join('?' * len(chunk))})"),
+            (quiz_id, *chunk)
+        ).fetchone()
+        if row:
+            return row[0]
+    return None
+
+
+def update_registry_quiz(quiz_id, title=None, logo=None):
+    registry = load_registry()
+    for q in registry:
+        if q.get("id") == quiz_id:
+            if title:
+                q["title"] = title
+            if logo:
+                q["logo"] = logo
+    save_registry(registry)
+
+
+@app.route("/api/quiz/<int:quiz_id>/questions")
+def api_find_quiz_questions(quiz_id):
+    """
+    Jump-to-question search for the editor: ?find= a question number or
+    text. Returns {"matches": [{"id", "number", "page", "text"}]}, at
+    most EDIT_QUIZ_FIND_LIMIT of them.
+    """
+    query = request.args.get("find", "").strip()
+    if not query:
+        return jsonify({"error": "Nothing to search for."}), 400
+
+    conn = get_db()
+    try:
+        cur = conn.cursor()
+        if cur.execute("SELECT 1 FROM quizzes WHERE id = ?", (quiz_id,)).fetchone() is None:
+            return jsonify({"error": "Quiz not found"}), 404
+
+        if query.isdigit():
+            found = find_quiz_questions(cur, quiz_id, number=int(query))
+        else:
+            found = find_quiz_questions(cur, quiz_id, text=query)
+    finally:
+        conn.close()
+
+    return jsonify({
+        "matches": [
+            {
+                "id": qid,
+                "number": number,
+                "page": page,
+                "text": text if len(text or "") <= 120 else text[:117] + "...",
+            }
+            for qid, number, text, page in found
+        ]
+    })
+
+
+@app.route("/api/quiz/<int:quiz_id>", methods=["PATCH"])
+def api_patch_quiz(quiz_id):
+    """
+    Apply the editor's JSON Patch. Returns {"questions", "choices",
+    "title", "version", "rebuilt": [...], "ms"}; a question left without a correct
+    answer, or an id from another quiz, is a 400 and nothing is saved.
+    """
+    started = time.perf_counter()
+
+    try:
+        title, question_texts, choice_texts, choice_correct = parse_quiz_patch(
+            request.get_json(silent=True)
+        )
+    except QuizPatchError as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = get_db()
+    cur = conn.cursor()
+    try:
+        current = cur.execute("SELECT title FROM quizzes WHERE id = ?", (quiz_id,)).fetchone()
+        if current is None:
+            return jsonify({"error": "Quiz not found"}), 404
+
+        title_changed = title is not None and title != current[0]
+        if title_changed:
+            cur.execute("UPDATE quizzes SET title = ? WHERE id = ?", (title, quiz_id))
+
+        questions_changed, choices_changed, checked, touched = apply_quiz_patch(
+            cur, quiz_id, question_texts, choice_texts, choice_correct
+        )
+
+        missing = first_question_without_answer(cur, quiz_id, checked) if checked else None
+        if missing is not None:
+            conn.rollback()
+            return jsonify({"error": f"Question {missing} must have at least one correct answer."}), 400
+
+        if questions_changed or choices_changed:
+            bump_quiz_version(cur, quiz_id)
+
+        conn.commit()
+    except QuizPatchError as e:
+        conn.rollback()
+        return jsonify({"error": str(e)}), 400
+    finally:
+        conn.close()
+
+    rebuilt = []
+    version = None
+    if questions_changed or choices_changed:
+        version = update_quiz_artifacts(quiz_id, touched)
+        rebuilt.append("json")
+    if title_changed:
+        update_registry_quiz(quiz_id, title=title)
         rebuild_quiz_html_from_registry(quiz_id)
+        rebuilt.append("html")
+
+    return jsonify({
+        "questions": questions_changed,
+        "choices": choices_changed,
+        "title": title_changed,
+        "version": version,
+        "rebuilt": rebuilt,
+        "ms": (time.perf_counter() - started) * 1000,
+    })
+
+
+# =========================
+# EDIT QUIZ - SAVE CHANGES
+# =========================
+EDIT_FORM_FIELD = re.compile(r"^(question|choice)_(\d+)$")
+
+
+@app.route("/edit_quiz/<int:quiz_id>", methods=["POST"])
+def save_edited_quiz(quiz_id):
+    conn = get_db()
+    cur = conn.cursor()
+
+    action = request.form.get("action", "")
+
+    ts = int(time.time())
+
+    quiz_logo = request.files.get("quiz_logo")
+
+    logo_filename = finalize_logo_from_request(
+        app,
+        ts,
+        logo_file=quiz_logo
+    )
+
+    # =========================
+    # SAVE CURRENT FORM VALUES FIRST
+    # =========================
+    # The form holds one editor page; of the fields it posts, only the
+    # ones that differ from the database are written (see apply_quiz_patch)
+    new_title = request.form.get("quiz_title", "").strip()
+
+    title_changed = False
+    if new_title:
+        title_changed = cur.execute(
+            "UPDATE quizzes SET title = ? WHERE id = ? AND title IS NOT ?",
+            (new_title, quiz_id, new_title)
+        ).rowcount > 0
+
+    # The quiz HTML only needs rebuilding for a new title or logo
+    html_changed = title_changed or bool(logo_filename)
+
+    if new_title or logo_filename:
+        update_registry_quiz(quiz_id, title=new_title, logo=logo_filename)
+
+    question_texts = {}
+    choice_texts = {}
+    for key, value in request.form.items():
+        m = EDIT_FORM_FIELD.match(key)
+        if m:
+            target = question_texts if m.group(1) == "question" else choice_texts
+            target[int(m.group(2))] = value.strip()
+
+    try:
+        questions_changed, choices_changed, _, touched = apply_quiz_patch(
+            cur,
+            quiz_id,
+            question_texts,
+            choice_texts,
+            {cid: bool(request.form.get(f"correct_{cid}")) for cid in choice_texts},
+        )
+    except QuizPatchError as e:
+        conn.rollback()
+        conn.close()
+        flash(str(e), "error")
+        return edit_quiz_redirect(quiz_id)
+
+    # =========================
+    # ADD NEW QUESTION
+    # =========================
+    if action == "add_question":
+        row = cur.execute(
+            "SELECT MAX(question_number) FROM questions WHERE quiz_id = ?",
+            (quiz_id,)
+        ).fetchone()
+
+        next_qnum = (row[0] or 0) + 1
+
+        cur.execute(
+            """
+            INSERT INTO questions (quiz_id, question_number, question_text)
+            VALUES (?, ?, ?)
+            """,
+            (quiz_id, next_qnum, "New question")
+        )
+
+        question_id = cur.lastrowid
+
+        for label in ["A", "B", "C", "D"]:
+            cur.execute(
+                """
+                INSERT INTO choices (question_id, label, text, is_correct)
+                VALUES (?, ?, ?, ?)
+                """,
+                (question_id, label, f"Option {label}", 0)
+            )
 
-        return redirect(f"/edit_quiz/{quiz_id}")
+        bump_quiz_version(cur, quiz_id)
+        conn.commit()
+        conn.close()
+
+        update_quiz_artifacts(quiz_id, touched | {question_id}, html=html_changed)
+
+        return redirect(f"/edit_quiz/{quiz_id}?question={next_qnum}#q-{next_qnum}")
 
     # =========================
     # ADD CHOICES TO EXISTING QUESTION
@@ -4354,7 +5000,7 @@ def save_edited_quiz(quiz_id):
             conn.rollback()
             conn.close()
             flash("Invalid question selected for adding choices.", "error")
-            return redirect(f"/edit_quiz/{quiz_id}")
+            return edit_quiz_redirect(quiz_id)
 
         try:
             count = int(request.form.get(f"choice_count_{question_id}", 1))
@@ -4398,51 +5044,38 @@ def save_edited_quiz(quiz_id):
 
             label_index += 1
 
+        bump_quiz_version(cur, quiz_id)
         conn.commit()
         conn.close()
 
-        rebuild_quiz_json_from_db(quiz_id)
-        rebuild_quiz_html_from_registry(quiz_id)
+        update_quiz_artifacts(quiz_id, touched | {question_id}, html=html_changed)
 
-        return redirect(f"/edit_quiz/{quiz_id}")
+        return edit_quiz_redirect(quiz_id)
 
     # =========================
     # VALIDATION: each question must have at least one correct answer
     # =========================
-    questions = cur.execute(
-        """
-        SELECT id, question_number
-        FROM questions
-        WHERE quiz_id = ?
-        ORDER BY question_number
-        """,
-        (quiz_id,)
-    ).fetchall()
+    missing = first_question_without_answer(cur, quiz_id)
 
-    for q in questions:
-        correct_count = cur.execute(
-            """
-            SELECT COUNT(*)
-            FROM choices
-            WHERE question_id = ?
-            AND is_correct = 1
-            """,
-            (q[0],)
-        ).fetchone()[0]
+    if missing is not None:
+        conn.rollback()
+        conn.close()
+        flash(f"Question {missing} must have at least one correct answer.", "error")
+        return edit_quiz_redirect(quiz_id)
 
-        if correct_count == 0:
-            conn.rollback()
-            conn.close()
-            flash(f"Question {q[1]} must have at least one correct answer.", "error")
-            return redirect(url_for("edit_quiz", quiz_id=quiz_id))
+    content_changed = bool(questions_changed or choices_changed)
+    if content_changed:
+        bump_quiz_version(cur, quiz_id)
 
     conn.commit()
     conn.close()
 
-    rebuild_quiz_json_from_db(quiz_id)
-    rebuild_quiz_html_from_registry(quiz_id)
+    if content_changed:
+        update_quiz_artifacts(quiz_id, touched, html=html_changed)
+    elif html_changed:
+        rebuild_quiz_html_from_registry(quiz_id)
 
-    return redirect(f"/edit_quiz/{quiz_id}")
+    return edit_quiz_redirect(quiz_id)
 
 
 
@@ -4474,13 +5107,14 @@ def delete_question_from_quiz(quiz_id, question_id):
             (idx, q["id"])
         )
 
+    # Every later question is renumbered, so the whole JSON is rewritten
+    bump_quiz_version(cur, quiz_id)
     conn.commit()
     conn.close()
 
-    rebuild_quiz_json_from_db(quiz_id)
-    rebuild_quiz_html_from_registry(quiz_id)
+    update_quiz_artifacts(quiz_id)
 
-    return redirect(f"/edit_quiz/{quiz_id}")
+    return edit_quiz_redirect(quiz_id)
 
 
 # =========================
@@ -4534,13 +5168,13 @@ def add_choices_to_question(quiz_id, question_id):
 
         label_index += 1
 
+    bump_quiz_version(cur, quiz_id)
     conn.commit()
     conn.close()
 
-    rebuild_quiz_json_from_db(quiz_id)
-    rebuild_quiz_html_from_registry(quiz_id)
+    update_quiz_artifacts(quiz_id, {question_id})
 
-    return redirect(f"/edit_quiz/{quiz_id}")
+    return edit_quiz_redirect(quiz_id)
 
 
 
@@ -4564,7 +5198,7 @@ def delete_choice_from_question(quiz_id, choice_id):
 
     if not row:
         conn.close()
-        return redirect(f"/edit_quiz/{quiz_id}")
+        return edit_quiz_redirect(quiz_id)
 
     question_id = row[0]
 
@@ -4581,7 +5215,7 @@ def delete_choice_from_question(quiz_id, choice_id):
     if choice_count <= 1:
         conn.close()
         flash("A question must have at least one answer choice.", "error")
-        return redirect(f"/edit_quiz/{quiz_id}")
+        return edit_quiz_redirect(quiz_id)
 
     # Delete the selected choice
     cur.execute(
@@ -4592,13 +5226,13 @@ def delete_choice_from_question(quiz_id, choice_id):
         (choice_id,)
     )
 
+    bump_quiz_version(cur, quiz_id)
     conn.commit()
     conn.close()
 
-    rebuild_quiz_json_from_db(quiz_id)
-    rebuild_quiz_html_from_registry(quiz_id)
+    update_quiz_artifacts(quiz_id, {question_id})
 
-    return redirect(f"/edit_quiz/{quiz_id}")
+    return edit_quiz_redirect(quiz_id)
 
 
 # =========================
@@ -4659,6 +5293,7 @@ def delete_quiz(quiz_id):
         lp = os.path.join(LOGO_FOLDER, logo_file)
         if os.path.exists(lp):
             os.remove(lp)
+        LOGO_INDEX.invalidate()
 
     print("[DELETE] Completed quiz_id:", quiz_id)
     return redirect("/library")
@@ -4763,89 +5398,491 @@ def save_order():
 
 
 # =========================
-# QUIZ DB SAVE HELPER (UPLOAD + PASTE)
+# QUESTION MODEL (compact, slot-based)
 # =========================
-def save_quiz_to_db(quiz_title, source_file, quiz_data, logo_filename=None):
-    conn = get_db()
-    cur = conn.cursor()
+# Parsed, imported and exported questions are QuizQuestion / QuizChoice
+# objects instead of nested dicts: __slots__ drops the per-object dict,
+# and the correct letters are kept as one string ("AC"), which for a
+# single answer is a shared one-character string. Both classes still
+# answer q["question"] / c.get("is_correct") the way the dicts did, so
+# templates and older callers need no change; to_dict() gives the JSON
+# shape written to the quiz files.
+class _QuizRecord:
+    __slots__ = ()
+    _fields = ()
+
+    def __getitem__(self, key):
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self._fields:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self._fields else default
+
+    def keys(self):
+        return self._fields
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class QuizChoice(_QuizRecord):
+    __slots__ = ("label", "text", "is_correct", "id")
+    _fields = ("label", "text", "is_correct")
+
+    def __init__(self, label, text, is_correct=False, id=None):
+        self.label = label
+        self.text = text
+        self.is_correct = is_correct
+        self.id = id
+
+    def to_dict(self):
+        return {"label": self.label, "text": self.text, "is_correct": self.is_correct}
+
+
+class QuizQuestion(_QuizRecord):
+    __slots__ = ("number", "question", "choices", "_correct", "id")
+    _fields = ("number", "question", "choices", "correct")
+
+    def __init__(self, number, question, choices, correct, id=None):
+        self.number = number
+        self.question = question
+        self.choices = choices
+        self.correct = correct
+        self.id = id
+
+    @property
+    def correct(self):
+        return list(self._correct)
+
+    @correct.setter
+    def correct(self, letters):
+        self._correct = "".join(letters)
+
+    def to_dict(self):
+        return {
+            "number": self.number,
+            "question": self.question,
+            "choices": [c.to_dict() for c in self.choices],
+            "correct": list(self._correct),
+        }
 
-    
 
-    # Insert quiz (now stores registry_id too)
-    cur.execute(
-        """
-        INSERT INTO quizzes (title, source_file)
-        VALUES (?, ?)
-        """,
-        (quiz_title, source_file),
-    )
+def question_to_dict(q):
+    return q.to_dict() if isinstance(q, _QuizRecord) else q
 
-    quiz_id = cur.lastrowid  # ✅ CAPTURE DB ID
 
-    # Insert questions + choices
-    for q in quiz_data:
-        question_number = q.get("number")
-        question_text = q.get("question") or q.get("text") or ""
-        q_choices = q.get("choices", [])
+def write_quiz_json(path, questions):
+    """
+    Write questions to a quiz JSON file one question at a time, byte for
+    byte what json.dump([...], f, indent=4) wrote, without building the
+    whole list of dicts (or the whole JSON string) first.
+    """
+    write_quiz_json_blocks(path, map(quiz_json_block, questions))
 
-        cur.execute(
-            """
-            INSERT INTO questions (
-                quiz_id,
-                question_number,
-                question_text
-            )
-            VALUES (?, ?, ?)
-            """,
-            (quiz_id, question_number, question_text),
-        )
 
-        question_id = cur.lastrowid
+def quiz_json_block(q):
+    """
+    One question as it appears in a quiz JSON file (less the first
+    line's indentation).
+    """
+    # Strings are escaped, so every raw newline is indentation
+    return QUIZ_JSON_ENCODE(question_to_dict(q)).replace("\n", "\n    ")
 
-        for c in q_choices:
-            cur.execute(
-                """
-                INSERT INTO choices (question_id, label, text, is_correct)
-                VALUES (?, ?, ?, ?)
-                """,
-                (
-                    question_id,
-                    c.get("label"),
-                    c.get("text"),
-                    1 if c.get("is_correct") else 0,
-                ),
-            )
 
-    conn.commit()
-    conn.close()
+QUIZ_JSON_ENCODE = json.JSONEncoder(indent=4).encode
 
-    return quiz_id  # ✅ REQUIRED FOR REGISTRY + DELETE
 
+def write_quiz_json_blocks(path, blocks):
+    with atomic_write(path) as f:
+        first = True
+        for block in blocks:
+            f.write("[\n    " if first else ",\n    ")
+            f.write(block)
+            first = False
+        f.write("[]" if first else "\n]")
 
 
-# =========================
-# EXPORT ALL QUIZZES
-# =========================
-@app.route("/export/all_quizzes.txt")
-def export_all_quizzes_txt():
-    conn = get_db()
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
+def read_quiz_json_blocks(path):
+    """
+    The question blocks of a quiz JSON file written by write_quiz_json,
+    one string per question, as quiz_json_block returns them. Returns
+    None for a file in any other layout.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
 
-    registry = normalize_quiz_folders(load_registry())
-    registry_by_id = {
-        int(q.get("id")): q
-        for q in registry
-        if q.get("id") is not None
-    }
+    if text == "[]":
+        return []
+    if not (text.startswith("[\n    {\n") and text.endswith("\n    }\n]")):
+        return None
 
-    quizzes = cur.execute(
-        """
-        SELECT id, title, source_file
-        FROM quizzes
-        ORDER BY title COLLATE NOCASE, id
-        """
-    ).fetchall()
+    # Only a question's own braces sit at four spaces of indentation
+    blocks = text[6:-2].split(",\n    {\n")
+    return blocks[:1] + ["{\n" + block for block in blocks[1:]]
+
+
+
+def iter_quiz_questions(cur, quiz_id, offset=0, limit=None):
+    """
+    A quiz's questions from the database as QuizQuestion objects, in
+    question-number order, with one joined query instead of one choices
+    query per question. offset / limit select a page of questions.
+    """
+    if limit is None:
+        rows = cur.execute(
+            """
+            SELECT q.id, q.question_number, q.question_text, c.id, c.label, c.text, c.is_correct
+            FROM questions q
+            LEFT JOIN choices c ON c.question_id = q.id
+            WHERE q.quiz_id = ?
+            ORDER BY q.question_number, q.id, c.label
+            """,
+            (quiz_id,)
+        )
+    else:
+        rows = cur.execute(
+            """
+            SELECT q.id, q.question_number, q.question_text, c.id, c.label, c.text, c.is_correct
+            FROM (
+                SELECT id, question_number, question_text
+                FROM questions
+                WHERE quiz_id = ?
+                ORDER BY question_number, id
+                LIMIT ? OFFSET ?
+            ) q
+            LEFT JOIN choices c ON c.question_id = q.id
+            ORDER BY q.question_number, q.id, c.label
+            """,
+            (quiz_id, limit, offset)
+        )
+
+    question = None
+    for question_id, number, text, choice_id, label, choice_text, is_correct in rows:
+        if question is None or question.id != question_id:
+            if question is not None:
+                yield question
+            question = QuizQuestion(number, text, [], "", id=question_id)
+
+        if label is not None:
+            question.choices.append(QuizChoice(label, choice_text, bool(is_correct), id=choice_id))
+            if is_correct:
+                question._correct += label
+
+    if question is not None:
+        yield question
+
+
+# =========================
+# QUIZ DB SAVE HELPER (UPLOAD + PASTE + IMPORTERS)
+# =========================
+# Questions and choices are written with executemany in batches. Question
+# ids are assigned here (after the AUTOINCREMENT high-water mark, so
+# deleted ids are never reused) so choices can reference them without a
+# round trip per question. Everything is one transaction.
+QUIZ_SAVE_BATCH = 2000
+
+
+def save_quiz_to_db(quiz_title, source_file, quiz_data, logo_filename=None, content_hash=None):
+    conn = get_db()
+    cur = conn.cursor()
+
+    try:
+        # Insert quiz (opens the write transaction)
+        cur.execute(
+            """
+            INSERT INTO quizzes (title, source_file, content_hash)
+            VALUES (?, ?, ?)
+            """,
+            (quiz_title, source_file, content_hash),
+        )
+
+        quiz_id = cur.lastrowid  # ✅ CAPTURE DB ID
+
+        row = cur.execute(
+            """
+            SELECT MAX(
+                COALESCE((SELECT MAX(id) FROM questions), 0),
+                COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'questions'), 0)
+            )
+            """
+        ).fetchone()
+        next_question_id = row[0] + 1
+
+        question_rows = []
+        choice_rows = []
+
+        def flush():
+            cur.executemany(
+                """
+                INSERT INTO questions (id, quiz_id, question_number, question_text)
+                VALUES (?, ?, ?, ?)
+                """,
+                question_rows,
+            )
+            cur.executemany(
+                """
+                INSERT INTO choices (question_id, label, text, is_correct)
+                VALUES (?, ?, ?, ?)
+                """,
+                choice_rows,
+            )
+            question_rows.clear()
+            choice_rows.clear()
+
+        # Insert questions + choices
+        for q in quiz_data:
+            question_id = next_question_id
+            next_question_id += 1
+
+            question_rows.append((
+                question_id,
+                quiz_id,
+                q.get("number"),
+                q.get("question") or q.get("text") or "",
+            ))
+
+            for c in q.get("choices", []):
+                choice_rows.append((
+                    question_id,
+                    c.get("label"),
+                    c.get("text"),
+                    1 if c.get("is_correct") else 0,
+                ))
+
+            if len(question_rows) >= QUIZ_SAVE_BATCH:
+                flush()
+
+        flush()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    return quiz_id  # ✅ REQUIRED FOR REGISTRY + DELETE
+
+
+# =========================
+# CONTENT-ADDRESSED DEDUPE (UPLOAD + PASTE)
+# =========================
+# quizzes.content_hash is a SHA-256 of the normalized import text (BOM,
+# line endings, trailing spaces and blank-line runs do not count) plus the
+# import format. Re-importing the same content is caught with one indexed
+# lookup before anything is parsed or inserted.
+def quiz_content_hash(lines, import_format="text"):
+    """
+    lines is any iterable of text lines (an UploadText, or text.split("\\n")).
+    """
+    digest = hashlib.sha256(f"{import_format}\n".encode("utf-8"))
+    first = True
+    pending_blank = False
+    started = False
+
+    for line in lines:
+        if first:
+            line = line.lstrip("\ufeff")
+            first = False
+
+        line = line.rstrip()
+        if not line:
+            pending_blank = started
+            continue
+
+        if pending_blank:
+            digest.update(b"\n")
+            pending_blank = False
+        digest.update(line.encode("utf-8", "surrogatepass"))
+        digest.update(b"\n")
+        started = True
+
+    return digest.hexdigest()
+
+
+def find_quiz_by_content_hash(content_hash):
+    """
+    Newest quiz imported from the same content, as
+    {"id", "title", "created_at", "html"}, or None.
+    """
+    conn = get_db()
+    try:
+        row = conn.execute(
+            """
+            SELECT id, title, created_at
+            FROM quizzes
+            WHERE content_hash = ?
+            ORDER BY id DESC
+            LIMIT 1
+            """,
+            (content_hash,)
+        ).fetchone()
+    finally:
+        conn.close()
+
+    if row is None:
+        return None
+
+    entry = next((q for q in load_registry() if q.get("id") == row["id"]), {})
+    return {
+        "id": row["id"],
+        "title": row["title"],
+        "created_at": row["created_at"],
+        "html": entry.get("html"),
+    }
+
+
+def refresh_quiz_metadata(quiz_id, title, logo_filename=None):
+    """
+    Update an existing quiz's title (and logo, if given) and rebuild its
+    page. Questions are left untouched.
+    """
+    conn = get_db()
+    try:
+        conn.execute("UPDATE quizzes SET title = ? WHERE id = ?", (title, quiz_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+    registry = load_registry()
+    for q in registry:
+        if q.get("id") == quiz_id:
+            q["title"] = title
+            if logo_filename:
+                q["logo"] = logo_filename
+    save_registry(registry)
+
+    rebuild_quiz_html_from_registry(quiz_id)
+
+
+def render_duplicate_quiz(existing, action, quiz_title, hidden):
+    """
+    "Already imported" page. Re-posts the same import to `action` with
+    on_duplicate=refresh|new plus the `hidden` form fields.
+    """
+    return render_template_string("""
+    <html>
+    <head>
+        <title>Already Imported</title>
+        <link rel="stylesheet" href="/static/style.css">
+        <link rel="icon" href="/static/favicon.ico">
+    </head>
+    <body>
+    <script>
+    fetch("/config/portal.json")
+    .then(r => r.json())
+    .then(cfg => {
+        if (cfg.background_image) {
+            document.documentElement.style.setProperty(
+                "--portal-bg",
+                `url(${cfg.background_image})`
+            );
+        }
+    });
+    </script>
+
+    <div class="container">
+        <h1 class="hero-title">♻️ This Quiz Was Already Imported</h1>
+
+        <div class="card">
+            <p>
+                The same content was imported as <b>{{ existing.title }}</b>
+                {% if existing.created_at %}on {{ existing.created_at }}{% endif %}.
+            </p>
+
+            {% if existing.html %}
+            <button onclick="location.href='/quizzes/{{ existing.html }}'">
+                📖 Open Existing Quiz
+            </button>
+            <br><br>
+            {% endif %}
+
+            <form action="{{ action }}" method="POST">
+                {% for name, value in hidden.items() %}
+                    {% if value and name == "quiz_text" %}
+                    <textarea name="quiz_text" style="display:none">{{ value }}</textarea>
+                    {% elif value %}
+                    <input type="hidden" name="{{ name }}" value="{{ value }}">
+                    {% endif %}
+                {% endfor %}
+
+                <h3>Quiz Display Title</h3>
+                <input type="text" name="quiz_title" value="{{ quiz_title }}"
+                       required style="width:100%;padding:6px">
+
+                <br><br>
+
+                <button type="submit" name="on_duplicate" value="refresh">
+                    🔄 Update Existing Quiz (title / logo only)
+                </button>
+
+                <button type="submit" name="on_duplicate" value="new">
+                    ➕ Import As A New Copy
+                </button>
+            </form>
+
+            <br>
+
+            <button onclick="location.href='/library'">
+                📚 Go To Library
+            </button>
+        </div>
+    </div>
+    </body>
+    </html>
+    """, existing=existing, action=action, quiz_title=quiz_title, hidden=hidden)
+
+
+
+# =========================
+# EXPORT ALL QUIZZES
+# =========================
+def append_question_export_lines(lines, questions):
+    """
+    DLMS text format for the .txt exports: number + question, lettered
+    choices, then the "Correct Answer:" line.
+    """
+    for q in questions:
+        lines.append(f"{q.number}. {q.question or ''}")
+        lines.append("")
+
+        for c in q.choices:
+            lines.append(f"{c.label}. {c.text or ''}")
+
+        lines.append("")
+        lines.append(f"Correct Answer: {', '.join(q.correct)}")
+        lines.append("")
+        lines.append("")
+
+
+@app.route("/export/all_quizzes.txt")
+def export_all_quizzes_txt():
+    conn = get_db()
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+
+    registry = normalize_quiz_folders(load_registry())
+    registry_by_id = {
+        int(q.get("id")): q
+        for q in registry
+        if q.get("id") is not None
+    }
+
+    quizzes = cur.execute(
+        """
+        SELECT id, title, source_file
+        FROM quizzes
+        ORDER BY title COLLATE NOCASE, id
+        """
+    ).fetchall()
 
     lines = []
     exported_on = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -4871,55 +5908,7 @@ def export_all_quizzes_txt():
         lines.append("=" * 60)
         lines.append("")
 
-        questions = cur.execute(
-            """
-            SELECT id, question_number, question_text
-            FROM questions
-            WHERE quiz_id = ?
-            ORDER BY question_number, id
-            """,
-            (quiz_id,)
-        ).fetchall()
-
-        for question in questions:
-            question_id = question["id"]
-            question_number = question["question_number"]
-            question_text = question["question_text"] or ""
-
-            lines.append(f"{question_number}. {question_text}")
-            lines.append("")
-
-            choices = cur.execute(
-                """
-                SELECT label, text, is_correct
-                FROM choices
-                WHERE question_id = ?
-                ORDER BY label
-                """,
-                (question_id,)
-            ).fetchall()
-
-            correct_labels = []
-
-            for choice in choices:
-                label = choice["label"]
-                text = choice["text"] or ""
-                is_correct = bool(choice["is_correct"])
-
-                lines.append(f"{label}. {text}")
-
-                if is_correct:
-                    correct_labels.append(label)
-
-            lines.append("")
-
-            if len(correct_labels) == 1:
-                lines.append(f"Correct Answer: {correct_labels[0]}")
-            else:
-                lines.append(f"Correct Answer: {', '.join(correct_labels)}")
-
-            lines.append("")
-            lines.append("")
+        append_question_export_lines(lines, iter_quiz_questions(cur, quiz_id))
 
         lines.append("")
 
@@ -4985,55 +5974,7 @@ def export_single_quiz_txt(quiz_id):
     lines.append("=" * 60)
     lines.append("")
 
-    questions = cur.execute(
-        """
-        SELECT id, question_number, question_text
-        FROM questions
-        WHERE quiz_id = ?
-        ORDER BY question_number, id
-        """,
-        (quiz_id,)
-    ).fetchall()
-
-    for question in questions:
-        question_id = question["id"]
-        question_number = question["question_number"]
-        question_text = question["question_text"] or ""
-
-        lines.append(f"{question_number}. {question_text}")
-        lines.append("")
-
-        choices = cur.execute(
-            """
-            SELECT label, text, is_correct
-            FROM choices
-            WHERE question_id = ?
-            ORDER BY label
-            """,
-            (question_id,)
-        ).fetchall()
-
-        correct_labels = []
-
-        for choice in choices:
-            label = choice["label"]
-            text = choice["text"] or ""
-            is_correct = bool(choice["is_correct"])
-
-            lines.append(f"{label}. {text}")
-
-            if is_correct:
-                correct_labels.append(label)
-
-        lines.append("")
-
-        if len(correct_labels) == 1:
-            lines.append(f"Correct Answer: {correct_labels[0]}")
-        else:
-            lines.append(f"Correct Answer: {', '.join(correct_labels)}")
-
-        lines.append("")
-        lines.append("")
+    append_question_export_lines(lines, iter_quiz_questions(cur, quiz_id))
 
     conn.close()
 
@@ -5076,11 +6017,14 @@ def quiz_library():
     # =========================
     # DEBUG: Verify logo files exist on disk
     # =========================
-    for q in registry:
-        logo = q.get("logo")
-        if logo:
-            path = os.path.join(LOGO_FOLDER, logo)
-            dprint("[DEBUG] Logo check:", logo, "exists =", os.path.exists(path), "path =", path)
+    # One snapshot of the logo folder serves every quiz on the page
+    logo_names = LOGO_INDEX.names()
+
+    if DEBUG_LOGS:
+        for q in registry:
+            logo = q.get("logo")
+            if logo:
+                dprint("[DEBUG] Logo check:", logo, "exists =", logo in logo_names, "path =", os.path.join(LOGO_FOLDER, logo))
 
     portal_title = get_portal_title()
 
@@ -5107,7 +6051,7 @@ def quiz_library():
         filtered = [q for q in registry if not q.get("hidden", False)]
 
     quizzes = [
-        {**q, "logo": resolve_logo_filename(q.get("logo"))}
+        {**q, "logo": resolve_logo_filename(q.get("logo"), logo_names)}
         for q in filtered
     ]
 
@@ -5883,9 +6827,10 @@ def upload_page():
 
         <div class="card">
 
-            <h2>Option 1 — Upload a Text File</h2>
+            <h2>Option 1 — Upload a Question File</h2>
 <p style="opacity:.8">
-    Use this if you already have a .txt question file.
+    Use this if you already have a .txt question file or a question bank
+    exported from another LMS.
 </p>
 
 <form action="/process" method="POST" enctype="multipart/form-data">
@@ -5897,16 +6842,27 @@ def upload_page():
 
     <br><br>
 
-    <h3>Select Quiz Text File</h3>
+    <h3>Select Quiz File</h3>
     <p style="opacity:.7; font-size:12px">
-        Upload any properly formatted .txt file
+        A properly formatted .txt file, or a CSV, JSON, GIFT, Aiken or
+        Moodle XML question bank (also as .gz, .bz2 or .zip)
     </p>
 
-    <input type="file" name="file" accept=".txt" required>
+    <input type="file" name="file" accept="{{ accept }}" required>
 
     <br><br>
 
-    <h3>Upload Logo (Optional)</h3>
+    <h3>File Format</h3>
+    <select name="import_format">
+        <option value="auto">Detect automatically</option>
+        {% for name, importer in importers.items() %}
+        <option value="{{ name }}">{{ importer.label }}</option>
+        {% endfor %}
+    </select>
+
+    <br><br>
+
+    <h3>Upload Logo (Optional)</h3>
     <input type="file" name="quiz_logo" accept="image/*">
     <p style="opacity:0.7; font-size:12px">
         Supported: PNG / JPG / GIF
@@ -5944,7 +6900,11 @@ def upload_page():
     </div>
     </body>
     </html>
-    """, portal_title=portal_title)
+    """,
+        portal_title=portal_title,
+        importers=QUIZ_IMPORTERS,
+        accept=",".join(import_extensions() + (".gz", ".bz2", ".zip")),
+    )
 
 
 
@@ -6033,9 +6993,17 @@ def paste_page():
                 
 
                 <textarea name="quiz_text"
-                          required
                           style="width:100%; height:400px; padding:10px; font-size:14px;"></textarea>
 
+                <p style="opacity:.75; font-size:12px; margin-top:8px">
+                    …or load the text from a PDF / Word document (repeated page headers and
+                    footers are removed and wrapped lines rejoined):
+                    <input type="file" name="document" accept=".pdf,.docx">
+                </p>
+
+                <!-- Live check: filled by /api/preview/live while typing -->
+                <div id="liveCheck" style="font-size:13px; opacity:.85; margin-top:6px;"></div>
+
                 <br><br>
 
                 <h3>Optional: Remove Unwanted Text Before Parsing</h3>
@@ -6062,6 +7030,7 @@ Practice Only"
                 <div style="display:flex; justify-content:space-between; align-items:center;">
                     <h3 style="margin:0;">Optional: Regex Replace Rules</h3>
 
+                    <div style="display:flex; gap:8px;">
                     <button type="button"
                             onclick="window.open('/static/regex-help.html', '_blank')"
                             title="Fix PDF bullets, wrapped lines, and exam paste issues"
@@ -6076,6 +7045,21 @@ Practice Only"
                         <span style="font-size:16px;">❓</span> Regex Help
                     </button>
 
+                    <button type="button"
+                            onclick="openRuleProfiler(this.form)"
+                            title="Time each rule on your pasted text"
+                            style="
+                                display:flex;
+                                align-items:center;
+                                gap:6px;
+                                font-size:13px;
+                                padding:4px 10px;
+                                cursor:pointer;
+                            ">
+                        <span style="font-size:16px;">⏱</span> Profile Rules
+                    </button>
+                    </div>
+
 
                 </div>
 
@@ -6118,6 +7102,14 @@ Question\\s*#\\d+ => "
                     Try to remove page headers / footers
                 </label>
 
+                <button type="button"
+                        onclick="autoTunePresets(this.form, this)"
+                        title="Try every preset combination on your pasted text and tick the one that parses best"
+                        style="margin-top:8px; font-size:13px; padding:4px 10px; cursor:pointer;">
+                    🎯 Auto-detect Best Cleanup
+                </button>
+                <div id="autotuneResult" style="font-size:12px; margin-top:6px;"></div>
+
                 <br><br>
                 {% endif %}
 
@@ -6138,6 +7130,175 @@ Question\\s*#\\d+ => "
         </div>
 
     </div>
+
+    <script>
+    // Hands the pasted text and rules to the profiler on the regex help page
+    const PROFILE_HANDOFF_CHARS = 1000000;
+
+    function openRuleProfiler(form) {
+        try {
+            localStorage.setItem("dlms_regex_profile", JSON.stringify({
+                text: form.elements["quiz_text"].value.slice(0, PROFILE_HANDOFF_CHARS),
+                strip_text: form.elements["strip_text"].value,
+                replace_rules: form.elements["replace_rules"].value
+            }));
+        } catch (err) {
+            // Storage full or disabled: open the profiler empty
+        }
+        window.open('/static/regex-help.html#profiler', '_blank');
+    }
+
+    // Scores every preset combination on the pasted text and ticks the best
+    const PRESET_NAMES = {
+        preset_number_prefix: "Number prefixes",
+        preset_pdf_spacing: "PDF wrapping",
+        preset_headers: "Headers / footers"
+    };
+
+    async function autoTunePresets(form, button) {
+        const box = document.getElementById("autotuneResult");
+        box.textContent = "Trying every preset combination…";
+        button.disabled = true;
+
+        try {
+            const res = await fetch("/api/cleanup/autotune", {
+                method: "POST",
+                headers: {"Content-Type": "application/json"},
+                body: JSON.stringify({
+                    text: form.elements["quiz_text"].value,
+                    strip_text: form.elements["strip_text"].value,
+                    replace_rules: form.elements["replace_rules"].value
+                })
+            }).then(r => r.json());
+
+            if (res.error) {
+                box.textContent = res.error;
+                return;
+            }
+
+            Object.keys(PRESET_NAMES).forEach(name => {
+                form.elements[name].checked = res.best.includes(name);
+            });
+            form.dispatchEvent(new Event("change"));
+
+            box.textContent = "";
+            const summary = document.createElement("div");
+            const best = res.candidates[0];
+            summary.textContent = "Best: " +
+                (best.presets.map(n => PRESET_NAMES[n]).join(" + ") || "no presets") +
+                " (" + best.questions + " questions, ✅ " + best.high + " ⚠ " + best.medium +
+                " ❌ " + best.low + ")" +
+                (res.sample_chars < res.text_chars ? " on a sample of " + res.sample_chars + " characters" : "") +
+                ", " + res.seconds.toFixed(1) + "s.";
+            box.appendChild(summary);
+
+            const table = document.createElement("table");
+            table.style.cssText = "border-collapse:collapse; margin-top:4px;";
+            res.candidates.forEach((c, i) => {
+                const row = table.insertRow();
+                [c.presets.map(n => PRESET_NAMES[n]).join(" + ") || "none",
+                 c.questions + " q", "✅ " + c.high, "⚠ " + c.medium, "❌ " + c.low].forEach(value => {
+                    const cell = row.insertCell();
+                    cell.textContent = value;
+                    cell.style.padding = "1px 8px 1px 0";
+                    if (i === 0) cell.style.fontWeight = "bold";
+                });
+            });
+            box.appendChild(table);
+        } catch (err) {
+            box.textContent = "Auto-detect failed.";
+        } finally {
+            button.disabled = false;
+        }
+    }
+
+    // Live parse check: only blocks the server has not seen are re-processed,
+    // and only results this page does not hold yet are sent back.
+    (function () {
+        const form = document.querySelector('form[action="/preview_paste"]');
+        const box = document.getElementById("liveCheck");
+        const known = {};
+        let timer = null, busy = false, again = false;
+
+        function field(name) {
+            const el = form.elements[name];
+            return el ? el.value : "";
+        }
+
+        function presets() {
+            return ["preset_number_prefix", "preset_pdf_spacing", "preset_headers"]
+                .filter(n => form.elements[n] && form.elements[n].checked);
+        }
+
+        function esc(text) {
+            const d = document.createElement("div");
+            d.textContent = text;
+            return d.innerHTML;
+        }
+
+        function render(res) {
+            const t = res.totals;
+            let html = "<b>Live check:</b> " + res.order.length + " blocks · " +
+                t.questions + " questions parsed · ✅ " + t.high +
+                " ⚠ " + t.medium + " ❌ " + t.low;
+
+            const weak = [];
+            res.order.forEach((key, i) => {
+                (known[key] ? known[key].confidence : []).forEach(c => {
+                    if (c.confidence !== "high" && weak.length < 10) {
+                        weak.push("<li>Block " + (i + 1) + ": " + esc(c.title) +
+                                  " <span style='opacity:.6'>(" + esc(c.reason) + ")</span></li>");
+                    }
+                });
+            });
+            if (weak.length) {
+                html += "<ul style='margin:4px 0 0 0;'>" + weak.join("") + "</ul>";
+            }
+            box.innerHTML = html;
+        }
+
+        async function run() {
+            if (busy) { again = true; return; }
+            busy = true;
+
+            try {
+                if (!field("quiz_text").trim()) {
+                    box.innerHTML = "";
+                } else {
+                    const res = await fetch("/api/preview/live", {
+                        method: "POST",
+                        headers: {"Content-Type": "application/json"},
+                        body: JSON.stringify({
+                            text: field("quiz_text"),
+                            strip_text: field("strip_text"),
+                            replace_rules: field("replace_rules"),
+                            presets: presets(),
+                            known: Object.keys(known)
+                        })
+                    }).then(r => r.json());
+
+                    Object.assign(known, res.blocks);
+                    const current = new Set(res.order);
+                    Object.keys(known).forEach(k => { if (!current.has(k)) delete known[k]; });
+                    render(res);
+                }
+            } catch (e) {
+                box.innerHTML = "";
+            }
+
+            busy = false;
+            if (again) { again = false; run(); }
+        }
+
+        function schedule() {
+            clearTimeout(timer);
+            timer = setTimeout(run, 600);
+        }
+
+        form.addEventListener("input", schedule);
+        form.addEventListener("change", schedule);
+    })();
+    </script>
     </body>
     </html>
     """, portal_title=portal_title, cfg=cfg)
@@ -6544,11 +7705,7 @@ def save_short_quiz():
             if is_correct:
                 correct_letters.append(label)
 
-            choices.append({
-                "label": label,
-                "text": choice_text,
-                "is_correct": is_correct
-            })
+            choices.append(QuizChoice(label, choice_text, is_correct))
 
         if not choices:
             flash(f"Question {qnum} must have at least one answer choice.", "error")
@@ -6558,12 +7715,7 @@ def save_short_quiz():
             flash(f"Question {qnum} must have at least one correct answer.", "error")
             return redirect("/create_short_quiz")
 
-        quiz_data.append({
-            "number": len(quiz_data) + 1,
-            "question": question_text,
-            "choices": choices,
-            "correct": correct_letters
-        })
+        quiz_data.append(QuizQuestion(len(quiz_data) + 1, question_text, choices, correct_letters))
 
     if not quiz_data:
         flash("You must enter at least one question.", "error")
@@ -6586,8 +7738,7 @@ def save_short_quiz():
     html_path = os.path.join(QUIZ_FOLDER, html_name)
 
     # Save JSON file
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(quiz_data, f, indent=4)
+    write_quiz_json(json_path, quiz_data)
 
     # Save quiz into DB using existing helper
     quiz_id = save_quiz_to_db(
@@ -6624,21 +7775,117 @@ def save_short_quiz():
 
 
 
+# =========================================================
+# DOCUMENT PROFILER (one pass, feeds every suggestion)
+# =========================================================
+from collections import Counter
+
+PROFILE_NUMBERED_LINE = re.compile(r"\s*\d+\.(?=\s|$)")
+PROFILE_PAGE_MARKER = re.compile(r"Page\s+\d+")
+PROFILE_ANSWER_MARKER = re.compile(r"(Correct\s*Answer[s]?|Suggested\s*Answer[s]?)", re.IGNORECASE)
+
+INVISIBLE_CHARS = {
+    "\uFEFF": "BOM",
+    "\u200B": "Zero-Width Space",
+    "\u200C": "Zero-Width Non-Joiner",
+    "\u200D": "Zero-Width Joiner",
+    "\u2060": "Word Joiner",
+}
+PROFILE_INVISIBLE = re.compile("[" + "".join(INVISIBLE_CHARS) + "]")
+
+# A line seen this often is treated as a page header/footer
+PROFILE_REPEAT_THRESHOLD = 3
+
+
+def profile_document(text):
+    """
+    Walk the lines of text once and count what the suggestion rules look
+    for. Runs in linear time however many lines repeat.
+
+        lines / blank_lines
+        numbered_lines   lines starting "1." / "22."
+        soft_breaks      line breaks not after . ! ? (next line not blank)
+        sentence_breaks  breaks not after . ! ? : followed by a letter
+        hyphen_wraps     lines ending in "-" that continue on the next line
+        page_markers     lines containing "Page <n>"
+        copyright_lines  lines containing "copyright" (any case)
+        answer_markers   "Correct Answer" / "Suggested Answer" occurrences
+        repeated_lines   {line: count} for lines seen PROFILE_REPEAT_THRESHOLD+ times
+        invisible        {label: count} of BOM / zero-width characters
+    """
+    counts = Counter()
+    line_counts = Counter()
+
+    lines = (text or "").split("\n")
+    last = len(lines) - 1
+    pending_break = False   # previous line did not end a sentence
+
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        tail = line[-1:] if line else ""
+
+        if not stripped:
+            counts["blank_lines"] += 1
+            pending_break = True
+        else:
+            line_counts[stripped] += 1
+
+            if pending_break and stripped[0].isascii() and stripped[0].isalpha():
+                counts["sentence_breaks"] += 1
+            pending_break = tail not in ".!?:"
+
+            m = PROFILE_NUMBERED_LINE.match(line)
+            # "1." needs whitespace after it; the line break counts
+            if m and (m.end() < len(line) or i < last):
+                counts["numbered_lines"] += 1
+            if "Page" in line and PROFILE_PAGE_MARKER.search(line):
+                counts["page_markers"] += 1
+
+            lower = line.lower()
+            if "copyright" in lower:
+                counts["copyright_lines"] += 1
+            if "answer" in lower:
+                counts["answer_markers"] += len(PROFILE_ANSWER_MARKER.findall(line))
+
+        if i < last:
+            if (not tail or tail not in ".!?") and (lines[i + 1] or i + 1 == last):
+                counts["soft_breaks"] += 1
+            if stripped.endswith("-"):
+                counts["hyphen_wraps"] += 1
+
+    counts["lines"] = len(lines)
+
+    profile = {key: counts[key] for key in (
+        "lines", "blank_lines", "numbered_lines", "soft_breaks", "sentence_breaks",
+        "hyphen_wraps", "page_markers", "copyright_lines", "answer_markers",
+    )}
+    profile["repeated_lines"] = {
+        line: n for line, n in line_counts.items() if n >= PROFILE_REPEAT_THRESHOLD
+    }
+    profile["invisible"] = {
+        INVISIBLE_CHARS[ch]: n for ch, n in Counter(PROFILE_INVISIBLE.findall(text or "")).items()
+    }
+
+    return profile
+
+
 # =========================================================
 # SMART SUGGESTIONS ENGINE — FINAL CONSOLIDATED
 # =========================================================
-def build_smart_suggestions(original_text, cleaned_text):
+def build_smart_suggestions(original_text, cleaned_text, original_profile=None, cleaned_profile=None):
     suggestions = []
-    import re
 
     # Normalize safely
     o = (original_text or "").strip()
     c = (cleaned_text or "").strip()
 
+    po = original_profile or profile_document(o)
+    pc = cleaned_profile or profile_document(c)
+
     # ---------------------------------------
     # 1️⃣ Detect numbered prefixes
     # ---------------------------------------
-    if re.search(r"^\s*\d+\.\s+", o, re.MULTILINE):
+    if po["numbered_lines"]:
         suggestions.append({
             "title": "Numbered Questions Detected",
             "detail": "Questions appear to start with numbers like '1. 2. 3.'.",
@@ -6648,17 +7895,8 @@ def build_smart_suggestions(original_text, cleaned_text):
     # ---------------------------------------
     # 2️⃣ PDF WRAP — warn ONLY if CLEANED TEXT still broken
     # ---------------------------------------
-    pdf_wrap_detected = False
-
-    # hyphen wrap still present
-    if re.search(r"-\s*\n\s*", c):
-        pdf_wrap_detected = True
-
-    # mid-sentence linebreak still present
-    elif re.search(r"(?<![.!?:])\s*\n\s*[A-Za-z]", c):
-        pdf_wrap_detected = True
-
-    if pdf_wrap_detected:
+    # hyphen wrap or mid-sentence linebreak still present
+    if pc["hyphen_wraps"] or pc["sentence_breaks"]:
         suggestions.append({
             "title": "Possible PDF Wrap Detected",
             "detail": "Lines appear split mid-sentence.",
@@ -6668,10 +7906,7 @@ def build_smart_suggestions(original_text, cleaned_text):
     # ---------------------------------------
     # 3️⃣ HEADER / FOOTER repetition detector
     # ---------------------------------------
-    lines = [l.strip() for l in o.splitlines() if l.strip()]
-    repeats = [l for l in set(lines) if lines.count(l) >= 3]
-
-    if repeats:
+    if po["repeated_lines"]:
         suggestions.append({
             "title": "Repeated Header/Footer Detected",
             "detail": "Document contains repeating page headers or footers.",
@@ -6681,17 +7916,7 @@ def build_smart_suggestions(original_text, cleaned_text):
     # ---------------------------------------
     # 4️⃣ MULTIPLE QUESTION COLLAPSE DETECTOR
     # ---------------------------------------
-    answer_markers_pattern = re.compile(
-        r"(Correct\s*Answer[s]?|Suggested\s*Answer[s]?)",
-        re.IGNORECASE
-    )
-
-    total_markers = (
-        len(answer_markers_pattern.findall(o)) +
-        len(answer_markers_pattern.findall(c))
-    )
-
-    if total_markers >= 2:
+    if po["answer_markers"] + pc["answer_markers"] >= 2:
         suggestions.append({
             "title": "Multiple Questions Detected in a Single Block",
             "detail": (
@@ -6708,9 +7933,7 @@ def build_smart_suggestions(original_text, cleaned_text):
     # ---------------------------------------
     # 5️⃣ BOM / Unicode trouble detector
     # ---------------------------------------
-    trouble_chars = ["\uFEFF", "\u200B", "\u200C", "\u200D", "\u2060"]
-
-    if any(t in o for t in trouble_chars):
+    if po["invisible"]:
         suggestions.append({
             "title": "Hidden Unicode Characters Present",
             "detail": "Detected BOM or zero-width Unicode in source text.",
@@ -6734,1007 +7957,3987 @@ def build_smart_suggestions(original_text, cleaned_text):
 # 12A – STRUCTURAL VALIDATION
 # =============================
 def quick_structural_scan(text):
-    lines = [l.strip() for l in text.splitlines() if l.strip()]
-    
-    issues = []
-    question_blocks = 0
-    current_block_has_answer = False
-    current_block_has_correct = False
+    """
+    Question count and structural issues, from the same pass as the
+    parser and the confidence check (see analyze_quiz_text).
+    """
+    result = analyze_quiz_text(text)
+    return {
+        "question_blocks": result["question_blocks"],
+        "issues": result["issues"]
+    }
 
-    for line in lines:
-        
-        # Detect likely question
-        if re.match(r"^\d+[\).\-]?\s", line) or line.lower().startswith("question"):
-            question_blocks += 1
 
-            # if previous question existed but had no answer
-            if not current_block_has_answer and question_blocks > 1:
-                issues.append("A question appears without any A/B/C/D answer choices.")
 
-            current_block_has_answer = False
-            current_block_has_correct = False
-        
-        # Detect answer choices (A–Z supported)
-        if re.match(r"^[A-Za-z][\).\-]?\s", line):
-            current_block_has_answer = True
 
-        
-        # Detect correct answer
-        if "correct answer" in line.lower():
-            current_block_has_correct = True
 
-    # Final block sanity check
-    if question_blocks == 0:
-        issues.append("No recognizable questions were detected.")
+# =========================
+# CLEANUP RULE ENGINE (strip / replace / presets)
+# =========================
+# Rule sets are compiled once and cached by a hash of the rule text, so
+# re-previewing with the same rules costs nothing to set up. Strip rules
+# become a single alternation matcher; replace rules and presets run as
+# one ordered list of precompiled substitutions.
+import hashlib
+import threading
+from collections import OrderedDict
 
-    if question_blocks > 0 and not current_block_has_answer:
-        issues.append("Last detected question has no answer choices.")
+CLEANUP_RULE_CACHE_SIZE = 128
+_cleanup_rule_cache = OrderedDict()
+_cleanup_rule_lock = threading.Lock()
 
-    if question_blocks > 0 and not current_block_has_correct:
-        issues.append("No 'Correct Answer' lines were found — quiz may fail to grade.")
+# Backreferences and inline global flags change meaning (or fail) once a
+# regex is folded into a larger alternation; such rule sets are matched
+# one pattern at a time instead.
+_UNCOMBINABLE_REGEX = re.compile(r"\\\d|\(\?P=|\(\?[aiLmsux]+\)")
 
-    return {
-        "question_blocks": question_blocks,
-        "issues": issues
-    }
+# Escapes that never stand for a cased character
+_CASELESS_ESCAPES = re.compile(r"\\[dDsSwWbBAZtnrfv]|\\[^A-Za-z0-9]")
 
 
+def cleanup_regex_flags(pattern, flags=re.MULTILINE):
+    """
+    Cleanup rules are case-insensitive, but re.IGNORECASE makes every scan
+    several times slower. Patterns without any cased characters (only
+    whitespace, digits, punctuation and class escapes) match the same
+    text without it.
+    """
+    bare = _CASELESS_ESCAPES.sub("", pattern)
+    if any(c.lower() != c.upper() for c in bare):
+        flags |= re.IGNORECASE
+    return flags
+
+
+# (pattern, replacement, label, flags). Flags are spelled out because the
+# presets are written so they do not need re.IGNORECASE.
+CLEANUP_PRESETS = {
+    "preset_number_prefix": [
+        (r"^\s*\d+\.\s*", "", "Removed numbered prefixes", re.MULTILINE),
+    ],
+    "preset_headers": [
+        (r"^\s*(Page\s+\d+.*|Copyright.*|All\s+Rights\s+Reserved.*)$", "", "Removed header/footer text",
+         re.IGNORECASE | re.MULTILINE),
+    ],
+    "preset_pdf_spacing": [
+        (r"-\s*\n\s*", "", "Fixed PDF hyphen wraps", re.MULTILINE),
+        # SUPER SAFE PDF WRAP JOIN
+        # Will NOT join across question boundaries.
+        # Same matches as (?<=[a-z,;])\n(?=\s*[a-z]) under IGNORECASE, but
+        # starting on the newline lets the scanner skip straight to it.
+        (r"\n(?<=[a-zA-Z\u0130\u0131\u017f\u212a,;]\n)(?=\s*[a-zA-Z\u0130\u0131\u017f\u212a])",
+         " ", "Joined wrapped lines safely", re.MULTILINE),
+    ],
+}
 
+# Presets always run in this order: number prefixes, headers/footers, PDF wraps
+CLEANUP_PRESET_ORDER = ("preset_number_prefix", "preset_headers", "preset_pdf_spacing")
 
+_COMPILED_PRESETS = {
+    name: [
+        (re.compile(pattern, flags), replacement, label)
+        for pattern, replacement, label, flags in steps
+    ]
+    for name, steps in CLEANUP_PRESETS.items()
+}
 
-# =========================
-# PREVIEW CLEAN TEXT BEFORE PARSE
-# =========================
-@app.route("/preview_paste", methods=["POST"])
-def preview_paste():
-    #cleanup_temp_logos()   # 🧹 optional cleanup (leave commented)
 
-    quiz_text = request.form.get("quiz_text", "").strip()
-    quiz_title = request.form.get("quiz_title", "Generated Quiz From Paste")
-    strip_rules_raw = request.form.get("strip_text", "").strip()
+# Fixed post-cleanup passes of preview_paste
+# "Correct Answer:" / "Suggested Answer:" lines followed directly by text
+PREVIEW_ANSWER_SPLIT = re.compile(
+    r"((?:Correct|Suggested)\s*Answer[s]?:.*?\n)(?=\S)",
+    re.IGNORECASE
+)
+PREVIEW_CHOICE_LINE_FIX = re.compile(r"\s+(?=([A-Z]\.\s))")
+PREVIEW_BLANK_RUNS = re.compile(r"\n{3,}")
 
-    # =========================
-    # HANDLE LOGO PREVIEW (TEMP ONLY)
-    # =========================
-    preview_logo_name = save_preview_logo(
-        app,
-        request.files.get("quiz_logo")
-    )
 
+def _cached_rules(kind, raw, build):
+    key = (kind, hashlib.sha1(raw.encode("utf-8")).hexdigest())
 
+    with _cleanup_rule_lock:
+        if key in _cleanup_rule_cache:
+            _cleanup_rule_cache.move_to_end(key)
+            return _cleanup_rule_cache[key]
 
+    compiled = build(raw)
 
+    with _cleanup_rule_lock:
+        _cleanup_rule_cache[key] = compiled
+        while len(_cleanup_rule_cache) > CLEANUP_RULE_CACHE_SIZE:
+            _cleanup_rule_cache.popitem(last=False)
 
-    if not quiz_text:
-        return "No text provided.", 400
+    return compiled
 
-    # Start with raw text
-    clean_text = quiz_text
 
-    # Normalize ALL newline styles (Windows, Linux, literal \n)
-    clean_text = (
-        clean_text
-        .replace("\\r\\n", "\n")
-        .replace("\\n", "\n")
-        .replace("\r\n", "\n")
-        .replace("\r", "\n")
-    )
+def _build_strip_matcher(rules, regex_mode):
+    """
+    Return (matchers, lowered) for a list of strip rules.
 
-    # =========================
-    # APPLY STRIP RULES (optional regex mode)
-    # =========================
-    strip_rules = []
-    if strip_rules_raw:
-        strip_rules = [r.strip() for r in strip_rules_raw.splitlines() if r.strip()]
+    Plain rules are case-insensitive substrings that never contain a
+    newline, so one alternation of the lowercased rules scans the lowercased
+    text in a single pass (lowered=True). Regex rules keep their per-line
+    semantics; invalid ones are ignored as before.
+    """
+    if not regex_mode:
+        lowered = sorted({r.lower() for r in rules}, key=len, reverse=True)
+        return [re.compile("|".join(re.escape(r) for r in lowered))], True
 
-    cfg = load_portal_config()
-    regex_mode = cfg.get("enable_regex_strip", False)
-    regex_replace_enabled = cfg.get("enable_regex_replace", False)
-    
-    if strip_rules:
-        cleaned_lines = []
+    valid = []
+    for rule in rules:
+        try:
+            re.compile(rule, re.IGNORECASE)
+        except re.error:
+            continue
+        valid.append(rule)
 
-        for line in clean_text.splitlines():
-            test = line
-            remove = False
+    if not valid:
+        return [], False
 
-            for rule in strip_rules:
+    if not any(_UNCOMBINABLE_REGEX.search(r) for r in valid):
+        combined = "|".join(f"(?:{r})" for r in valid)
+        try:
+            return [re.compile(combined, cleanup_regex_flags(combined, 0))], False
+        except re.error:
+            pass
 
-                # --- REGEX MODE ---
-                if regex_mode:
-                    try:
-                        if re.search(rule, test, re.IGNORECASE):
-                            remove = True
-                            break
-                    except re.error:
-                        # Ignore bad regex patterns
-                        pass
+    return [re.compile(r, cleanup_regex_flags(r, 0)) for r in valid], False
 
-                # --- PLAIN TEXT MODE ---
-                else:
-                    if rule.lower() in test.lower():
-                        remove = True
-                        break
 
-            if not remove:
-                cleaned_lines.append(line)
+def compile_strip_rules(strip_rules_raw, regex_mode):
+    rules = [r.strip() for r in (strip_rules_raw or "").splitlines() if r.strip()]
+    if not rules:
+        return [], False
+    return _cached_rules(
+        "strip-regex" if regex_mode else "strip-plain",
+        "\n".join(rules),
+        lambda _raw: _build_strip_matcher(rules, regex_mode)
+    )
 
-        clean_text = "\n".join(cleaned_lines)
 
-    # =========================
-    # REGEX REPLACE ENGINE
-    # =========================
-    regex_replace_enabled = cfg.get("enable_regex_replace", False)
+def _drop_matching_lines(text, matcher, haystack):
+    """
+    Remove every line of text where matcher finds a match in haystack
+    (text itself, or a lowercased copy with identical offsets).
+    """
+    kept = []
+    pos = 0
 
-    replace_rules_raw = request.form.get("replace_rules", "").strip()
-    applied_rules = []
+    for m in matcher.finditer(haystack):
+        if m.start() < pos:
+            continue  # line already removed
 
-    # -------------------------
-    # MANUAL USER REGEX RULES
-    # -------------------------
-    if regex_replace_enabled and replace_rules_raw:
-        for line in replace_rules_raw.splitlines():
-            line = line.strip()
-            if "=>" not in line:
-                continue
+        start = text.rfind("\n", 0, m.start()) + 1
+        end = text.find("\n", m.end())
 
-            pattern, replacement = line.split("=>", 1)
-            pattern = pattern.strip()
-            replacement = replacement.strip()
+        kept.append(text[pos:start])
 
-            if not pattern:
-                continue
+        if end == -1:
+            # Last line removed: drop the newline that preceded it
+            result = "".join(kept)
+            return result[:-1] if result.endswith("\n") else result
 
-            try:
-                new_text = re.sub(
-                    pattern,
-                    replacement,
-                    clean_text,
-                    flags=re.IGNORECASE | re.MULTILINE
-                )
+        pos = end + 1
 
-                if new_text != clean_text:
-                    applied_rules.append(pattern)
+    if pos == 0:
+        return text
 
-                clean_text = new_text
+    kept.append(text[pos:])
+    return "".join(kept)
 
-            except re.error:
-                applied_rules.append(f"[INVALID REGEX] {pattern}")
 
-    # =========================================================
-    # REGEX PRESETS (state preserved for the template)
-    # =========================================================
-    preset_number_prefix_checked = bool(request.form.get("preset_number_prefix"))
-    preset_pdf_spacing_checked = bool(request.form.get("preset_pdf_spacing"))
-    preset_headers_checked = bool(request.form.get("preset_headers"))
+def apply_strip_rules(text, strip_rules_raw, regex_mode):
+    matchers, lowered = compile_strip_rules(strip_rules_raw, regex_mode)
+    if not matchers:
+        return text
 
-    if regex_replace_enabled:
-        preset_patterns = []
+    if lowered:
+        haystack = text.lower()
+        if len(haystack) == len(text):
+            return _drop_matching_lines(text, matchers[0], haystack)
+        # A few characters lowercase to two; offsets would drift
+        matcher = re.compile(matchers[0].pattern, re.IGNORECASE)
+        return _drop_matching_lines(text, matcher, text)
 
-    # 1️⃣ Remove numbered prefixes FIRST
-    if preset_number_prefix_checked:
-        preset_patterns.append((
-            r"^\s*\d+\.\s*",
-            "",
-            "Removed numbered prefixes"
-        ))
+    if len(matchers) == 1:
+        search = matchers[0].search
+        return "\n".join(line for line in text.split("\n") if not search(line))
 
-    # 2️⃣ REMOVE HEADERS / FOOTERS SECOND
-    if preset_headers_checked:
-        preset_patterns.append((
-            r"^\s*(Page\s+\d+.*|Copyright.*|All\s+Rights\s+Reserved.*)$",
-            "",
-            "Removed header/footer text"
-        ))
+    searches = [m.search for m in matchers]
+    return "\n".join(
+        line for line in text.split("\n")
+        if not any(search(line) for search in searches)
+    )
 
-    # 2️⃣ Fix PDF / Microsoft wrapped lines + hyphenation
-    if preset_pdf_spacing_checked:
-        preset_patterns.append((
-            r"-\s*\n\s*",
-            "",
-            "Fixed PDF hyphen wraps"
-        ))
 
-        # SUPER SAFE PDF WRAP JOIN
-        # Will NOT join across question boundaries
-        preset_patterns.append((
-            r"(?<=[a-z,;])\n(?=\s*[a-z])",
-            " ",
-            "Joined wrapped lines safely"
-        ))
+def _build_replace_steps(replace_rules_raw):
+    steps = []
+    for line in replace_rules_raw.splitlines():
+        line = line.strip()
+        if "=>" not in line:
+            continue
 
+        pattern, replacement = line.split("=>", 1)
+        pattern = pattern.strip()
+        replacement = replacement.strip()
 
+        if not pattern:
+            continue
 
+        try:
+            compiled = re.compile(pattern, cleanup_regex_flags(pattern))
+        except re.error:
+            steps.append((None, replacement, f"[INVALID REGEX] {pattern}"))
+            continue
 
+        steps.append((compiled, replacement, pattern))
 
-        # ---------- APPLY PRESETS ----------
-        for pattern, replacement, label in preset_patterns:
-            try:
-                new_text = re.sub(
-                    pattern,
-                    replacement,
-                    clean_text,
-                    flags=re.IGNORECASE | re.MULTILINE
-                )
+    return steps
 
-                if new_text != clean_text:
-                    applied_rules.append(label)
 
-                clean_text = new_text
+def build_cleanup_pipeline(replace_rules_raw, presets):
+    """
+    Ordered substitution steps: user replace rules first, then the
+    enabled presets. Each step is (compiled or None, replacement, label).
+    """
+    steps = []
+    if replace_rules_raw:
+        steps.extend(_cached_rules("replace", replace_rules_raw, _build_replace_steps))
 
-            except re.error:
-                applied_rules.append(f"[INVALID PRESET REGEX] {pattern}")
+    for name in CLEANUP_PRESET_ORDER:
+        if name in presets:
+            steps.extend(_COMPILED_PRESETS[name])
 
-    # =========================
-    # AUTO MULTI-QUESTION SPLIT FIX
-    # =========================
-    safe_split_pattern = re.compile(
-        r"(Correct\s*Answer[s]?:.*?\n)(?=\S)",
-        re.IGNORECASE
-    )
+    return steps
 
-    # Also support Suggested Answer
-    safe_split_pattern_2 = re.compile(
-        r"(Suggested\s*Answer[s]?:.*?\n)(?=\S)",
-        re.IGNORECASE
-    )
 
-    new_text = clean_text
+def run_cleanup_pipeline(text, steps):
+    """
+    Apply steps in order. Returns (text, applied_labels); a label is
+    reported when its step actually changed the text.
+    """
+    applied = []
 
-    new_text = safe_split_pattern.sub(r"\1\n", new_text)
-    new_text = safe_split_pattern_2.sub(r"\1\n", new_text)
+    for compiled, replacement, label in steps:
+        if compiled is None:
+            applied.append(label)
+            continue
 
-    if new_text != clean_text:
-        applied_rules.append("Auto Question Splitter")
-        clean_text = new_text
+        try:
+            new_text, count = compiled.subn(replacement, text)
+        except (re.error, IndexError):
+            # Bad group reference in the replacement string
+            applied.append(f"[INVALID REGEX] {label}")
+            continue
 
-    # =========================
-    # FORCE MCQ OPTIONS ON CLEAN LINES
-    # =========================
-    # 1️⃣ Ensure every choice letter starts a new line
-    choice_line_fix = re.compile(
-        r"\s+(?=([A-Z]\.\s))"
-    )
+        if count and new_text != text:
+            applied.append(label)
+            text = new_text
 
-    new_text = clean_text
-    new_text = choice_line_fix.sub(r"\n", new_text)
+    return text, applied
 
-    # 2️⃣ Remove accidental double newlines caused by above
-    new_text = re.sub(r"\n{3,}", "\n\n", new_text)
 
-    if new_text != clean_text:
-        applied_rules.append("Normalized MCQ Choices")
-        clean_text = new_text
+# =========================
+# USER REGEX SANDBOX
+# =========================
+# re cannot be interrupted, so one catastrophically backtracking user rule
+# such as "(a+)+$" would pin a request thread (and its CPU) indefinitely.
+# User strip/replace regexes therefore run in a helper process that reports
+# after every rule; a rule that misses its deadline gets the process
+# killed and is reported in applied_rules. It is then skipped for texts at
+# least as long for REGEX_TIMEOUT_TTL seconds.
+# Presets and plain strip rules are ours or escaped, and stay in-process.
+REGEX_RULE_TIMEOUT = int(os.environ.get("DLMS_REGEX_TIMEOUT_MS", "2000")) / 1000  # 0 = no sandbox
+REGEX_SANDBOX_WORKERS = max(1, int(os.environ.get("DLMS_REGEX_WORKERS", "2")))
+REGEX_SANDBOX_START_TIMEOUT = 60
+REGEX_TIMEOUT_MEMORY = 256
+REGEX_TIMEOUT_TTL = int(os.environ.get("DLMS_REGEX_TIMEOUT_TTL", "600"))
+
+_regex_sandbox_idle = []
+_regex_sandbox_lock = threading.Lock()
+_regex_sandbox_slots = threading.BoundedSemaphore(REGEX_SANDBOX_WORKERS)
+# Previews waiting for a helper / running in one, for /metrics
+_regex_sandbox_load = {"waiting": 0, "running": 0}
+
+# step -> (text_len, expires_at); rules that timed out on a text of
+# text_len characters, oldest first
+_regex_timed_out = OrderedDict()
+
+
+class RegexRuleTimeout(Exception):
+    def __init__(self, index):
+        super().__init__(index)
+        self.index = index
+
+
+def _regex_rule_timed_out(step, text_len):
+    """
+    True if step timed out on a text no longer than text_len within the
+    last REGEX_TIMEOUT_TTL seconds. A shorter text gets another try.
+    """
+    with _regex_sandbox_lock:
+        entry = _regex_timed_out.get(step)
+        if entry is None:
+            return False
+        if entry[1] <= time.monotonic():
+            del _regex_timed_out[step]
+            return False
+        return text_len >= entry[0]
+
+
+def _remember_regex_timeout(step, text_len):
+    now = time.monotonic()
+    with _regex_sandbox_lock:
+        entry = _regex_timed_out.pop(step, None)
+        if entry is not None and entry[1] > now:
+            text_len = min(text_len, entry[0])
+        _regex_timed_out[step] = (text_len, now + REGEX_TIMEOUT_TTL)
+        while len(_regex_timed_out) > REGEX_TIMEOUT_MEMORY:
+            _regex_timed_out.popitem(last=False)
+
+
+def user_regex_steps(strip_rules_raw, replace_rules_raw, split_strip=False, text_len=0):
+    """
+    The user regexes of one preview as picklable steps, in order:
+    ("strip", rules) for regex strip rules, then ("replace", rule_line)
+    per replace rule. Strip rules form one combined step unless that step
+    timed out before on a text of text_len characters (or split_strip);
+    then each rule is its own step so the offender can be found.
+    """
+    steps = []
 
+    strip_rules = [r.strip() for r in (strip_rules_raw or "").splitlines() if r.strip()]
+    if strip_rules:
+        combined = ("strip", "\n".join(strip_rules))
+        if len(strip_rules) > 1 and (split_strip or _regex_rule_timed_out(combined, text_len)):
+            steps.extend(("strip", rule) for rule in strip_rules)
+        else:
+            steps.append(combined)
 
+    for line in (replace_rules_raw or "").splitlines():
+        line = line.strip()
+        if "=>" in line and line.split("=>", 1)[0].strip():
+            steps.append(("replace", line))
 
+    return steps
 
-    # =========================
-    # AUTO BOM / INVISIBLE CLEAN
-    # =========================
-    invis_cleanup_enabled = cfg.get("auto_bom_clean", False)
-    removed_unicode = []
-
-    if invis_cleanup_enabled:
-        invisibles = [
-            ("\uFEFF", "BOM"),
-            ("\u200B", "Zero-Width Space"),
-            ("\u200C", "Zero-Width Non-Joiner"),
-            ("\u200D", "Zero-Width Joiner"),
-            ("\u2060", "Word Joiner"),
-        ]
 
-        before = clean_text
+def regex_step_label(step):
+    kind, raw = step
+    if kind == "replace":
+        return raw.split("=>", 1)[0].strip()
+    return raw if "\n" not in raw else "Strip rules"
 
-        for char, label in invisibles:
-            if char in clean_text:
-                removed_unicode.append(label)
-                clean_text = clean_text.replace(char, "")
 
-        # Normalize multiple blank lines
-        clean_text = re.sub(r"\n{3,}", "\n\n", clean_text)
+def run_regex_step(text, step):
+    kind, raw = step
+    if kind == "strip":
+        return apply_strip_rules(text, raw, True), []
+    return run_cleanup_pipeline(text, _cached_rules("replace", raw, _build_replace_steps))
 
-        # If BOM only at start
-        if before != clean_text and "BOM" not in removed_unicode:
-            if before.startswith("\uFEFF"):
-                removed_unicode.append("BOM")
-                clean_text = clean_text.lstrip("\uFEFF")
 
-    # -------- CONFIDENCE ANALYSIS --------
-    conf_summary = conf_details = None
-    if get_confidence_setting():
-        conf_summary, conf_details = analyze_confidence(clean_text)
+# Profiling a rule also finds up to this many matches to show the user
+REGEX_PROFILE_SAMPLES = 3
+REGEX_PROFILE_CONTEXT = 40
 
-    # -------- SMART SUGGESTIONS --------
-    smart_suggestions = []
 
-    def add_suggestion(title, detail, recommend, rule=None):
-        smart_suggestions.append({
-            "title": title,
-            "detail": detail,
-            "recommend": recommend,
-            "suggest_rule": rule
-        })
+def _profile_sample(line, line_number, start, end):
+    return {
+        "line": line_number,
+        "before": line[max(0, start - REGEX_PROFILE_CONTEXT):start],
+        "match": line[start:end][:REGEX_PROFILE_CONTEXT * 4],
+        "after": line[end:end + REGEX_PROFILE_CONTEXT],
+    }
 
-    text = clean_text
 
-    # 1️⃣ Detect wrapped PDF text
-    if re.search(r"(?<![.!?])\n(?!\n)", text):
-        add_suggestion(
-            "Possible PDF Wrap Detected",
-            "Lines appear split where they should be continuous sentences.",
-            "Enable PDF Line Wrapping Fix preset.",
-            "Enable preset: PDF Wrapping"
-        )
+def regex_profile_entry(step, error=None):
+    return {
+        "kind": step[0],
+        "pattern": regex_step_label(step),
+        "compile_ms": None if error else 0.0,
+        "run_ms": None if error else 0.0,
+        "matches": None if error else 0,
+        "changed": False,
+        "samples": [],
+        "error": error,
+    }
 
-    # 2️⃣ Detect numbered prefixes like 1. Question
-    if re.search(r"^\s*\d+\.\s+", text, re.MULTILINE):
-        add_suggestion(
-            "Numbered Question Prefixes Found",
-            "Detected numbering like '1.' or '22.' before questions.",
-            "Enable Number Prefix Removal preset.",
-            r"^\s*\d+\.\s* => "
-        )
 
-    # 3️⃣ Detect repeated header/footer patterns
-    if re.search(r"Page\s+\d+", text) or re.search(r"Copyright", text, re.I):
-        add_suggestion(
-            "Likely Headers/Footers Detected",
-            "Repeated structural text such as page numbers or copyright text found.",
-            "Enable Header/Footer Cleanup preset.",
+def profile_regex_step(text, step):
+    """
+    Run one step the way run_regex_step would, timing compile and run
+    separately. Returns (text, [entry]) where entry holds compile_ms,
+    run_ms, matches (lines removed for strip rules), changed, samples and
+    error.
+    """
+    kind, raw = step
+    entry = regex_profile_entry(step)
+
+    if kind == "strip":
+        pattern, replacement, flags = raw, None, 0
+    else:
+        pattern, replacement = (part.strip() for part in raw.split("=>", 1))
+        flags = re.MULTILINE
+
+    # Only the sandbox (or a timeout of 0) gets here; an empty cache makes
+    # compile_ms mean the same on every run
+    re.purge()
+    started = time.perf_counter()
+    try:
+        compiled = re.compile(pattern, cleanup_regex_flags(pattern, flags))
+    except re.error as e:
+        return text, [regex_profile_entry(step, f"Invalid regex: {e}")]
+    entry["compile_ms"] = (time.perf_counter() - started) * 1000
+
+    if kind == "strip":
+        search = compiled.search
+        lines = text.split("\n")
+
+        started = time.perf_counter()
+        kept = [line for line in lines if not search(line)]
+        entry["run_ms"] = (time.perf_counter() - started) * 1000
+
+        entry["matches"] = len(lines) - len(kept)
+        entry["changed"] = bool(entry["matches"])
+        if entry["changed"]:
+            for number, line in enumerate(lines, 1):
+                m = search(line)
+                if m:
+                    entry["samples"].append(_profile_sample(line, number, m.start(), m.end()))
+                    if len(entry["samples"]) == REGEX_PROFILE_SAMPLES:
+                        break
+            text = "\n".join(kept)
+        return text, [entry]
+
+    started = time.perf_counter()
+    try:
+        new_text, count = compiled.subn(replacement, text)
+    except (re.error, IndexError) as e:
+        return text, [regex_profile_entry(step, f"Invalid replacement: {e}")]
+    entry["run_ms"] = (time.perf_counter() - started) * 1000
+
+    entry["matches"] = count
+    entry["changed"] = new_text != text
+    for m in compiled.finditer(text) if count else ():
+        line_start = text.rfind("\n", 0, m.start()) + 1
+        line_end = text.find("\n", m.end())
+        if line_end == -1:
+            line_end = len(text)
+
+        sample = _profile_sample(
+            text[line_start:line_end],
+            text.count("\n", 0, line_start) + 1,
+            m.start() - line_start,
+            m.end() - line_start,
+        )
+        sample["replacement"] = m.expand(replacement)
+        entry["samples"].append(sample)
+        if len(entry["samples"]) == REGEX_PROFILE_SAMPLES:
+            break
+
+    return new_text, [entry]
+
+
+def _regex_sandbox_main(conn):
+    """
+    Helper process loop: receive (text, steps, profile), send ("step", i)
+    after each step and ("done", text, applied) at the end. With profile,
+    applied holds one profile_regex_step() entry per step instead of the
+    labels of the rules that changed the text.
+    """
+    conn.send(("ready",))
+    while True:
+        try:
+            text, steps, profile = conn.recv()
+        except EOFError:
+            return
+
+        run = profile_regex_step if profile else run_regex_step
+        applied = []
+        for i, step in enumerate(steps):
+            try:
+                text, labels = run(text, step)
+                applied.extend(labels)
+            except Exception as e:
+                applied.append(f"[REGEX ERROR] {regex_step_label(step)} ({type(e).__name__})")
+            conn.send(("step", i))
+
+        conn.send(("done", text, applied))
+
+
+class _RegexSandbox:
+    def __init__(self):
+        import multiprocessing
+
+        # spawn: forking a threaded server can copy held locks
+        ctx = multiprocessing.get_context("spawn")
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_regex_sandbox_main, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+
+        try:
+            ready = self.conn.poll(REGEX_SANDBOX_START_TIMEOUT) and self.conn.recv()
+        except (EOFError, OSError):
+            ready = None
+        if not ready:
+            self.kill()
+            raise OSError("regex sandbox did not start")
+
+    def run(self, text, steps, profile=False):
+        """
+        Returns (text, applied). Raises RegexRuleTimeout(index) when step
+        index misses its deadline or takes the process down with it.
+        """
+        self.conn.send((text, steps, profile))
+
+        index = 0
+        while True:
+            try:
+                if not self.conn.poll(REGEX_RULE_TIMEOUT):
+                    raise RegexRuleTimeout(index)
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                raise RegexRuleTimeout(index)
+
+            if message[0] == "done":
+                return message[1], message[2]
+            index = message[1] + 1
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+def _run_in_regex_sandbox(text, steps, profile=False):
+    with _regex_sandbox_lock:
+        _regex_sandbox_load["waiting"] += 1
+    try:
+        _regex_sandbox_slots.acquire()
+    finally:
+        with _regex_sandbox_lock:
+            _regex_sandbox_load["waiting"] -= 1
+
+    try:
+        with _regex_sandbox_lock:
+            _regex_sandbox_load["running"] += 1
+            sandbox = _regex_sandbox_idle.pop() if _regex_sandbox_idle else None
+        if sandbox is None:
+            sandbox = _RegexSandbox()
+
+        try:
+            result = sandbox.run(text, steps, profile)
+        except BaseException:
+            sandbox.kill()
+            raise
+
+        with _regex_sandbox_lock:
+            _regex_sandbox_idle.append(sandbox)
+        return result
+    finally:
+        with _regex_sandbox_lock:
+            _regex_sandbox_load["running"] -= 1
+        _regex_sandbox_slots.release()
+
+
+def run_regex_steps(text, build_steps, profile=False):
+    """
+    Run the steps returned by build_steps() with a deadline per step.
+    build_steps is called again after every timeout because the timeout
+    can change how the rules are split. Returns (text, steps, applied);
+    steps whose rule timed out (now, or earlier on a text this long) were
+    skipped.
+    """
+    run = profile_regex_step if profile else run_regex_step
+    text_len = len(text)
+
+    while True:
+        steps = build_steps()
+        runnable = [step for step in steps if not _regex_rule_timed_out(step, text_len)]
+
+        if not runnable:
+            return text, steps, []
+
+        if REGEX_RULE_TIMEOUT <= 0:
+            break
+
+        try:
+            new_text, applied = _run_in_regex_sandbox(text, runnable, profile)
+            return new_text, steps, applied
+        except RegexRuleTimeout as e:
+            step = runnable[e.index]
+            print(f"[REGEX] Rule exceeded {REGEX_RULE_TIMEOUT:g}s and was skipped: {regex_step_label(step)}")
+            _remember_regex_timeout(step, text_len)
+        except OSError as e:
+            print(f"[REGEX] Sandbox unavailable ({e}); running rules in-process")
+            break
+
+    applied = []
+    for step in runnable:
+        text, labels = run(text, step)
+        applied.extend(labels)
+    return text, steps, applied
+
+
+def run_user_regex_rules(text, strip_rules_raw, replace_rules_raw):
+    """
+    Apply regex strip rules and replace rules with a deadline per rule.
+    Returns (text, applied_labels); rules that timed out (now, or earlier
+    on a text this long) are skipped and reported as
+    "[REGEX TIMEOUT] <pattern>".
+    """
+    text_len = len(text)
+    text, steps, applied = run_regex_steps(
+        text,
+        lambda: user_regex_steps(strip_rules_raw, replace_rules_raw, text_len=text_len)
+    )
+    timed_out = [
+        f"[REGEX TIMEOUT] {regex_step_label(step)}"
+        for step in steps if _regex_rule_timed_out(step, text_len)
+    ]
+    return text, timed_out + applied
+
+
+# =========================
+# TEXT NORMALIZATION PIPELINE (preview, paste, upload)
+# =========================
+# Pasted, previewed and uploaded text is cleaned by one ordered list of
+# stages instead of a chain of its own in every route:
+#
+#   normalize -> strip -> replace -> split -> junk   (then parse -> validate)
+#
+# A pipeline is a tuple of TextStage. Each stage decides from the
+# TextCleanup of a run (its options and its report) whether it has work
+# to do, so stages that are switched off never touch the text. Stages
+# that only ever look at one line also have a line version, and uploads
+# are cleaned by those while they are streamed into the parser.
+
+# Literal "\r\n" / "\n" sequences (text exported with escaped newlines),
+# then Windows and old Mac line endings. str.replace returns the text
+# itself when there is nothing to replace, so clean text is not copied.
+PASTE_NEWLINES = (("\\r\\n", "\n"), ("\\n", "\n"), ("\r\n", "\n"), ("\r", "\n"))
+
+# Lines dropped by the auto junk cleanup (case-insensitive substrings)
+JUNK_LINE_MARKERS = (
+    "topic",
+    "chapter",
+    "exam version",
+    "objective",
+    "learning goal",
+    "case study",
+    "scenario",
+    "explanation",
+    "rationale",
+    "reference",
+    "page",
+)
+
+
+class TextCleanup:
+    """
+    Options and report of one pipeline run. cfg is the portal config
+    (regex modes and the invisible-character cleanup); the rest come from
+    the paste form. applied_rules / removed_unicode are filled in by the
+    stages that change the text.
+    """
+
+    def __init__(self, cfg=None, strip_rules_raw="", replace_rules_raw="", presets=(), drop_junk=False):
+        cfg = cfg or {}
+        self.regex_strip = cfg.get("enable_regex_strip", False)
+        self.regex_replace = cfg.get("enable_regex_replace", False)
+        self.remove_invisible = cfg.get("auto_bom_clean", False)
+        self.strip_rules_raw = strip_rules_raw or ""
+        self.replace_rules_raw = replace_rules_raw or ""
+        self.presets = presets
+        self.drop_junk = drop_junk
+
+        self.applied_rules = []
+        self.removed_unicode = []
+
+
+class TextStage:
+    __slots__ = ("name", "enabled", "text", "lines")
+
+    def __init__(self, name, enabled, text, lines=None):
+        self.name = name
+        self.enabled = enabled      # cleanup -> bool
+        self.text = text            # (text, cleanup) -> text
+        self.lines = lines          # (lines, cleanup) -> lines, or None
+
+
+def normalize_paste_newlines(text):
+    for old, new in PASTE_NEWLINES:
+        text = text.replace(old, new)
+    return text
+
+
+def remove_invisible_chars(text, removed=None):
+    """
+    Drop every character in INVISIBLE_CHARS, appending the name of each
+    one found to removed.
+    """
+    for char, label in INVISIBLE_CHARS.items():
+        if char in text:
+            text = text.replace(char, "")
+            if removed is not None and label not in removed:
+                removed.append(label)
+    return text
+
+
+def _normalize_text(text, cleanup):
+    text = normalize_paste_newlines(text)
+    if cleanup.remove_invisible:
+        text = remove_invisible_chars(text, cleanup.removed_unicode)
+    return text
+
+
+def _normalize_lines(lines, cleanup):
+    # Lines come from a universal-newline text stream, so only the
+    # literal "\n" sequences are left to split on
+    for line in lines:
+        if cleanup.remove_invisible:
+            line = remove_invisible_chars(line, cleanup.removed_unicode)
+
+        if "\\n" not in line:
+            yield line
+            continue
+
+        pieces = line.replace("\\r\\n", "\n").replace("\\n", "\n").split("\n")
+        for piece in pieces[:-1]:
+            yield piece + "\n"
+        if pieces[-1]:
+            yield pieces[-1]
+
+
+def _strip_text(text, cleanup):
+    # Plain substring rules run in-process; regex strip rules run in the
+    # sandbox with the replace rules
+    return apply_strip_rules(text, cleanup.strip_rules_raw, False)
+
+
+def _replace_text(text, cleanup):
+    text, applied = run_user_regex_rules(
+        text,
+        cleanup.strip_rules_raw if cleanup.regex_strip else "",
+        cleanup.replace_rules_raw if cleanup.regex_replace else ""
+    )
+    cleanup.applied_rules.extend(applied)
+
+    # Presets come after the user rules and share their switch
+    if cleanup.regex_replace and cleanup.presets:
+        text, applied = run_cleanup_pipeline(text, build_cleanup_pipeline("", cleanup.presets))
+        cleanup.applied_rules.extend(applied)
+
+    return text
+
+
+def _split_text(text, cleanup):
+    # "Correct Answer: B" running straight into the next question
+    new_text = PREVIEW_ANSWER_SPLIT.sub(r"\1\n", text)
+    if new_text != text:
+        cleanup.applied_rules.append("Auto Question Splitter")
+        text = new_text
+
+    # Every choice letter on a line of its own, without the blank lines
+    # that can leave behind
+    new_text = PREVIEW_BLANK_RUNS.sub("\n\n", PREVIEW_CHOICE_LINE_FIX.sub("\n", text))
+    if new_text != text:
+        cleanup.applied_rules.append("Normalized MCQ Choices")
+        text = new_text
+
+    return text
+
+
+def _is_junk_line(line):
+    low = line.strip().lower()
+    return not low or any(marker in low for marker in JUNK_LINE_MARKERS)
+
+
+def _junk_text(text, cleanup):
+    return "\n".join(line for line in text.split("\n") if not _is_junk_line(line))
+
+
+def _junk_lines(lines, cleanup):
+    return (line for line in lines if not _is_junk_line(line))
+
+
+NORMALIZE_STAGE = TextStage("normalize", lambda c: True, _normalize_text, _normalize_lines)
+STRIP_STAGE = TextStage(
+    "strip", lambda c: bool(c.strip_rules_raw) and not c.regex_strip, _strip_text
+)
+REPLACE_STAGE = TextStage(
+    "replace",
+    lambda c: (c.regex_strip and bool(c.strip_rules_raw))
+    or (c.regex_replace and bool(c.replace_rules_raw or c.presets)),
+    _replace_text
+)
+SPLIT_STAGE = TextStage("split", lambda c: True, _split_text)
+JUNK_STAGE = TextStage("junk", lambda c: c.drop_junk, _junk_text, _junk_lines)
+
+# The paste box, "Apply This Fix" and the live preview
+PREVIEW_PIPELINE = (NORMALIZE_STAGE, STRIP_STAGE, REPLACE_STAGE, SPLIT_STAGE)
+# Text posted to Build: already cleaned by the preview, so only the form
+# round trip (CRLF line endings) is undone
+PASTE_PIPELINE = (NORMALIZE_STAGE, JUNK_STAGE)
+# Uploaded files, line by line
+UPLOAD_PIPELINE = (NORMALIZE_STAGE, JUNK_STAGE)
+
+
+def run_text_pipeline(text, stages, cleanup):
+    for stage in stages:
+        if stage.enabled(cleanup):
+            text = stage.text(text, cleanup)
+    return text
+
+
+def run_line_pipeline(lines, stages, cleanup):
+    """
+    Chain the line versions of stages over an iterable of lines. Every
+    enabled stage must have one.
+    """
+    for stage in stages:
+        if stage.enabled(cleanup):
+            lines = stage.lines(lines, cleanup)
+    return lines
+
+
+def check_parsed_questions(quiz_data):
+    """
+    Validate stage: log questions that reached the save without choices
+    or without a correct answer.
+    """
+    for i, q in enumerate(quiz_data, 1):
+        choices = q.get("choices", [])
+        if not choices or not any(c.get("is_correct") for c in choices):
+            dprint(f"[PARSE WARNING] Q{i} missing choices or correct answer")
+
+
+def clean_preview_text(text, cfg, strip_rules_raw, replace_rules_raw, presets):
+    """
+    Run PREVIEW_PIPELINE over text. Returns (clean_text, applied_rules,
+    removed_unicode).
+    """
+    cleanup = TextCleanup(cfg, strip_rules_raw, replace_rules_raw, presets)
+    clean_text = run_text_pipeline(text, PREVIEW_PIPELINE, cleanup)
+    return clean_text, cleanup.applied_rules, cleanup.removed_unicode
+
+
+# =========================
+# PREVIEW CACHE (preview_paste -> process_paste)
+# =========================
+# Preview keeps its cleaned text and parse result here under a random
+# token; "Build" posts only the token instead of the whole text again.
+# Entries live in this process only, expire after PREVIEW_CACHE_TTL
+# seconds, and the oldest are evicted once the total estimated size
+# passes PREVIEW_CACHE_MAX_BYTES. With the cache disabled (size 0, or
+# several server processes) the preview page posts the text as before.
+import secrets
+
+PREVIEW_CACHE_TTL = int(os.environ.get("DLMS_PREVIEW_CACHE_TTL", "1800"))
+PREVIEW_CACHE_MAX_BYTES = int(os.environ.get("DLMS_PREVIEW_CACHE_MB", "256")) * 1024 * 1024
+
+# Parsed questions take about three times the memory of their source text
+# (tools/bench_memory.py); the rest is headroom
+PREVIEW_PARSED_SIZE_FACTOR = 4
+
+
+class PreviewCache:
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.enabled = max_bytes > 0
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()   # token -> (expires_at, size, entry)
+        self.total_bytes = 0
+
+    def _drop(self, token):
+        _, size, _ = self.entries.pop(token)
+        self.total_bytes -= size
+
+    def _evict(self, now, keep=None):
+        """
+        Drop expired entries, then the least recently used ones until the
+        total fits. The entry `keep` (the one being added) is never dropped.
+        """
+        for token in [t for t, (expires, _, _) in self.entries.items() if expires <= now and t != keep]:
+            self._drop(token)
+        while self.total_bytes > self.max_bytes:
+            oldest = next((t for t in self.entries if t != keep), None)
+            if oldest is None:
+                break
+            self._drop(oldest)
+
+    def put(self, entry, size):
+        """
+        Returns the entry's token, or "" when the entry alone is larger
+        than the whole cache (the caller then posts the text as before).
+        """
+        if size > self.max_bytes:
+            return ""
+
+        token = secrets.token_urlsafe(16)
+        now = time.time()
+
+        with self.lock:
+            self.entries[token] = (now + self.ttl, size, entry)
+            self.total_bytes += size
+            self._evict(now, keep=token)
+
+        return token
+
+    def attach(self, token, key, value, size):
+        """
+        Store value under entry[key] and count its size against the
+        cache. Returns False (and stores nothing) when the entry is gone
+        or would no longer fit in the cache.
+        """
+        with self.lock:
+            item = self.entries.get(token)
+            if item is None or item[1] + size > self.max_bytes:
+                return False
+            expires, entry_size, entry = item
+            entry[key] = value
+            self.entries[token] = (expires, entry_size + size, entry)
+            self.total_bytes += size
+            self._evict(time.time(), keep=token)
+            return True
+
+    def get(self, token):
+        if not token:
+            return None
+
+        with self.lock:
+            item = self.entries.get(token)
+            if item is None:
+                return None
+            if item[0] <= time.time():
+                self._drop(token)
+                return None
+            self.entries.move_to_end(token)
+            return item[2]
+
+    def pop(self, token):
+        with self.lock:
+            if token in self.entries:
+                self._drop(token)
+
+    def stats(self):
+        with self.lock:
+            return len(self.entries), self.total_bytes
+
+
+PREVIEW_CACHE = PreviewCache(PREVIEW_CACHE_MAX_BYTES, PREVIEW_CACHE_TTL)
+
+
+def analyze_for_build(clean_text):
+    """
+    Run the analyzer on the text exactly as process_paste would receive
+    it from the preview form. Returns (build_text, analysis, parse_report).
+    """
+    build_text = run_text_pipeline(clean_text.strip(), PASTE_PIPELINE, TextCleanup())
+    parse_report = ParseReport()
+    analysis = analyze_quiz_text(build_text, report=parse_report)
+    return build_text, analysis, parse_report
+
+
+def cache_preview(original, clean_text, quiz_title, build_text, questions, parse_report):
+    """
+    Keep a preview's text and parse result for the Build step. Returns
+    the token, or "" when the cache is disabled or the preview is larger
+    than the whole cache.
+    """
+    if not PREVIEW_CACHE.enabled:
+        return ""
+
+    size = (
+        sys.getsizeof(original)
+        + sys.getsizeof(clean_text)
+        + sys.getsizeof(build_text) * (1 + PREVIEW_PARSED_SIZE_FACTOR)
+    )
+
+    return PREVIEW_CACHE.put({
+        "original": original,
+        "clean_text": clean_text,
+        "build_text": build_text,
+        "quiz_title": quiz_title,
+        "questions": questions,
+        "parse_report": parse_report,
+    }, size)
+
+
+# =========================
+# LIVE PREVIEW API (incremental, per question block)
+# =========================
+# The paste page posts the whole text while the user types. The text is
+# split into question blocks and each block's cleanup, confidence and
+# parse result is cached under a hash of (rules, block), so a call only
+# re-processes blocks that changed. Cleanup runs per block here, so
+# replace rules that span two questions only take effect in the full
+# preview.
+LIVE_PREVIEW_MAX_BLOCKS = int(os.environ.get("DLMS_LIVE_PREVIEW_BLOCKS", "50000"))
+
+QUESTION_BLOCK_SPLIT = re.compile(
+    r"(?=^\s*(?:Question\s*#?\s*\d+|\d+\s*[.) ]))",
+    re.IGNORECASE | re.MULTILINE
+)
+
+# Line-level patterns of the parser (see analyze_quiz_text)
+QUESTION_NUMBER_RE = re.compile(r"^\s*(?:Question\s*#?\s*(\d+)|(\d+)\s*[.)])", re.IGNORECASE)
+CHOICE_LINE_RE = re.compile(r"^\s*([A-Za-z])[\.\)]\s+(.*)")
+ANSWER_LETTERS_RE = re.compile(r"[:\-]\s*([A-Za-z]+)")
+QUESTION_PREFIX_RE = re.compile(r"^(?:Question\s*#?\s*\d+[\).\s-]*|\d+[\).\s-]*)\s*", re.IGNORECASE)
+
+# Same boundary as QUESTION_BLOCK_SPLIT, tested one line at a time
+QUESTION_START_LINE = re.compile(r"\s*(?:Question\s*#?\s*\d+|\d+\s*[.) ])", re.IGNORECASE)
+
+
+def iter_question_blocks(lines):
+    """
+    Group an iterable of lines into question blocks without joining the
+    whole text first. Line endings (\\r\\n, \\r) are normalized and a
+    leading BOM is dropped, so the blocks match QUESTION_BLOCK_SPLIT on
+    the same text after .strip().
+    """
+    block = []
+    first = True
+
+    for line in lines:
+        if first:
+            line = line.lstrip("\ufeff")
+            first = False
+
+        line = line.rstrip("\r\n")
+        if "\r" in line:
+            parts = line.split("\r")
+        else:
+            parts = (line,)
+
+        for part in parts:
+            if block and QUESTION_START_LINE.match(part):
+                yield "\n".join(block) + "\n"
+                block = []
+            block.append(part)
+
+    if block:
+        yield "\n".join(block)
+
+
+_live_block_cache = OrderedDict()
+_live_block_lock = threading.Lock()
+
+
+def _short_hash(*parts):
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+def _live_block_result(block, cfg, strip_rules_raw, replace_rules_raw, presets):
+    clean, applied, _ = clean_preview_text(block, cfg, strip_rules_raw, replace_rules_raw, presets)
+    analysis = analyze_quiz_text(clean)
+
+    return {
+        "confidence": analysis["confidence"],
+        "questions": [
+            {
+                "number": q["number"],
+                "question": q["question"][:200],
+                "choices": len(q["choices"]),
+                "correct": q["correct"],
+            }
+            for q in analysis["questions"]
+        ],
+        # A block without a question number has nothing to check
+        "issues": analysis["issues"] if analysis["question_blocks"] else [],
+        "applied": applied,
+    }
+
+
+@app.route("/api/preview/live", methods=["POST"])
+def api_preview_live():
+    """
+    Body: {"text", "strip_text", "replace_rules", "presets": [...],
+           "known": [block hashes the client already holds]}
+
+    Returns the block hashes in document order, results only for blocks
+    the client does not know yet, and totals over the whole text.
+    """
+    data = request.get_json(silent=True) or {}
+    text = normalize_paste_newlines(str(data.get("text", "")))
+    strip_rules_raw = str(data.get("strip_text", "")).strip()
+    replace_rules_raw = str(data.get("replace_rules", "")).strip()
+    presets = {p for p in data.get("presets") or [] if p in CLEANUP_PRESETS}
+    known = set(data.get("known") or [])
+
+    cfg = load_portal_config()
+    rules_key = _short_hash(
+        strip_rules_raw,
+        replace_rules_raw,
+        ",".join(sorted(presets)),
+        json.dumps([
+            bool(cfg.get("enable_regex_strip", False)),
+            bool(cfg.get("enable_regex_replace", False)),
+            bool(cfg.get("auto_bom_clean", False)),
+        ]),
+    )
+
+    order = []
+    blocks = {}
+    totals = {"high": 0, "medium": 0, "low": 0, "questions": 0}
+    recomputed = 0
+
+    for block in QUESTION_BLOCK_SPLIT.split(text):
+        if not block.strip():
+            continue
+
+        key = _short_hash(rules_key, block)
+        order.append(key)
+
+        with _live_block_lock:
+            result = _live_block_cache.get(key)
+            if result is not None:
+                _live_block_cache.move_to_end(key)
+
+        if result is None:
+            result = _live_block_result(block, cfg, strip_rules_raw, replace_rules_raw, presets)
+            recomputed += 1
+            with _live_block_lock:
+                _live_block_cache[key] = result
+                while len(_live_block_cache) > LIVE_PREVIEW_MAX_BLOCKS:
+                    _live_block_cache.popitem(last=False)
+
+        for item in result["confidence"]:
+            totals[item["confidence"]] += 1
+        totals["questions"] += len(result["questions"])
+
+        if key not in known:
+            blocks[key] = result
+
+    return jsonify({
+        "order": order,
+        "blocks": blocks,
+        "totals": totals,
+        "recomputed": recomputed,
+    })
+
+
+# =========================
+# PREVIEW DIFF (original vs cleaned, per question block)
+# =========================
+# Lines are interned to integers, then matched with patience diff: lines
+# that occur exactly once on both sides anchor the alignment (a longest
+# increasing subsequence, O(n log n)) and the gaps between anchors are
+# diffed recursively. A gap without unique lines gets Myers' O(ND) diff,
+# with D capped so that the total (gap lines x D) of one diff stays within
+# a budget; a gap that would need more is shown as one replacement. The result is computed once per preview token and
+# served a page of question blocks at a time.
+from bisect import bisect_left, bisect_right
+
+DIFF_MAX_LINES = int(os.environ.get("DLMS_DIFF_MAX_LINES", "2000000"))
+DIFF_MYERS_BUDGET = 20000000     # sum of gap lines x edit distance, per diff
+DIFF_MYERS_MAX_EDITS = 300       # edit distance at which Myers always gives up
+DIFF_PAGE_BLOCKS = 50
+DIFF_HUNK_MAX_LINES = 200        # lines returned per side of one hunk
+
+
+def _unique_anchors(a, alo, ahi, b, blo, bhi):
+    """
+    Patience step: (i, j) pairs of lines unique in a[alo:ahi] and in
+    b[blo:bhi], reduced to their longest run that is increasing on both
+    sides.
+    """
+    seen_a = {}
+    for i in range(alo, ahi):
+        seen_a[a[i]] = -1 if a[i] in seen_a else i
+
+    seen_b = {}
+    for j in range(blo, bhi):
+        line = b[j]
+        if seen_a.get(line, -1) >= 0:
+            seen_b[line] = -1 if line in seen_b else j
+
+    pairs = sorted((seen_a[line], j) for line, j in seen_b.items() if j >= 0)
+    if not pairs:
+        return []
+
+    # Longest increasing subsequence of j, by patience sorting
+    tops = []           # smallest j ending a run of each length
+    top_index = []      # index into pairs of that j
+    back = [-1] * len(pairs)
+    for n, (_, j) in enumerate(pairs):
+        pile = bisect_left(tops, j)
+        if pile:
+            back[n] = top_index[pile - 1]
+        if pile == len(tops):
+            tops.append(j)
+            top_index.append(n)
+        else:
+            tops[pile] = j
+            top_index[pile] = n
+
+    anchors = []
+    n = top_index[-1]
+    while n >= 0:
+        anchors.append(pairs[n])
+        n = back[n]
+    anchors.reverse()
+    return anchors
+
+
+def _myers_matches(a, alo, ahi, b, blo, bhi, max_edits):
+    """
+    Matched (i, j) pairs of a shortest edit script between the two
+    slices, or None when it needs more than max_edits edits.
+    """
+    n, m = ahi - alo, bhi - blo
+    limit = min(n + m, max_edits)
+    v = [0] * (2 * limit + 3)
+    trace = []
+
+    for d in range(limit + 1):
+        trace.append(v[:])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                x = v[k + 1]
+            else:
+                x = v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            v[k] = x
+            if x >= n and y >= m:
+                break
+        else:
+            continue
+        break
+    else:
+        return None
+
+    matches = []
+    x, y = n, m
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v[k - 1] < v[k + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = v[prev_k]
+        prev_y = prev_x - prev_k
+        while x > prev_x and y > prev_y:
+            x -= 1
+            y -= 1
+            matches.append((alo + x, blo + y))
+        x, y = prev_x, prev_y
+
+    return matches
+
+
+def diff_line_ids(a, b):
+    """
+    Diff two lists of line ids. Returns (opcodes, coarse) where opcodes
+    are difflib-style (tag, i1, i2, j1, j2) tuples and coarse counts the
+    gaps that were too large or too different to align line by line.
+    """
+    matches = []
+    coarse = 0
+    budget = DIFF_MYERS_BUDGET
+    regions = [(0, len(a), 0, len(b))]
+
+    while regions:
+        alo, ahi, blo, bhi = regions.pop()
+
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            matches.append((alo, blo))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            matches.append((ahi, bhi))
+        if alo == ahi or blo == bhi:
+            continue
+
+        anchors = _unique_anchors(a, alo, ahi, b, blo, bhi)
+        if anchors:
+            for i, j in anchors:
+                regions.append((alo, i, blo, j))
+                matches.append((i, j))
+                alo, blo = i + 1, j + 1
+            regions.append((alo, ahi, blo, bhi))
+            continue
+
+        found = None
+        size = (ahi - alo) + (bhi - blo)
+        max_edits = min(DIFF_MYERS_MAX_EDITS, budget // size)
+        if max_edits:
+            found = _myers_matches(a, alo, ahi, b, blo, bhi, max_edits)
+        if found is None:
+            budget -= size * max_edits
+            coarse += 1
+        else:
+            budget -= size * (size - 2 * len(found) + 1)
+            matches.extend(found)
+
+    matches.sort()
+
+    opcodes = []
+    i = j = 0
+    for mi, mj in matches + [(len(a), len(b))]:
+        if i < mi or j < mj:
+            tag = "replace" if i < mi and j < mj else ("delete" if i < mi else "insert")
+            opcodes.append((tag, i, mi, j, mj))
+        if mi < len(a):
+            if opcodes and opcodes[-1][0] == "equal" and opcodes[-1][2] == mi:
+                _, ei1, _, ej1, _ = opcodes[-1]
+                opcodes[-1] = ("equal", ei1, mi + 1, ej1, mj + 1)
+            else:
+                opcodes.append(("equal", mi, mi + 1, mj, mj + 1))
+        i, j = mi + 1, mj + 1
+
+    return opcodes, coarse
+
+
+def build_preview_diff(original, cleaned):
+    """
+    Changes from original to cleaned text, grouped by the question block
+    of the cleaned text they fall in. Returns a dict with the line lists,
+    groups [(block_label, cleaned_line, [opcodes])] and totals; or with
+    "error" when the texts are over DIFF_MAX_LINES.
+    """
+    a_lines = normalize_paste_newlines(original).split("\n")
+    b_lines = cleaned.split("\n")
+
+    if len(a_lines) + len(b_lines) > DIFF_MAX_LINES:
+        return {"error": f"Texts too large to compare ({len(a_lines) + len(b_lines):,} lines)."}
+
+    ids = {}
+    a = [ids.setdefault(line, len(ids)) for line in a_lines]
+    b = [ids.setdefault(line, len(ids)) for line in b_lines]
+    opcodes, coarse = diff_line_ids(a, b)
+
+    starts = [n for n, line in enumerate(b_lines) if QUESTION_START_LINE.match(line)]
+    labels = [" ".join(b_lines[n].split())[:80] for n in starts]
+
+    groups = []
+    added = removed = 0
+    for op in opcodes:
+        tag, i1, i2, j1, j2 = op
+        if tag == "equal":
+            continue
+        removed += i2 - i1
+        added += j2 - j1
+
+        # The block whose start line is the last one at or before j1
+        block = bisect_right(starts, j1) - 1
+        if groups and groups[-1][0] == block:
+            groups[-1][3].append(op)
+        else:
+            groups.append((
+                block,
+                labels[block] if block >= 0 else "Before the first question",
+                starts[block] if block >= 0 else 0,
+                [op],
+            ))
+
+    return {
+        "a_lines": a_lines,
+        "b_lines": b_lines,
+        "groups": [(label, line, ops) for _, label, line, ops in groups],
+        "added": added,
+        "removed": removed,
+        "coarse": coarse,
+    }
+
+
+def preview_diff_summary(diff, elapsed_ms):
+    """
+    What /api/preview/diff keeps in the preview cache: the changed-block
+    opcodes and totals, without the line lists (those are split again
+    from the cached texts per page). Returns (summary, estimated bytes).
+    """
+    if "error" in diff:
+        summary = {"error": diff["error"]}
+        return summary, sys.getsizeof(summary) + sys.getsizeof(diff["error"])
+
+    summary = {
+        "groups": diff["groups"],
+        "added": diff["added"],
+        "removed": diff["removed"],
+        "coarse": diff["coarse"],
+        "original_lines": len(diff["a_lines"]),
+        "cleaned_lines": len(diff["b_lines"]),
+        "elapsed_ms": elapsed_ms,
+    }
+
+    size = sys.getsizeof(summary) + sys.getsizeof(diff["groups"])
+    for label, _, ops in diff["groups"]:
+        size += 64 + sys.getsizeof(label) + sys.getsizeof(ops)
+        size += sum(sys.getsizeof(op) for op in ops)
+    return summary, size
+
+
+def _hunk_lines(lines, start, stop):
+    stop_at = min(stop, start + DIFF_HUNK_MAX_LINES)
+    return lines[start:stop_at], stop - stop_at
+
+
+@app.route("/api/preview/diff", methods=["GET"])
+def api_preview_diff():
+    """
+    ?token=<preview token>&page=1&per_page=50
+
+    One page of changed question blocks between the pasted and the
+    cleaned text of a preview. Line numbers are 1-based.
+    """
+    token = request.args.get("token", "")
+    entry = PREVIEW_CACHE.get(token)
+    if entry is None:
+        return jsonify({"error": "Preview expired. Please preview the text again."}), 404
+
+    try:
+        page = max(1, int(request.args.get("page", 1)))
+        per_page = min(500, max(1, int(request.args.get("per_page", DIFF_PAGE_BLOCKS))))
+    except ValueError:
+        return jsonify({"error": "page and per_page must be numbers."}), 400
+
+    # Only the opcodes and totals are cached (and counted against the
+    # cache size); the lines are split again from the cached texts
+    summary = entry.get("diff")
+    if summary is None:
+        started = time.perf_counter()
+        diff = build_preview_diff(entry["original"], entry["clean_text"])
+        summary, size = preview_diff_summary(diff, (time.perf_counter() - started) * 1000)
+        # Not cached when it would not fit; the next page recomputes it
+        PREVIEW_CACHE.attach(token, "diff", summary, size)
+        a_lines, b_lines = diff.get("a_lines"), diff.get("b_lines")
+    else:
+        a_lines = b_lines = None
+
+    if "error" in summary:
+        return jsonify({"error": summary["error"]}), 413
+
+    if a_lines is None:
+        a_lines = normalize_paste_newlines(entry["original"]).split("\n")
+        b_lines = entry["clean_text"].split("\n")
+
+    groups = summary["groups"]
+    pages = max(1, math.ceil(len(groups) / per_page))
+
+    blocks = []
+    for label, line, ops in groups[(page - 1) * per_page:page * per_page]:
+        hunks = []
+        for tag, i1, i2, j1, j2 in ops:
+            removed, removed_more = _hunk_lines(a_lines, i1, i2)
+            added, added_more = _hunk_lines(b_lines, j1, j2)
+            hunks.append({
+                "tag": tag,
+                "original_line": i1 + 1,
+                "cleaned_line": j1 + 1,
+                "removed": removed,
+                "added": added,
+                "removed_more": removed_more,
+                "added_more": added_more,
+            })
+        blocks.append({"label": label, "cleaned_line": line + 1, "hunks": hunks})
+
+    return jsonify({
+        "page": page,
+        "pages": pages,
+        "changed_blocks": len(groups),
+        "blocks": blocks,
+        "added": summary["added"],
+        "removed": summary["removed"],
+        "original_lines": summary["original_lines"],
+        "cleaned_lines": summary["cleaned_lines"],
+        "coarse": summary["coarse"],
+        "elapsed_ms": summary["elapsed_ms"],
+    })
+
+
+# =========================
+# REGEX RULE PROFILER (regex-help page)
+# =========================
+# A rule is flagged as dominant when it takes at least this share of the
+# time of all profiled rules (and at least REGEX_PROFILE_DOMINANT_MS)
+REGEX_PROFILE_DOMINANT_SHARE = 0.5
+REGEX_PROFILE_DOMINANT_MS = 5.0
+REGEX_PROFILE_DEFAULT_MB = 50
+
+
+@app.route("/api/regex/profile", methods=["POST"])
+def api_regex_profile():
+    """
+    Body: {"text", "strip_text", "replace_rules", "strip_regex" (defaults
+           to the portal setting), "project_mb" (default 50)}
+
+    Runs every strip rule and then every replace rule on text, in the
+    order preview_paste does, each in the regex sandbox with its own
+    deadline. Returns per-rule compile/run time, match count, sample
+    matches, the run time scaled linearly to project_mb, and flags:
+    "dominant", "no_effect", "invalid", "timeout".
+    """
+    data = request.get_json(silent=True) or {}
+    text = normalize_paste_newlines(str(data.get("text", "")))
+    if not text:
+        return jsonify({"error": "No sample text provided."}), 400
+
+    strip_rules = [r.strip() for r in str(data.get("strip_text", "")).splitlines() if r.strip()]
+    replace_rules_raw = str(data.get("replace_rules", "")).strip()
+
+    cfg = load_portal_config()
+    strip_regex = bool(data.get("strip_regex", cfg.get("enable_regex_strip", False)))
+
+    try:
+        project_mb = float(data.get("project_mb") or REGEX_PROFILE_DEFAULT_MB)
+    except (TypeError, ValueError):
+        return jsonify({"error": "project_mb must be a number."}), 400
+
+    # Plain strip rules are case-insensitive substrings: the same matches
+    # as their escaped pattern
+    strip_patterns = strip_rules if strip_regex else [re.escape(r) for r in strip_rules]
+
+    _, steps, entries = run_regex_steps(
+        text,
+        lambda: user_regex_steps("\n".join(strip_patterns), replace_rules_raw, split_strip=True),
+        profile=True
+    )
+
+    results = []
+    entries = iter(entries)
+    for index, step in enumerate(steps):
+        if _regex_rule_timed_out(step, len(text)):
+            entry = regex_profile_entry(step, f"Did not finish within {REGEX_RULE_TIMEOUT:g}s")
+            entry["timed_out"] = True
+        else:
+            entry = next(entries)
+            if isinstance(entry, str):  # "[REGEX ERROR] ..." from the sandbox
+                entry = regex_profile_entry(step, entry)
+            entry["timed_out"] = False
+
+        entry["rule"] = strip_rules[index] if step[0] == "strip" else step[1]
+        results.append(entry)
+
+    total_ms = sum((e["compile_ms"] or 0) + (e["run_ms"] or 0) for e in results)
+    scale = project_mb * 1024 * 1024 / len(text)
+
+    for entry in results:
+        flags = []
+        if entry["timed_out"]:
+            flags.append("timeout")
+        elif entry["error"]:
+            flags.append("invalid")
+        else:
+            spent = entry["compile_ms"] + entry["run_ms"]
+            if (len(results) > 1 and spent >= REGEX_PROFILE_DOMINANT_MS
+                    and spent >= total_ms * REGEX_PROFILE_DOMINANT_SHARE):
+                flags.append("dominant")
+            if not entry["changed"]:
+                flags.append("no_effect")
+
+        entry["share"] = (
+            ((entry["compile_ms"] or 0) + (entry["run_ms"] or 0)) / total_ms if total_ms else 0.0
+        )
+        entry["projected_ms"] = entry["run_ms"] * scale if entry["run_ms"] is not None else None
+        entry["flags"] = flags
+
+    return jsonify({
+        "rules": results,
+        "text_chars": len(text),
+        "total_ms": total_ms,
+        "project_mb": project_mb,
+        "projected_total_ms": sum(e["projected_ms"] or 0 for e in results),
+        "timeout_s": REGEX_RULE_TIMEOUT,
+        "strip_regex": strip_regex,
+    })
+
+
+# =========================
+# CLEANUP AUTO-TUNE (paste page)
+# =========================
+# "Auto-detect Best Cleanup" tries every combination of the cleanup
+# presets on a sample of the pasted text and returns the one that parses
+# best. The user's own strip / replace rules are applied to the sample
+# once, in the regex sandbox as in the preview. The presets, the split
+# stage and the parse of each combination then run as one task in the
+# document worker pool (DLMS_EXTRACT_PROCESSES), or in-process when the
+# pool is limited to one process.
+#
+# Combinations are ranked by questions parsed, then high-confidence
+# questions, then fewest low-confidence ones. On a tie the combination
+# with more presets that actually changed the sample wins (a header
+# stuck to a choice does not change the count), then the one with fewer
+# presets, so a preset that changes nothing is left off.
+AUTOTUNE_SAMPLE_CHARS = 400_000
+AUTOTUNE_SAMPLE_WINDOWS = 4
+
+# User rules only: the presets are what is being tuned
+AUTOTUNE_BASE_PIPELINE = (NORMALIZE_STAGE, STRIP_STAGE, REPLACE_STAGE)
+AUTOTUNE_CANDIDATE_PIPELINE = (REPLACE_STAGE, SPLIT_STAGE)
+
+
+def autotune_sample(text, limit=AUTOTUNE_SAMPLE_CHARS, windows=AUTOTUNE_SAMPLE_WINDOWS):
+    """
+    text itself when it is short, else `windows` evenly spaced slices of
+    whole lines from the start, middle and end, limit characters in all.
+    """
+    if len(text) <= limit:
+        return text
+
+    size = limit // windows
+    step = (len(text) - size) // (windows - 1)
+    slices = []
+    for i in range(windows):
+        start = i * step
+        if start:
+            start = text.find("\n", start) + 1
+        end = text.rfind("\n", start, start + size)
+        if end > start:
+            slices.append(text[start:end])
+
+    return "\n\n".join(slices)
+
+
+def score_cleanup_candidate(text, presets):
+    """
+    Apply presets (a tuple of CLEANUP_PRESETS names) and the split stage
+    to text and parse it the way Build would. Runs in a pool worker.
+    """
+    cleanup = TextCleanup({"enable_regex_replace": True}, presets=presets)
+    text = run_text_pipeline(text, AUTOTUNE_CANDIDATE_PIPELINE, cleanup)
+    analysis = analyze_quiz_text(run_text_pipeline(text.strip(), PASTE_PIPELINE, TextCleanup()))
+    summary = analysis["confidence_summary"]
+    applied = set(cleanup.applied_rules)
+
+    return {
+        "presets": list(presets),
+        "effective": [
+            name for name in presets
+            if any(label in applied for _, _, label in _COMPILED_PRESETS[name])
+        ],
+        "questions": len(analysis["questions"]),
+        "high": summary["high"],
+        "medium": summary["medium"],
+        "low": summary["low"],
+        "applied": cleanup.applied_rules,
+    }
+
+
+def _autotune_rank(result):
+    return (
+        -result["questions"], -result["high"], result["low"],
+        -len(result["effective"]), len(result["presets"]),
+    )
+
+
+def autotune_cleanup_presets(text):
+    """
+    Score every combination of CLEANUP_PRESET_ORDER on text. Returns the
+    results best first.
+    """
+    global _document_pool
+    candidates = [
+        tuple(name for bit, name in enumerate(CLEANUP_PRESET_ORDER) if mask >> bit & 1)
+        for mask in range(1 << len(CLEANUP_PRESET_ORDER))
+    ]
+
+    results = None
+    if DOCUMENT_EXTRACT_PROCESSES > 1:
+        from concurrent.futures.process import BrokenProcessPool
+
+        pool = _get_document_pool()
+        try:
+            futures = [
+                submit_document_task(pool, score_cleanup_candidate, text, presets)
+                for presets in candidates
+            ]
+            results = [future.result() for future in futures]
+        except BrokenProcessPool:
+            print("[AUTOTUNE] Worker pool broke; scoring in-process")
+            with _document_pool_lock:
+                _document_pool = None
+
+    if results is None:
+        results = [score_cleanup_candidate(text, presets) for presets in candidates]
+
+    results.sort(key=_autotune_rank)
+    return results
+
+
+@app.route("/api/cleanup/autotune", methods=["POST"])
+def api_cleanup_autotune():
+    """
+    Body: {"text", "strip_text", "replace_rules"}
+
+    Returns {"best": [preset names], "candidates": [{"presets",
+    "effective", "questions", "high", "medium", "low", "applied"}] best
+    first,
+    "sample_chars", "text_chars", "presets_active", "seconds"}.
+    presets_active is false when regex replace is turned off in the
+    portal settings, because the preview then ignores the presets.
+    """
+    data = request.get_json(silent=True) or {}
+    text = str(data.get("text", ""))
+    if not text.strip():
+        return jsonify({"error": "Paste some questions first."}), 400
+
+    started = time.perf_counter()
+    cfg = load_portal_config()
+
+    sample = autotune_sample(normalize_paste_newlines(text))
+    base = run_text_pipeline(sample, AUTOTUNE_BASE_PIPELINE, TextCleanup(
+        cfg,
+        str(data.get("strip_text", "")).strip(),
+        str(data.get("replace_rules", "")).strip(),
+    ))
+
+    results = autotune_cleanup_presets(base)
+    seconds = time.perf_counter() - started
+    print(f"[AUTOTUNE] {len(results)} preset combinations on {len(sample)} chars in {seconds:.2f}s: "
+          f"{', '.join(results[0]['presets']) or 'no presets'}")
+
+    return jsonify({
+        "best": results[0]["presets"],
+        "candidates": results,
+        "sample_chars": len(sample),
+        "text_chars": len(text),
+        "presets_active": bool(cfg.get("enable_regex_replace", False)),
+        "seconds": seconds,
+    })
+
+
+# =========================
+# PREVIEW CLEAN TEXT BEFORE PARSE
+# =========================
+@app.route("/preview_paste", methods=["POST"])
+def preview_paste():
+    #cleanup_temp_logos()   # 🧹 optional cleanup (leave commented)
+
+    quiz_text = request.form.get("quiz_text", "").strip()
+    quiz_title = request.form.get("quiz_title", "Generated Quiz From Paste")
+    strip_rules_raw = request.form.get("strip_text", "").strip()
+
+    # A PDF / Word document replaces the pasted text
+    document = request.files.get("document")
+    if document:
+        quiz_text, error = extract_document_upload(document)
+        if error:
+            return error, 400
+
+    # "Apply This Fix" re-previews the cached original instead of re-posting it
+    if not quiz_text and request.form.get("preview_token"):
+        cached = PREVIEW_CACHE.get(request.form.get("preview_token"))
+        if cached is None:
+            return "Preview expired. Please paste and preview the text again.", 400
+        quiz_text = cached["original"]
+
+    # =========================
+    # HANDLE LOGO PREVIEW (TEMP ONLY)
+    # =========================
+    preview_logo_name = save_preview_logo(
+        app,
+        request.files.get("quiz_logo")
+    )
+
+
+
+
+
+    if not quiz_text:
+        return "No text provided.", 400
+
+    # =========================
+    # NORMALIZE / STRIP / REPLACE / SPLIT (PREVIEW_PIPELINE)
+    # =========================
+    strip_rules = []
+    if strip_rules_raw:
+        strip_rules = [r.strip() for r in strip_rules_raw.splitlines() if r.strip()]
+
+    cfg = load_portal_config()
+    regex_mode = cfg.get("enable_regex_strip", False)
+    regex_replace_enabled = cfg.get("enable_regex_replace", False)
+    invis_cleanup_enabled = cfg.get("auto_bom_clean", False)
+
+    replace_rules_raw = request.form.get("replace_rules", "").strip()
+
+    # Preset state is preserved for the template
+    preset_number_prefix_checked = bool(request.form.get("preset_number_prefix"))
+    preset_pdf_spacing_checked = bool(request.form.get("preset_pdf_spacing"))
+    preset_headers_checked = bool(request.form.get("preset_headers"))
+
+    presets = {
+        name for name, checked in (
+            ("preset_number_prefix", preset_number_prefix_checked),
+            ("preset_headers", preset_headers_checked),
+            ("preset_pdf_spacing", preset_pdf_spacing_checked),
+        ) if checked
+    }
+
+    clean_text, applied_rules, removed_unicode = clean_preview_text(
+        quiz_text, cfg, strip_rules_raw, replace_rules_raw, presets
+    )
+    skipped_rules = [r[len("[REGEX TIMEOUT] "):] for r in applied_rules if r.startswith("[REGEX TIMEOUT] ")]
+    applied_rules = [r for r in applied_rules if not r.startswith("[REGEX TIMEOUT] ")]
+
+    # -------- PARSE + CONFIDENCE + STRUCTURE (one pass) --------
+    build_text, analysis, parse_report = analyze_for_build(clean_text)
+
+    conf_summary = conf_details = None
+    if get_confidence_setting():
+        conf_summary = analysis["confidence_summary"]
+        conf_details = analysis["confidence"]
+
+    structural_issues = analysis["issues"]
+
+    # -------- SMART SUGGESTIONS --------
+    smart_suggestions = []
+
+    def add_suggestion(title, detail, recommend, rule=None):
+        smart_suggestions.append({
+            "title": title,
+            "detail": detail,
+            "recommend": recommend,
+            "suggest_rule": rule
+        })
+
+    profile = profile_document(clean_text)
+
+    # 1️⃣ Detect wrapped PDF text
+    if profile["soft_breaks"]:
+        add_suggestion(
+            "Possible PDF Wrap Detected",
+            "Lines appear split where they should be continuous sentences.",
+            "Enable PDF Line Wrapping Fix preset.",
+            "Enable preset: PDF Wrapping"
+        )
+
+    # 2️⃣ Detect numbered prefixes like 1. Question
+    if profile["numbered_lines"]:
+        add_suggestion(
+            "Numbered Question Prefixes Found",
+            "Detected numbering like '1.' or '22.' before questions.",
+            "Enable Number Prefix Removal preset.",
+            r"^\s*\d+\.\s* => "
+        )
+
+    # 3️⃣ Detect repeated header/footer patterns
+    if profile["page_markers"] or profile["copyright_lines"]:
+        add_suggestion(
+            "Likely Headers/Footers Detected",
+            "Repeated structural text such as page numbers or copyright text found.",
+            "Enable Header/Footer Cleanup preset.",
             "Enable preset: Headers"
         )
 
-    # 4️⃣ Detect if nothing changed
-    if quiz_text == clean_text:
-        add_suggestion(
-            "No Formatting Changes Applied",
-            "None of your strip or regex rules changed the text.",
-            "Try enabling presets or adding regex rules."
-        )
+    # 4️⃣ Detect if nothing changed
+    if quiz_text == clean_text:
+        add_suggestion(
+            "No Formatting Changes Applied",
+            "None of your strip or regex rules changed the text.",
+            "Try enabling presets or adding regex rules."
+        )
+
+    # 5️⃣ If no warnings, say it’s clean
+    if len(smart_suggestions) == 0:
+        add_suggestion(
+            "Formatting Looks Excellent",
+            "No structural or formatting problems detected.",
+            "You can safely continue 👍"
+        )
+
+
+    # =========================
+    # UI SUPPORT LOGIC — ensure template displays correctly
+    # =========================
+
+    # If global regex replace enabled but user did not submit rules,
+    # keep replace_rules list empty but still treat engine as active
+    replace_rules = replace_rules_raw.splitlines() if replace_rules_raw else []
+
+    # Make template show replace rules section when enabled globally
+    if regex_replace_enabled and not replace_rules:
+        replace_rules = ["(Regex engine enabled — no manual rules entered)"]
+
+
+    # Keep the result for "Build" so it is not re-posted and re-parsed
+    preview_token = cache_preview(
+        quiz_text, clean_text, quiz_title,
+        build_text, analysis["questions"], parse_report
+    )
+
+    # ---------- RENDER PREVIEW ----------
+    return render_template_string("""
+
+<html>
+<head>
+    <title>Preview Before Parsing</title>
+    <link rel="stylesheet" href="/static/style.css">
+    <link rel="icon" href="/static/favicon.ico">
+                              
+</head>
+
+<body>
+
+  <script>
+    fetch("/config/portal.json")
+    .then(r => r.json())
+    .then(cfg => {
+        if (cfg.background_image) {
+            document.documentElement.style.setProperty(
+                "--portal-bg",
+                `url(${cfg.background_image})`
+            );
+        }
+    });
+    </script>
+                             
+
+<div class="container">
+    
+    <h1 class="hero-title">👀 Preview Quiz Before Building</h1>
+
+    <div class="card">
+        <h2>Quiz Title:</h2>
+        <p><b>{{quiz_title}}</b></p>
+
+        <!-- STEP 7: PRE-PROCESS SUMMARY PANEL -->
+<div style="background:#1a1a1a; padding:12px; border-radius:8px; margin-bottom:18px;">
+    <h2>🧪 Pre-Processing Summary</h2>
+
+    <!-- =============================
+          REGEX STRIP + STRIP RULES
+    ============================== -->
+    {% if regex_mode %}
+    <p><b>Regex Strip Mode:</b> Enabled ✔</p>
+
+        {% if strip_rules %}
+        <h3>Lines Removed By Strip Rules</h3>
+        <ul>
+            {% for r in strip_rules %}
+            <li>{{r}}</li>
+            {% endfor %}
+        </ul>
+        {% endif %}
+    {% endif %}
+
+    <!-- =============================
+          MANUAL REGEX RULES
+    ============================== -->
+    {% if replace_rules %}
+    <h3>Manual Regex Replace Rules</h3>
+    <ul>
+        {% for r in replace_rules %}
+        <li>{{r}}</li>
+        {% endfor %}
+    </ul>
+    {% endif %}
+
+    <!-- =============================
+          PRESETS — ONLY IF ANY USED
+    ============================== -->
+    {% if preset_number_prefix_checked or preset_pdf_spacing_checked or preset_headers_checked %}
+    <h3>✨ Regex Presets</h3>
+    <ul>
+        {% if preset_number_prefix_checked %}
+        <li>Number Prefix Removal Enabled ✔</li>
+        {% endif %}
+
+        {% if preset_pdf_spacing_checked %}
+        <li>PDF Line Wrapping Fix Enabled ✔</li>
+        {% endif %}
+
+        {% if preset_headers_checked %}
+        <li>Header/Footer Cleanup Enabled ✔</li>
+        {% endif %}
+    </ul>
+    {% endif %}
+
+    <!-- =============================
+          RULES SKIPPED AFTER A TIMEOUT
+    ============================== -->
+    {% if skipped_rules %}
+    <h3>⚠️ Rules Skipped (Too Slow)</h3>
+    <p>These rules took longer than {{ regex_timeout }}s on this text, or on
+    a text at least this long in the last {{ regex_timeout_ttl }} min, and
+    were not applied. The cleaned text below is without them.</p>
+    <ul>
+        {% for r in skipped_rules %}
+        <li>⚠️ {{r}}</li>
+        {% endfor %}
+    </ul>
+    {% endif %}
+
+    <!-- =============================
+          RULES THAT ACTUALLY FIRED
+    ============================== -->
+    {% if applied_rules %}
+    <h3>Rules That Actually Changed Text</h3>
+    <ul>
+        {% for r in applied_rules %}
+        <li>{% if r.startswith("[") %}⚠️{% else %}✔{% endif %} {{r}}</li>
+        {% endfor %}
+    </ul>
+    {% endif %}
+
+    <!-- =============================
+          INVISIBLE CLEAN
+    ============================== -->
+    {% if invis_cleanup_enabled %}
+    <h3>Invisible Character Cleanup</h3>
+
+        {% if removed_unicode %}
+        <p>Removed:</p>
+        <ul>
+            {% for u in removed_unicode %}
+            <li>{{u}}</li>
+            {% endfor %}
+        </ul>
+        {% else %}
+        <p>No hidden Unicode issues found 🎉</p>
+        {% endif %}
+    {% endif %}
+</div>
+
+
+                       <!-- SMART SUGGESTIONS -->
+                    <h3>💡 Smart Suggestions</h3>
+
+                    {% if smart_suggestions and smart_suggestions|length > 0 %}
+                    <ul>
+                    {% for s in smart_suggestions %}
+                    <li style="margin-bottom:10px;">
+                        <b>{{s.title}}</b><br>
+                        <span style="opacity:.85">{{s.detail}}</span><br>
+                        <span style="opacity:.7">Recommendation: {{s.recommend}}</span>
+
+                        {% if s.suggest_rule %}
+                        <br>
+                        <code style="background:#222;padding:4px 6px;border-radius:6px;">
+                            {{s.suggest_rule}}
+                        </code>
+                        {% endif %}
+
+                        <!-- APPLY BUTTON -->
+                        <form action="/preview_paste" method="POST" style="margin-top:8px;">
+
+                            <!-- original text stays server-side under the preview token -->
+                            <input type="hidden" name="quiz_title" value="{{quiz_title}}">
+                            {% if preview_token %}
+                            <input type="hidden" name="preview_token" value="{{preview_token}}">
+                            {% else %}
+                            <textarea name="quiz_text" style="display:none;">{{original}}</textarea>
+                            {% endif %}
+
+                            <!-- preserve user cleanup fields if they existed -->
+                            <textarea name="strip_text" style="display:none;">
+                    {% for r in strip_rules %}{{r}}
+                    {% endfor %}
+                            </textarea>
+
+                            <textarea name="replace_rules" style="display:none;">
+                    {% for r in replace_rules %}{{r}}
+                    {% endfor %}
+                            </textarea>
+
+                            <!-- turn on correct preset -->
+                            {% if "PDF" in s.title %}
+                                <input type="hidden" name="preset_pdf_spacing" value="1">
+                            {% endif %}
+
+                            {% if "Number" in s.title %}
+                                <input type="hidden" name="preset_number_prefix" value="1">
+                            {% endif %}
+
+                            {% if "Header" in s.title or "Footer" in s.title %}
+                                <input type="hidden" name="preset_headers" value="1">
+                            {% endif %}
+
+                            <button type="submit">⚙ Apply This Fix</button>
+                        </form>
+
+                    </li>
+                    {% endfor %}
+                    </ul>
+                    {% else %}
+                    <p>No suggestions — formatting already looks great 🎯</p>
+                    {% endif %}
+
+
+        </div>
+        <!-- END SUMMARY -->
+
+        <h2>Original Text</h2>
+        <pre id="origBox" style="background:black;padding:10px;border-radius:8px;white-space:pre-wrap;">{{original}}</pre>
+
+        <h2>Text To Be Parsed: (passed to quiz)</h2>
+        <pre id="cleanBox" style="background:#102020;padding:10px;border-radius:8px;white-space:pre-wrap;">{{cleaned}}</pre>
+
+        <br>
+        <button onclick="toggleInvisible()" style="margin-top:5px;">
+            👁 Show / Hide Invisible Characters
+        </button>
+
+        <p style="opacity:.7">
+            This helps detect BOM, zero-width, Unicode junk, and newline issues.
+        </p>
+
+        <div id="visualPanel" style="display:none; margin-top:15px;">
+            <h2>🔍 Visualized Text</h2>
+
+            <h3>Original Input</h3>
+            <pre id="visualOrig" style="background:#222;padding:10px;border-radius:8px;white-space:pre-wrap;"></pre>
+
+            <h3>Parsed (Cleaned) Version</h3>
+            <pre id="visualClean" style="background:#333;padding:10px;border-radius:8px;white-space:pre-wrap;"></pre>
+        </div>
+
+        <script>
+        function visualize(text) {
+            return text
+                .replace(/\\u200B/g, "[ZWSP]")
+                .replace(/\\u200C/g, "[ZWNJ]")
+                .replace(/\\u200D/g, "[ZWJ]")
+                .replace(/\\u2060/g, "[WJ]")
+                .replace(/\\uFEFF/g, "[BOM]")
+                .replace(/ /g, "·")
+                .replace(/\\n/g, "\\\\n\\n");
+        }
+
+        function toggleInvisible() {
+            const panel = document.getElementById("visualPanel");
+            const show = panel.style.display === "none";
+
+            if (show) {
+                document.getElementById("visualOrig").innerText =
+                    visualize(document.getElementById("origBox").innerText);
+
+                document.getElementById("visualClean").innerText =
+                    visualize(document.getElementById("cleanBox").innerText);
+            }
+
+            panel.style.display = show ? "block" : "none";
+        }
+        </script>
+
+        <!-- 🔍 DIFF VIEW -->
+        <button onclick="toggleDiff()" style="margin-top:10px;">
+            🔍 Show / Hide Differences
+        </button>
+
+        <div id="diffPanel" style="display:none; margin-top:15px;">
+            <h2>⚖️ Text Differences</h2>
+
+            <h3>Original vs Cleaned Comparison</h3>
+            <p id="diffSummary" style="opacity:.8"></p>
+            <div id="diffView"
+                 style="background:#252525;padding:10px;border-radius:8px;white-space:pre-wrap;font-family:monospace;"></div>
+            <div id="diffPager" style="margin-top:8px; display:flex; gap:8px; align-items:center;"></div>
+
+            <p style="opacity:.7">
+                <span style="color:#4cff4c;font-weight:bold;">Green</span> = added ·
+                <span style="color:#ff4c4c;font-weight:bold;">Red</span> = removed
+            </p>
+
+        </div>
+
+        <script>
+// Changed question blocks come from /api/preview/diff one page at a time,
+// so even very large pastes render only what is on screen.
+const DIFF_TOKEN = "{{ preview_token }}";
+let diffPage = 1;
+
+function toggleDiff() {
+    const panel = document.getElementById("diffPanel");
+    const show = panel.style.display === "none";
+    if (show) runDiff(diffPage);
+    panel.style.display = show ? "block" : "none";
+}
+
+function diffLine(className, prefix, text) {
+    const span = document.createElement("span");
+    span.className = className;
+    span.textContent = prefix + text + "\\n";
+    return span;
+}
+
+function renderDiffPage(data) {
+    const view = document.getElementById("diffView");
+    const pager = document.getElementById("diffPager");
+    view.replaceChildren();
+    pager.replaceChildren();
+
+    document.getElementById("diffSummary").textContent =
+        `${data.removed.toLocaleString()} line(s) removed, ${data.added.toLocaleString()} added ` +
+        `in ${data.changed_blocks.toLocaleString()} question block(s) ` +
+        `(${data.original_lines.toLocaleString()} → ${data.cleaned_lines.toLocaleString()} lines, ` +
+        `compared in ${Math.round(data.elapsed_ms)} ms).` +
+        (data.coarse ? ` ${data.coarse} large region(s) are shown as a whole replacement.` : "");
+
+    if (!data.blocks.length) {
+        view.textContent = "No differences detected.";
+        return;
+    }
+
+    for (const block of data.blocks) {
+        const title = document.createElement("b");
+        title.textContent = `── ${block.label} (cleaned line ${block.cleaned_line})\\n`;
+        view.append(title);
+
+        for (const hunk of block.hunks) {
+            view.append(diffLine("diff-unchanged", "",
+                `@ original line ${hunk.original_line}, cleaned line ${hunk.cleaned_line}`));
+            for (const line of hunk.removed) view.append(diffLine("diff-removed", "- ", line));
+            if (hunk.removed_more) {
+                view.append(diffLine("diff-unchanged", "", `… ${hunk.removed_more} more removed line(s)`));
+            }
+            for (const line of hunk.added) view.append(diffLine("diff-added", "+ ", line));
+            if (hunk.added_more) {
+                view.append(diffLine("diff-unchanged", "", `… ${hunk.added_more} more added line(s)`));
+            }
+        }
+        view.append("\\n");
+    }
+
+    if (data.pages > 1) {
+        const prev = document.createElement("button");
+        prev.textContent = "◀ Previous";
+        prev.disabled = data.page <= 1;
+        prev.onclick = () => runDiff(data.page - 1);
+
+        const next = document.createElement("button");
+        next.textContent = "Next ▶";
+        next.disabled = data.page >= data.pages;
+        next.onclick = () => runDiff(data.page + 1);
+
+        const label = document.createElement("span");
+        label.textContent = `Page ${data.page} of ${data.pages}`;
+        pager.append(prev, label, next);
+    }
+}
+
+async function runDiff(page) {
+    if (!DIFF_TOKEN) {
+        runLocalDiff();
+        return;
+    }
+
+    diffPage = page;
+    document.getElementById("diffSummary").textContent = "Comparing…";
+    try {
+        const resp = await fetch(`/api/preview/diff?token=${encodeURIComponent(DIFF_TOKEN)}&page=${page}`);
+        const data = await resp.json();
+        if (!resp.ok) {
+            document.getElementById("diffSummary").textContent = data.error || `Error ${resp.status}`;
+            return;
+        }
+        renderDiffPage(data);
+    } catch (err) {
+        document.getElementById("diffSummary").textContent = `Comparison failed: ${err}`;
+    }
+}
+
+// Without a preview token (cache off) only line membership is compared
+function normalizeKey(s) {
+    return (s || "")
+        .replace(/\\r/g, "")
+        .replace(/[\\u200B\\u200C\\u200D\\u2060]/g, "")
+        .replace(/\\uFEFF/g, "")
+        .replace(/\\u00A0/g, " ")
+        .replace(/\\s+/g, " ")
+        .trim();
+}
+
+function runLocalDiff() {
+    const origLines = document.getElementById("origBox").innerText
+        .split("\\n").map(normalizeKey).filter(Boolean);
+    const cleanLines = document.getElementById("cleanBox").innerText
+        .split("\\n").map(normalizeKey).filter(Boolean);
+    const origSet = new Set(origLines);
+    const cleanSet = new Set(cleanLines);
+
+    const view = document.getElementById("diffView");
+    view.replaceChildren();
+    document.getElementById("diffSummary").textContent = "";
+
+    for (const line of origLines) {
+        if (!cleanSet.has(line)) view.append(diffLine("diff-removed", "[REMOVED] ", line));
+    }
+    for (const line of cleanLines) {
+        if (!origSet.has(line)) view.append(diffLine("diff-added", "[ADDED] ", line));
+    }
+
+    if (!view.childNodes.length) {
+        view.textContent = "No structural differences detected.";
+    }
+}
+</script>
+
+
+
+        <h2>🧩 Parse Check</h2>
+        <p><b>{{parsed_count}}</b> question(s) will be built from this text.</p>
+        {% if structural_issues %}
+        <ul>
+            {% for issue in structural_issues[:20] %}
+            <li style="opacity:.85">⚠ {{issue}}</li>
+            {% endfor %}
+            {% if structural_issues|length > 20 %}
+            <li style="opacity:.6">… and {{structural_issues|length - 20}} more</li>
+            {% endif %}
+        </ul>
+        {% endif %}
+
+        {% if conf_details %}
+        <h2>🧠 Confidence Analysis</h2>
+        <p>
+            <b>Total blocks:</b> {{conf_summary.total}}<br>
+            ✅ High: {{conf_summary.high}} &nbsp;
+            ⚠ Medium: {{conf_summary.medium}} &nbsp;
+            ❌ Low: {{conf_summary.low}}
+        </p>
+
+        <ul>
+            {% for item in conf_details %}
+            <li style="margin-bottom:8px;">
+                <b>Block {{item.index}} ({{item.confidence|capitalize}})</b><br>
+                <span style="opacity:.85">{{item.title}}</span><br>
+                <span style="opacity:.6; font-size:12px;">{{item.reason}}</span>
+            </li>
+            {% endfor %}
+        </ul>
+        {% endif %}
+
+        <p style="opacity:.7">
+            If this looks correct, continue. Otherwise, go back and adjust rules.
+        </p>
+
+        <form action="/download_cleaned" method="POST" style="display:inline;">
+            {% if preview_token %}
+            <input type="hidden" name="preview_token" value="{{ preview_token }}">
+            {% else %}
+            <textarea name="clean_text" style="display:none;">{{cleaned}}</textarea>
+            {% endif %}
+            <button type="submit">📥 Download Cleaned Text</button>
+        </form>
+
+        <!-- IMPORTANT: Build from the CLEANED text cached under the token -->
+        <form action="/process_paste" method="POST">
+            <input type="hidden" name="quiz_title" value="{{ quiz_title }}">
+            <input type="hidden" name="temp_logo_name" value="{{ preview_logo_name }}">
+            {% if preview_token %}
+            <input type="hidden" name="preview_token" value="{{ preview_token }}">
+            {% else %}
+            <textarea name="quiz_text" style="display:none;">{{ cleaned }}</textarea>
+            {% endif %}
+
+            <button type="submit">✅ Yes, Build My Quiz</button>
+        </form>
+
+
+        <br>
+        <button onclick="history.back()">⬅ Go Back & Edit</button>
+        <button onclick="location.href='/'">🏠 Return To Portal</button>
+    </div>
+</div>
+</body>
+</html>
+""",
+
+        quiz_title=quiz_title,
+        original=quiz_text,
+        cleaned=clean_text,
+        conf_summary=conf_summary,
+        conf_details=conf_details,
+        preview_logo_name=preview_logo_name,
+        regex_mode=regex_mode,
+        strip_rules=strip_rules,
+        replace_rules=replace_rules,
+        applied_rules=applied_rules,
+        skipped_rules=skipped_rules,
+        regex_timeout=f"{REGEX_RULE_TIMEOUT:g}",
+        regex_timeout_ttl=f"{REGEX_TIMEOUT_TTL / 60:g}",
+        invis_cleanup_enabled=invis_cleanup_enabled,
+        removed_unicode=removed_unicode,
+        preset_number_prefix_checked=preset_number_prefix_checked,
+        preset_pdf_spacing_checked=preset_pdf_spacing_checked,
+        preset_headers_checked=preset_headers_checked,
+        smart_suggestions=smart_suggestions,
+        preview_token=preview_token,
+        parsed_count=len(analysis["questions"]),
+        structural_issues=structural_issues
+        )
+
+
+
+
+
+
+
+
+
+
+
+from flask import send_file
+from io import BytesIO
+
+@app.route("/download_cleaned", methods=["GET","POST"])
+def download_cleaned():
+    cleaned = request.form.get("clean_text", "").strip()
+
+    if not cleaned and request.form.get("preview_token"):
+        cached = PREVIEW_CACHE.get(request.form.get("preview_token"))
+        if cached is not None:
+            cleaned = cached["clean_text"].strip()
+
+    if not cleaned:
+        return "No cleaned text available.", 400
+
+    buf = BytesIO()
+    buf.write(cleaned.encode("utf-8"))
+    buf.seek(0)
+
+    return send_file(
+        buf,
+        mimetype="text/plain",
+        as_attachment=True,
+        download_name="cleaned_quiz_text.txt"
+    )
+
+
+
+
+# =========================
+# PROCESS PASTED QUIZ
+# =========================
+@app.route("/process_paste", methods=["POST"])
+def process_paste():
+    #cleanup_temp_logos()   # 🧹 clean abandoned logos again
+
+    quiz_text = request.form.get("quiz_text", "").strip()
+    quiz_title = request.form.get("quiz_title", "Generated Quiz From Paste")
+
+    # Checkbox flag (Auto Junk Cleanup)
+    auto_cleanup = request.form.get("auto_cleanup") == "1"
+
+    # Built from the preview page: reuse its cleaned text and parse
+    preview_token = request.form.get("preview_token", "").strip()
+    preview = PREVIEW_CACHE.get(preview_token) if preview_token else None
+
+    if preview_token and preview is None and not quiz_text:
+        return "Preview expired. Please paste and preview the text again.", 400
+
+    if preview is not None:
+        clean_text = preview["build_text"]
+        quiz_data = preview["questions"]
+        parse_report = preview["parse_report"]
+    else:
+        if not quiz_text:
+            return "No text provided.", 400
+
+        # Newlines (and invisible characters, if enabled); the junk
+        # line cleanup only runs if you wire its checkbox
+        clean_text = run_text_pipeline(
+            quiz_text,
+            PASTE_PIPELINE,
+            TextCleanup(load_portal_config(), drop_junk=auto_cleanup)
+        )
+
+    # Save cleaned text (for debugging / consistency)
+    path = os.path.join(UPLOAD_FOLDER, "pasted.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(clean_text)
+
+    # =========================
+    # SAME CONTENT IMPORTED BEFORE?
+    # =========================
+    temp_logo_name = request.form.get("temp_logo_name", "").strip()
+    on_duplicate = request.form.get("on_duplicate", "")
+
+    content_hash = quiz_content_hash(clean_text.split("\n"))
+    existing = find_quiz_by_content_hash(content_hash)
+
+    if existing and on_duplicate == "refresh":
+        logo_filename = finalize_logo_from_request(
+            app,
+            int(time.time()),
+            logo_file=request.files.get("quiz_logo"),
+            temp_logo_name=temp_logo_name,
+        )
+        refresh_quiz_metadata(existing["id"], quiz_title, logo_filename)
+        if preview is not None:
+            PREVIEW_CACHE.pop(preview_token)
+        return redirect("/library")
+
+    if existing and on_duplicate != "new":
+        return render_duplicate_quiz(existing, "/process_paste", quiz_title, {
+            "preview_token": preview_token if preview is not None else "",
+            "quiz_text": "" if preview is not None else clean_text,
+            "temp_logo_name": temp_logo_name or save_preview_logo(app, request.files.get("quiz_logo")),
+        })
+
+    # =========================
+    # PARSE QUIZ
+    # =========================
+    if preview is None:
+        parse_report = ParseReport()
+        quiz_data = parse_questions(clean_text, report=parse_report)
+
+    # Always save a parse log (success or failure)
+    ts = int(time.time())
+    log_filename = parse_report.write(DATA_FOLDER)
+
+    # If no questions parsed, show failure UI + log link
+    if not quiz_data:
+        return render_template_string("""
+        <html>
+        <head>
+            <title>Parse Failed</title>
+            <link rel="stylesheet" href="/static/style.css">
+            <link rel="icon" href="/static/favicon.ico">
+        </head>
+        <body>
+        <script>
+        fetch("/config/portal.json")
+        .then(r => r.json())
+        .then(cfg => {
+            if (cfg.background_image) {
+                document.documentElement.style.setProperty(
+                    "--portal-bg",
+                    `url(${cfg.background_image})`
+                );
+            }
+        });
+        </script>
+
+        <div class="container">
+            <h1 class="hero-title">⚠️ Could Not Parse Any Questions</h1>
+
+            <div class="card">
+                <p>No valid questions were parsed. Please check the formatting.</p>
+                <p>You can download the parser log for troubleshooting:</p>
+
+                <button onclick="location.href='/data/{{log_filename}}'">
+                    📥 Download Parse Log
+                </button>
+
+                <br><br>
+
+                <button onclick="location.href='/upload'">
+                    ⬅ Back To Upload Page
+                </button>
+
+                <button onclick="location.href='/paste'">
+                    📋 Try Paste Mode Instead
+                </button>
+
+                <button onclick="location.href='/'">
+                    🏠 Return To Portal
+                </button>
+            </div>
+        </div>
+        </body>
+        </html>
+        """, log_filename=log_filename), 400
+
+    # =========================
+    # HANDLE LOGO (FINAL, SINGLE SOURCE OF TRUTH)
+    # =========================
+    logo_filename = finalize_logo_from_request(
+        app,
+        ts,
+        logo_file=request.files.get("quiz_logo"),
+        temp_logo_name=temp_logo_name,
+    )
+
+
+    # =========================
+    # REGISTRY ID (CANONICAL)
+    # =========================
+    
+
+
+    # =========================
+    # SAVE QUIZ
+    # =========================
+    source_file = f"quiz_upload_{ts}_{int(time.time() * 1000)}"
+
+    db_quiz_id = save_quiz_to_db(
+        quiz_title,
+        source_file,
+        quiz_data,
+        logo_filename,
+        content_hash=content_hash,
+    )
+
+
+
+
+
+
+   # =========================
+    # SAVE JSON + HTML quiz (kept for UI compatibility)
+    # =========================
+    json_name = f"quiz_{ts}.json"
+    html_name = f"quiz_{ts}.html"
+
+    write_quiz_json(os.path.join(DATA_FOLDER, json_name), quiz_data)
+
+    # =========================
+    # REGISTER QUIZ (AFTER html_name EXISTS)
+    # =========================
+    dprint("[DEBUG] Registering quiz:",
+        html_name,
+        quiz_title,
+        logo_filename)
+
+    add_quiz_to_registry(
+        db_quiz_id,
+        html_name,
+        quiz_title,
+        logo_filename
+    )
+
+
+
+
+    build_quiz_html(
+        html_name,
+        json_name,
+        os.path.join(QUIZ_FOLDER, html_name),
+        get_portal_title(),
+        quiz_title,
+        logo_filename,
+        db_quiz_id
+    )
+
+
+    # FINAL SAFETY: only register logo if file actually exists
+    if logo_filename:
+        final_logo_path = os.path.join(LOGO_FOLDER, logo_filename)
+        if not os.path.exists(final_logo_path):
+            dprint("[LOGO FIX] Prevented registering missing logo:", logo_filename)
+            logo_filename = None
+
+    #add_quiz_to_registry(html_name, quiz_title, logo_filename)
+
+    # The preview has been built; free its cache slot
+    if preview is not None:
+        PREVIEW_CACHE.pop(preview_token)
+
+    return redirect("/library")
+
+
+
+# =========================
+# UPLOAD LIMITS + STREAMING INGESTION
+# =========================
+# Uploads are copied to disk in UPLOAD_CHUNK_SIZE chunks and parsed from a
+# line iterator, so the file is never read into memory whole. .gz, .bz2
+# and .zip uploads are decompressed on the fly while they are parsed.
+# All limits are in MB; 0 turns a limit off.
+import bz2
+import csv
+import gzip
+import io
+import zipfile
+import zlib
+import xml.etree.ElementTree as ET
+from contextlib import ExitStack, contextmanager
+from werkzeug.exceptions import RequestEntityTooLarge
+
+
+def _env_megabytes(name, default):
+    return int(float(os.environ.get(name, default)) * 1024 * 1024)
+
+
+MAX_UPLOAD_BYTES = _env_megabytes("DLMS_MAX_UPLOAD_MB", "256")          # whole request body
+MAX_FORM_FIELD_BYTES = _env_megabytes("DLMS_MAX_FORM_MB", "64")         # one text field (paste box)
+MAX_UPLOAD_TEXT_BYTES = _env_megabytes("DLMS_MAX_UPLOAD_TEXT_MB", "512")  # text after decompression
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES or None
+app.config["MAX_FORM_MEMORY_SIZE"] = MAX_FORM_FIELD_BYTES or None
+
+
+def _megabytes(limit):
+    return limit // (1024 * 1024)
+
+
+@app.errorhandler(413)
+def request_too_large(e):
+    message = e.description
+    if message == RequestEntityTooLarge.description:
+        message = f"Upload too large. The limit is {_megabytes(app.config['MAX_CONTENT_LENGTH'])} MB per request."
+    if request.path.startswith("/api/"):
+        return jsonify({"error": message}), 413
+    return message, 413
 
-    # 5️⃣ If no warnings, say it’s clean
-    if len(smart_suggestions) == 0:
-        add_suggestion(
-            "Formatting Looks Excellent",
-            "No structural or formatting problems detected.",
-            "You can safely continue 👍"
-        )
 
+def _too_large(what, limit):
+    return RequestEntityTooLarge(f"{what} is larger than the {_megabytes(limit)} MB limit.")
 
-    # =========================
-    # UI SUPPORT LOGIC — ensure template displays correctly
-    # =========================
 
-    # If global regex replace enabled but user did not submit rules,
-    # keep replace_rules list empty but still treat engine as active
-    replace_rules = replace_rules_raw.splitlines() if replace_rules_raw else []
+def save_upload_stream(file, path, limit=MAX_UPLOAD_BYTES):
+    """
+    Copy an uploaded FileStorage to path in chunks. Removes the partial
+    file and raises 413 once more than `limit` bytes have arrived.
+    """
+    written = 0
+    too_large = False
 
-    # Make template show replace rules section when enabled globally
-    if regex_replace_enabled and not replace_rules:
-        replace_rules = ["(Regex engine enabled — no manual rules entered)"]
+    with open(path, "wb") as out:
+        while True:
+            chunk = file.stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            written += len(chunk)
+            if limit and written > limit:
+                too_large = True
+                break
+            out.write(chunk)
 
+    if too_large:
+        os.remove(path)
+        raise _too_large("Uploaded file", limit)
 
-    # ---------- RENDER PREVIEW ----------
-    return render_template_string("""
+    return written
 
-<html>
-<head>
-    <title>Preview Before Parsing</title>
-    <link rel="stylesheet" href="/static/style.css">
-    <link rel="icon" href="/static/favicon.ico">
-                              
-</head>
 
-<body>
+def detect_upload_compression(path):
+    """
+    "gzip", "bz2", "zip" or None, from the file's magic bytes (saved
+    uploads carry no extension).
+    """
+    with open(path, "rb") as f:
+        head = f.read(4)
+
+    if head.startswith(b"\x1f\x8b"):
+        return "gzip"
+    if head[:3] == b"BZh" and head[3:4].isdigit():
+        return "bz2"
+    if head == b"PK\x03\x04":
+        # Office documents are zip containers, not archives of an upload
+        try:
+            with zipfile.ZipFile(path) as archive:
+                if "[Content_Types].xml" in archive.namelist():
+                    return None
+        except zipfile.BadZipFile:
+            pass
+        return "zip"
+    return None
 
-  <script>
-    fetch("/config/portal.json")
-    .then(r => r.json())
-    .then(cfg => {
-        if (cfg.background_image) {
-            document.documentElement.style.setProperty(
-                "--portal-bg",
-                `url(${cfg.background_image})`
-            );
+
+def pick_zip_member(archive, extensions=(".txt",)):
+    """
+    First file in a zip archive whose name ends with one of `extensions`,
+    else its first regular file.
+    """
+    files = [
+        info for info in archive.infolist()
+        if not info.is_dir() and not info.filename.startswith("__MACOSX/")
+    ]
+    for info in files:
+        if info.filename.lower().endswith(tuple(extensions)):
+            return info
+    if files:
+        return files[0]
+    raise ValueError("Archive contains no files.")
+
+
+class _LimitedReader(io.RawIOBase):
+    """
+    Raw stream wrapper that raises 413 once more than `limit` bytes of
+    (decompressed) data have been read through it.
+    """
+
+    def __init__(self, raw, limit):
+        self.raw = raw
+        self.limit = limit
+        self.total = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.raw.read(len(buffer))
+        n = len(data)
+        buffer[:n] = data
+        self.total += n
+        if self.limit and self.total > self.limit:
+            raise _too_large("Uploaded text", self.limit)
+        return n
+
+
+class UploadText:
+    """
+    An uploaded file saved at `path`, decompressed on the fly if needed.
+
+    Iterating it yields text lines cleaned by the line stages of
+    UPLOAD_PIPELINE, so literal "\\n" sequences (text exported with
+    escaped newlines) become real line breaks as in paste mode.
+    open_binary() / open_text() give the raw streams for importers that
+    parse a structured format. Every stream enforces `limit` on the
+    decompressed size.
+    """
+
+    def __init__(self, path, limit=MAX_UPLOAD_TEXT_BYTES, cleanup=None):
+        self.path = path
+        self.limit = limit
+        self.cleanup = cleanup or TextCleanup()
+        self.compression = detect_upload_compression(path)
+
+    def member_name(self):
+        """
+        Name of the archive member that is read (zip uploads), else None.
+        """
+        if self.compression != "zip":
+            return None
+        with zipfile.ZipFile(self.path) as archive:
+            return pick_zip_member(archive, import_extensions()).filename
+
+    @contextmanager
+    def open_binary(self):
+        with ExitStack() as stack:
+            if self.compression == "gzip":
+                raw = stack.enter_context(gzip.open(self.path, "rb"))
+            elif self.compression == "bz2":
+                raw = stack.enter_context(bz2.open(self.path, "rb"))
+            elif self.compression == "zip":
+                archive = stack.enter_context(zipfile.ZipFile(self.path))
+                raw = stack.enter_context(archive.open(pick_zip_member(archive, import_extensions())))
+            else:
+                raw = stack.enter_context(open(self.path, "rb"))
+
+            yield io.BufferedReader(_LimitedReader(raw, self.limit), UPLOAD_CHUNK_SIZE)
+
+    @contextmanager
+    def open_text(self, newline=None):
+        with self.open_binary() as raw:
+            yield io.TextIOWrapper(raw, encoding="utf-8", errors="ignore", newline=newline)
+
+    def head(self, size):
+        with self.open_text() as text:
+            return text.read(size)
+
+    def __iter__(self):
+        with self.open_text() as text:
+            yield from run_line_pipeline(text, UPLOAD_PIPELINE, self.cleanup)
+
+
+# Saved upload names that the "already imported" page may post back
+PENDING_UPLOAD_NAME = re.compile(r"^quiz_upload_\d+_\d+$")
+
+# Errors a corrupt, truncated or malformed upload can raise while it is read
+UPLOAD_READ_ERRORS = (
+    OSError, EOFError, ValueError, zipfile.BadZipFile, zlib.error, ET.ParseError, csv.Error
+)
+
+
+# =========================
+# QUIZ IMPORTERS (format registry)
+# =========================
+# Every importer reads an UploadText incrementally and yields questions in
+# the parse_questions format ({"number", "question", "choices", "correct"}),
+# so all formats share save_quiz_to_db and the quiz builder. Importers are
+# tried in registration order: the file extension picks one first, then
+# each sniff() looks at the first IMPORT_SNIFF_CHARS of text, and "text"
+# (the free-text parser) is the fallback.
+QUIZ_IMPORTERS = OrderedDict()
+IMPORT_SNIFF_CHARS = 8192
+IMPORT_LABELS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def quiz_importer(name, label, extensions=(), sniff=None):
+    """
+    Register reader(upload, report) as the importer for `name`.
+    sniff(head) returns True when it recognizes the start of a file.
+    """
+    def register(reader):
+        QUIZ_IMPORTERS[name] = {
+            "label": label,
+            "extensions": tuple(extensions),
+            "sniff": sniff,
+            "reader": reader,
         }
-    });
-    </script>
-                             
+        return reader
 
-<div class="container">
-    
-    <h1 class="hero-title">👀 Preview Quiz Before Building</h1>
+    return register
 
-    <div class="card">
-        <h2>Quiz Title:</h2>
-        <p><b>{{quiz_title}}</b></p>
 
-        <!-- STEP 7: PRE-PROCESS SUMMARY PANEL -->
-<div style="background:#1a1a1a; padding:12px; border-radius:8px; margin-bottom:18px;">
-    <h2>🧪 Pre-Processing Summary</h2>
+def import_extensions():
+    """
+    Every file extension a registered importer claims, e.g. (".txt", ".xml").
+    """
+    return tuple(dict.fromkeys(ext for imp in QUIZ_IMPORTERS.values() for ext in imp["extensions"]))
 
-    <!-- =============================
-          REGEX STRIP + STRIP RULES
-    ============================== -->
-    {% if regex_mode %}
-    <p><b>Regex Strip Mode:</b> Enabled ✔</p>
 
-        {% if strip_rules %}
-        <h3>Lines Removed By Strip Rules</h3>
-        <ul>
-            {% for r in strip_rules %}
-            <li>{{r}}</li>
-            {% endfor %}
-        </ul>
-        {% endif %}
-    {% endif %}
+def detect_quiz_format(upload, filename=""):
+    """
+    Name of the importer for an upload: by extension (the archive member
+    name for zips), else by sniffing the first characters, else "text".
+    """
+    name = (upload.member_name() or filename or "").lower()
+    for suffix in (".gz", ".bz2"):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
 
-    <!-- =============================
-          MANUAL REGEX RULES
-    ============================== -->
-    {% if replace_rules %}
-    <h3>Manual Regex Replace Rules</h3>
-    <ul>
-        {% for r in replace_rules %}
-        <li>{{r}}</li>
-        {% endfor %}
-    </ul>
-    {% endif %}
+    extension = os.path.splitext(name)[1]
+    for fmt, importer in QUIZ_IMPORTERS.items():
+        if extension and extension in importer["extensions"] and fmt != "text":
+            return fmt
 
-    <!-- =============================
-          PRESETS — ONLY IF ANY USED
-    ============================== -->
-    {% if preset_number_prefix_checked or preset_pdf_spacing_checked or preset_headers_checked %}
-    <h3>✨ Regex Presets</h3>
-    <ul>
-        {% if preset_number_prefix_checked %}
-        <li>Number Prefix Removal Enabled ✔</li>
-        {% endif %}
+    head = upload.head(IMPORT_SNIFF_CHARS)
+    for fmt, importer in QUIZ_IMPORTERS.items():
+        if importer["sniff"] and importer["sniff"](head):
+            return fmt
 
-        {% if preset_pdf_spacing_checked %}
-        <li>PDF Line Wrapping Fix Enabled ✔</li>
-        {% endif %}
+    return "text"
 
-        {% if preset_headers_checked %}
-        <li>Header/Footer Cleanup Enabled ✔</li>
-        {% endif %}
-    </ul>
-    {% endif %}
 
-    <!-- =============================
-          RULES THAT ACTUALLY FIRED
-    ============================== -->
-    {% if applied_rules %}
-    <h3>Rules That Actually Changed Text</h3>
-    <ul>
-        {% for r in applied_rules %}
-        <li>✔ {{r}}</li>
-        {% endfor %}
-    </ul>
-    {% endif %}
+def import_quiz(upload, fmt, report=None):
+    """
+    Run importer `fmt` over upload and return the list of questions.
+    """
+    importer = QUIZ_IMPORTERS[fmt]
+    if report is not None:
+        report.info("Import format", importer["label"])
+    return list(importer["reader"](upload, report))
 
-    <!-- =============================
-          INVISIBLE CLEAN
-    ============================== -->
-    {% if invis_cleanup_enabled %}
-    <h3>Invisible Character Cleanup</h3>
 
-        {% if removed_unicode %}
-        <p>Removed:</p>
-        <ul>
-            {% for u in removed_unicode %}
-            <li>{{u}}</li>
-            {% endfor %}
-        </ul>
-        {% else %}
-        <p>No hidden Unicode issues found 🎉</p>
-        {% endif %}
-    {% endif %}
-</div>
+def imported_question(report, index, number, question, choices, correct):
+    """
+    Validate one imported question the way the text parser does (text,
+    at least two choices, at least one correct) and return it in the
+    parse_questions format, or None after logging why it was skipped.
+
+    choices is [(label, text)]; correct is an iterable of labels.
+    """
+    if report is not None:
+        report.blocks += 1
+
+    labels = [label for label, _ in choices]
+    correct = [label for label in dict.fromkeys(correct) if label in labels]
+
+    reason = None
+    if not question:
+        reason = "no question text"
+    elif len(choices) < 2:
+        reason = "not enough choices"
+    elif not correct:
+        reason = "no correct answer found"
+
+    if reason:
+        if report is not None:
+            report.skipped += 1
+            report.warning(f"Skipped #{number}: {reason}", question[:120], block=index)
+        return None
 
+    if report is not None:
+        report.accepted += 1
+        if report.wants("debug"):
+            report.debug(f"Accepted #{number}", f"{len(choices)} choices", question[:150], block=index)
 
-                       <!-- SMART SUGGESTIONS -->
-                    <h3>💡 Smart Suggestions</h3>
+    return QuizQuestion(
+        number,
+        question,
+        [QuizChoice(label, text, label in correct) for label, text in choices],
+        correct,
+    )
 
-                    {% if smart_suggestions and smart_suggestions|length > 0 %}
-                    <ul>
-                    {% for s in smart_suggestions %}
-                    <li style="margin-bottom:10px;">
-                        <b>{{s.title}}</b><br>
-                        <span style="opacity:.85">{{s.detail}}</span><br>
-                        <span style="opacity:.7">Recommendation: {{s.recommend}}</span>
 
-                        {% if s.suggest_rule %}
-                        <br>
-                        <code style="background:#222;padding:4px 6px;border-radius:6px;">
-                            {{s.suggest_rule}}
-                        </code>
-                        {% endif %}
+def _import_skip(report, index, number, reason, detail=""):
+    if report is not None:
+        report.blocks += 1
+        report.skipped += 1
+        report.warning(f"Skipped #{number}: {reason}", detail[:120], block=index)
+
+
+def parse_answer_key(value, choices):
+    """
+    Correct labels from an answer cell/field. Accepts labels ("B", "A,C",
+    "AC"), 1-based positions ("2") or the text of a choice. choices is
+    [(label, text)].
+    """
+    labels = [label for label, _ in choices]
+    value = str(value).strip()
+    if not value:
+        return []
+
+    by_text = {text.strip().lower(): label for label, text in choices}
+    if value.lower() in by_text:
+        return [by_text[value.lower()]]
+
+    tokens = [t for t in re.split(r"[\s,;|/]+", value) if t]
+    found = []
+    for token in tokens:
+        upper = token.upper()
+        if upper.isdigit() and 1 <= int(upper) <= len(labels):
+            found.append(labels[int(upper) - 1])
+        elif upper in labels:
+            found.append(upper)
+        elif upper.isalpha() and all(ch in labels for ch in upper):
+            found.extend(upper)
+        elif token.lower() in by_text:
+            found.append(by_text[token.lower()])
+    return found
+
+
+# ---- Free text (parse_questions) ----
+@quiz_importer("text", "Text (numbered questions)", extensions=(".txt",))
+def read_text_quiz(upload, report):
+    return parse_questions(upload, report=report)
+
+
+# ---- Moodle XML ----
+MOODLE_BLOCK_TAG = re.compile(r"</?(?:p|div|br|li|ul|ol|tr|td|h\d)\b[^>]*>", re.IGNORECASE)
+MOODLE_INLINE_TAG = re.compile(r"<[^>]+>")
+
+
+def _moodle_text(elem, path):
+    node = elem.find(path)
+    if node is None or node.text is None:
+        return ""
+    text = node.text
+    if "<" in text or "&" in text:
+        text = MOODLE_BLOCK_TAG.sub(" ", text)
+        text = html.unescape(MOODLE_INLINE_TAG.sub("", text))
+    return " ".join(text.split())
+
+
+@quiz_importer(
+    "moodle_xml", "Moodle XML", extensions=(".xml",),
+    sniff=lambda head: head.lstrip("\ufeff \t\r\n").startswith(("<?xml", "<quiz")),
+)
+def read_moodle_xml(upload, report):
+    """
+    multichoice and truefalse questions; an answer with fraction > 0 is
+    correct. Other question types are skipped and logged.
+    """
+    index = 0
+    with upload.open_binary() as raw:
+        root = None
+        for event, elem in ET.iterparse(raw, events=("start", "end")):
+            if root is None:
+                root = elem
+            if event != "end" or elem.tag != "question":
+                continue
+
+            qtype = elem.get("type", "")
+            if qtype == "category":
+                root.clear()
+                continue
+
+            index += 1
+            question = _moodle_text(elem, "questiontext/text") or _moodle_text(elem, "name/text")
+
+            if qtype not in ("multichoice", "truefalse"):
+                _import_skip(report, index, index, f"unsupported Moodle type '{qtype}'", question)
+                root.clear()
+                continue
+
+            choices = []
+            correct = []
+            for answer in elem.findall("answer"):
+                if len(choices) == len(IMPORT_LABELS):
+                    break
+                label = IMPORT_LABELS[len(choices)]
+                text = _moodle_text(answer, "text")
+                if qtype == "truefalse":
+                    text = text.capitalize()
+                choices.append((label, text))
+                try:
+                    if float(answer.get("fraction", "0")) > 0:
+                        correct.append(label)
+                except ValueError:
+                    pass
+
+            root.clear()
+
+            q = imported_question(report, index, index, question, choices, correct)
+            if q:
+                yield q
+
+
+# ---- JSON / JSON Lines ----
+def iter_json_values(text, chunk_size=UPLOAD_CHUNK_SIZE):
+    """
+    Yield the elements of a top-level JSON array, or each value of a JSON
+    Lines / concatenated-JSON stream, reading `text` in chunks.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+    in_array = None
+    want = chunk_size
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = text.read(want)
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    while True:
+        while pos < len(buf) and (buf[pos].isspace() or (in_array and buf[pos] == ",")):
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                break
+            fill()
+            continue
+
+        if in_array is None:
+            in_array = buf[pos] == "["
+            if in_array:
+                pos += 1
+            continue
+
+        if in_array and buf[pos] == "]":
+            break
+
+        try:
+            value, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            want *= 2
+            fill()
+            continue
+
+        # A number or literal could continue in the next chunk
+        if end == len(buf) and not eof:
+            fill()
+            continue
+
+        want = chunk_size
+        pos = end
+        yield value
+
+
+def _json_choices(raw, correct):
+    """
+    [(label, text)] and correct labels from a choices list/dict.
+    """
+    choices = []
+    if isinstance(raw, dict):
+        raw = [{"label": k, "text": v} for k, v in raw.items()]
+
+    for item in raw or []:
+        if len(choices) == len(IMPORT_LABELS):
+            break
+        label = IMPORT_LABELS[len(choices)]
+        if isinstance(item, dict):
+            text = item.get("text", item.get("answer", item.get("value", "")))
+            if item.get("is_correct") or item.get("correct") is True:
+                correct.append(label)
+        else:
+            text = item
+        choices.append((label, str(text).strip()))
+    return choices
+
+
+def _json_question(report, index, item):
+    if not isinstance(item, dict):
+        _import_skip(report, index, index, "not a JSON object", repr(item))
+        return None
+
+    number = item.get("number", index)
+    question = str(item.get("question") or item.get("text") or item.get("prompt") or "").strip()
+
+    correct = []
+    choices = _json_choices(item.get("choices") or item.get("options") or item.get("answers"), correct)
+
+    key = item.get("correct", item.get("answer", item.get("correct_answer")))
+    if isinstance(key, bool) or key is None:
+        pass
+    elif isinstance(key, int):
+        # Integer answers are 0-based positions
+        if 0 <= key < len(choices):
+            correct.append(choices[key][0])
+    elif isinstance(key, list):
+        for k in key:
+            if isinstance(k, int) and not isinstance(k, bool):
+                if 0 <= k < len(choices):
+                    correct.append(choices[k][0])
+            else:
+                correct.extend(parse_answer_key(k, choices))
+    else:
+        correct.extend(parse_answer_key(key, choices))
+
+    return imported_question(report, index, number, question, choices, correct)
+
+
+JSON_START = re.compile(r'^\ufeff?\s*(?:\[\s*[\[{"\]]|\{\s*")')
+
+
+@quiz_importer(
+    "json", "JSON / JSON Lines", extensions=(".json", ".jsonl", ".ndjson"),
+    sniff=lambda head: JSON_START.match(head) is not None,
+)
+def read_json_quiz(upload, report):
+    """
+    An array of question objects (a DLMS quiz JSON works as is), one
+    object per line, or {"questions": [...]}. The wrapper form is decoded
+    in one piece; the other two stream.
+    """
+    index = 0
+    with upload.open_text() as text:
+        first = text.read(1)
+        while first and (first.isspace() or first == "\ufeff"):
+            first = text.read(1)
+
+        for value in iter_json_values(_PrefixedText(first, text)):
+            items = [value]
+            if isinstance(value, dict):
+                for key in ("questions", "items", "quiz"):
+                    if isinstance(value.get(key), list):
+                        items = value[key]
+                        break
+
+            for item in items:
+                index += 1
+                q = _json_question(report, index, item)
+                if q:
+                    yield q
 
-                        <!-- APPLY BUTTON -->
-                        <form action="/preview_paste" method="POST" style="margin-top:8px;">
 
-                            <!-- always resend original data -->
-                            <input type="hidden" name="quiz_title" value="{{quiz_title}}">
-                            <textarea name="quiz_text" style="display:none;">{{original}}</textarea>
+class _PrefixedText:
+    """
+    Text stream with `prefix` pushed back in front of it.
+    """
 
-                            <!-- preserve user cleanup fields if they existed -->
-                            <textarea name="strip_text" style="display:none;">
-                    {% for r in strip_rules %}{{r}}
-                    {% endfor %}
-                            </textarea>
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
 
-                            <textarea name="replace_rules" style="display:none;">
-                    {% for r in replace_rules %}{{r}}
-                    {% endfor %}
-                            </textarea>
+    def read(self, size=-1):
+        prefix, self.prefix = self.prefix, ""
+        if size is not None and 0 <= size <= len(prefix):
+            self.prefix = prefix[size:]
+            return prefix[:size]
+        return prefix + self.stream.read(size - len(prefix) if size and size > 0 else -1)
 
-                            <!-- turn on correct preset -->
-                            {% if "PDF" in s.title %}
-                                <input type="hidden" name="preset_pdf_spacing" value="1">
-                            {% endif %}
 
-                            {% if "Number" in s.title %}
-                                <input type="hidden" name="preset_number_prefix" value="1">
-                            {% endif %}
+# ---- CSV / TSV ----
+CSV_QUESTION_COLUMNS = {"question", "question_text", "questiontext", "question text", "prompt", "stem", "text"}
+CSV_ANSWER_COLUMNS = {"correct", "answer", "answers", "correct_answer", "correct answer",
+                      "correct_answers", "correct answers", "key", "answer key"}
+CSV_NUMBER_COLUMNS = {"number", "#", "no", "no.", "question_number", "question number", "id"}
+CSV_CHOICES_COLUMNS = {"choices", "options"}
+CSV_CHOICE_COLUMN = re.compile(r"^(?:(?:choice|option|answer)[\s_]*)?([a-z]|\d{1,2})$")
 
-                            {% if "Header" in s.title or "Footer" in s.title %}
-                                <input type="hidden" name="preset_headers" value="1">
-                            {% endif %}
 
-                            <button type="submit">⚙ Apply This Fix</button>
-                        </form>
+def _csv_header(row):
+    """
+    Column roles for a header row, or None when row is not a header.
+    """
+    cells = [c.strip().lower() for c in row]
+    if not any(c in CSV_QUESTION_COLUMNS for c in cells):
+        return None
 
-                    </li>
-                    {% endfor %}
-                    </ul>
-                    {% else %}
-                    <p>No suggestions — formatting already looks great 🎯</p>
-                    {% endif %}
+    roles = {"question": None, "answer": None, "number": None, "choices": None, "choice_columns": []}
+    for i, cell in enumerate(cells):
+        if cell in CSV_QUESTION_COLUMNS and roles["question"] is None:
+            roles["question"] = i
+        elif cell in CSV_ANSWER_COLUMNS and roles["answer"] is None:
+            roles["answer"] = i
+        elif cell in CSV_NUMBER_COLUMNS and roles["number"] is None:
+            roles["number"] = i
+        elif cell in CSV_CHOICES_COLUMNS:
+            roles["choices"] = i
+        elif CSV_CHOICE_COLUMN.match(cell):
+            roles["choice_columns"].append(i)
+    return roles
+
+
+def _csv_looks_like_header(head):
+    first = head.lstrip("\ufeff").split("\n", 1)[0]
+    for delimiter in (",", "\t", ";"):
+        if delimiter in first and _csv_header(next(csv.reader([first], delimiter=delimiter))):
+            return True
+    return False
+
+
+@quiz_importer("csv", "CSV / TSV", extensions=(".csv", ".tsv"), sniff=_csv_looks_like_header)
+def read_csv_quiz(upload, report):
+    """
+    One question per row. With a header row the columns are found by
+    name (question, A/B/C.. or option_1.., answer, number, or one
+    "choices" column split on "|"). Without one, the row is
+    [number,] question, choices..., answer.
+    """
+    head = upload.head(IMPORT_SNIFF_CHARS).lstrip("\ufeff")
+    try:
+        dialect = csv.Sniffer().sniff(head.split("\n", 1)[0] or ",", delimiters=",;\t|")
+        delimiter = dialect.delimiter
+    except csv.Error:
+        delimiter = ","
+
+    index = 0
+    roles = None
+    with upload.open_text(newline="") as text:
+        for row_number, row in enumerate(csv.reader(text, delimiter=delimiter), 1):
+            if row_number == 1:
+                if row:
+                    row[0] = row[0].lstrip("\ufeff")
+                roles = _csv_header(row)
+                if roles:
+                    continue
+
+            if not any(cell.strip() for cell in row):
+                continue
 
+            index += 1
+            cells = [" ".join(cell.split()) for cell in row]
+            number = index
 
-        </div>
-        <!-- END SUMMARY -->
+            if roles:
+                def cell(i):
+                    return cells[i] if i is not None and i < len(cells) else ""
 
-        <h2>Original Text</h2>
-        <pre id="origBox" style="background:black;padding:10px;border-radius:8px;white-space:pre-wrap;">{{original}}</pre>
+                if cell(roles["number"]).isdigit():
+                    number = int(cell(roles["number"]))
+                question = cell(roles["question"])
+                if roles["choices"] is not None:
+                    texts = [t.strip() for t in cell(roles["choices"]).split("|")]
+                else:
+                    texts = [cell(i) for i in roles["choice_columns"]]
+                key = cell(roles["answer"])
+            else:
+                if len(cells) > 3 and cells[0].isdigit():
+                    number = int(cells[0])
+                    cells = cells[1:]
+                question, texts, key = cells[0], cells[1:-1], cells[-1] if len(cells) > 1 else ""
 
-        <h2>Text To Be Parsed: (passed to quiz)</h2>
-        <pre id="cleanBox" style="background:#102020;padding:10px;border-radius:8px;white-space:pre-wrap;">{{cleaned}}</pre>
+            texts = [t for t in texts if t][:len(IMPORT_LABELS)]
+            choices = list(zip(IMPORT_LABELS, texts))
 
-        <br>
-        <button onclick="toggleInvisible()" style="margin-top:5px;">
-            👁 Show / Hide Invisible Characters
-        </button>
+            q = imported_question(report, index, number, question, choices, parse_answer_key(key, choices))
+            if q:
+                yield q
 
-        <p style="opacity:.7">
-            This helps detect BOM, zero-width, Unicode junk, and newline issues.
-        </p>
 
-        <div id="visualPanel" style="display:none; margin-top:15px;">
-            <h2>🔍 Visualized Text</h2>
+# ---- GIFT (Moodle) ----
+GIFT_FORMAT_PREFIX = re.compile(r"^\[(?:html|moodle|plain|markdown)\]", re.IGNORECASE)
+GIFT_ESCAPE = re.compile(r"\\([~=#{}:\\n])")
+GIFT_WEIGHT = re.compile(r"^%(-?\d+(?:\.\d+)?)%")
 
-            <h3>Original Input</h3>
-            <pre id="visualOrig" style="background:#222;padding:10px;border-radius:8px;white-space:pre-wrap;"></pre>
 
-            <h3>Parsed (Cleaned) Version</h3>
-            <pre id="visualClean" style="background:#333;padding:10px;border-radius:8px;white-space:pre-wrap;"></pre>
-        </div>
+def _gift_unescape(text):
+    text = GIFT_FORMAT_PREFIX.sub("", text.strip())
+    text = GIFT_ESCAPE.sub(lambda m: "\n" if m.group(1) == "n" else m.group(1), text)
+    return " ".join(text.split())
 
-        <script>
-        function visualize(text) {
-            return text
-                .replace(/\\u200B/g, "[ZWSP]")
-                .replace(/\\u200C/g, "[ZWNJ]")
-                .replace(/\\u200D/g, "[ZWJ]")
-                .replace(/\\u2060/g, "[WJ]")
-                .replace(/\\uFEFF/g, "[BOM]")
-                .replace(/ /g, "·")
-                .replace(/\\n/g, "\\\\n\\n");
-        }
 
-        function toggleInvisible() {
-            const panel = document.getElementById("visualPanel");
-            const show = panel.style.display === "none";
+def _gift_split(text, marks):
+    """
+    Split text before every unescaped character in marks; returns
+    [(mark or "", piece)].
+    """
+    parts = []
+    current = []
+    mark = ""
+    escaped = False
+    for ch in text:
+        if escaped:
+            current.append("\\" + ch)
+            escaped = False
+        elif ch == "\\":
+            escaped = True
+        elif ch in marks:
+            parts.append((mark, "".join(current)))
+            current = []
+            mark = ch
+        else:
+            current.append(ch)
+    parts.append((mark, "".join(current)))
+    return parts
 
-            if (show) {
-                document.getElementById("visualOrig").innerText =
-                    visualize(document.getElementById("origBox").innerText);
 
-                document.getElementById("visualClean").innerText =
-                    visualize(document.getElementById("cleanBox").innerText);
-            }
+def _gift_question(report, index, block):
+    block = re.sub(r"^\s*::(?:\\.|[^:])*::", "", block, count=1)
 
-            panel.style.display = show ? "block" : "none";
-        }
-        </script>
+    pieces = _gift_split(block, "{}")
+    if len(pieces) < 3 or pieces[1][0] != "{" or pieces[2][0] != "}":
+        _import_skip(report, index, index, "no {answer} section", block)
+        return None
 
-        <!-- 🔍 DIFF VIEW -->
-        <button onclick="toggleDiff()" style="margin-top:10px;">
-            🔍 Show / Hide Differences
-        </button>
+    question = _gift_unescape(pieces[0][1] + " " + "".join(p for _, p in pieces[2:]))
+    answers = pieces[1][1].strip()
 
-        <div id="diffPanel" style="display:none; margin-top:15px;">
-            <h2>⚖️ Text Differences</h2>
+    # Feedback after an unescaped '#' is dropped, answer by answer
+    if answers.startswith("#"):
+        _import_skip(report, index, index, "numeric GIFT question", question)
+        return None
 
-            <h3>Original vs Cleaned Comparison</h3>
-            <pre id="diffView"
-                 style="background:#252525;padding:10px;border-radius:8px;white-space:pre-wrap;"></pre>
+    tf = _gift_split(answers, "#")[0][1].strip().upper()
+    if tf in ("T", "TRUE", "F", "FALSE"):
+        choices = [("A", "True"), ("B", "False")]
+        return imported_question(report, index, index, question, choices,
+                                 ["A" if tf.startswith("T") else "B"])
 
-            <p style="opacity:.7">
-                <span style="color:#4cff4c;font-weight:bold;">Green</span> = added ·
-                <span style="color:#ff4c4c;font-weight:bold;">Red</span> = removed
-            </p>
+    choices = []
+    correct = []
+    for mark, text in _gift_split(answers, "=~"):
+        if not mark:
+            continue
+        text = _gift_split(text, "#")[0][1]
+        if "->" in text:
+            _import_skip(report, index, index, "matching GIFT question", question)
+            return None
 
-        </div>
+        weight = GIFT_WEIGHT.match(text.strip())
+        if weight:
+            text = text.strip()[weight.end():]
+        if len(choices) == len(IMPORT_LABELS):
+            break
 
-        <script>
-function toggleDiff() {
-    const panel = document.getElementById("diffPanel");
-    const show = panel.style.display === "none";
-    if (show) runDiff();
-    panel.style.display = show ? "block" : "none";
-}
+        label = IMPORT_LABELS[len(choices)]
+        choices.append((label, _gift_unescape(text)))
+        if mark == "=" or (weight and float(weight.group(1)) > 0):
+            correct.append(label)
 
-function normalizeKey(s) {
-    return (s || "")
-        .replace(/\\r/g, "")
-        .replace(/[\\u200B\\u200C\\u200D\\u2060]/g, "")
-        .replace(/\\uFEFF/g, "")
-        .replace(/\\u00A0/g, " ")
-        .replace(/\\s+/g, " ")
-        .trim();
-}
+    if choices and len(correct) == len(choices) and not any(m == "~" for m, _ in _gift_split(answers, "=~")):
+        _import_skip(report, index, index, "short-answer GIFT question", question)
+        return None
 
-function runDiff() {
-    const origLines = document.getElementById("origBox").innerText
-        .split("\\n")
-        .map(normalizeKey)
-        .filter(Boolean);
+    return imported_question(report, index, index, question, choices, correct)
 
-    const cleanLines = document.getElementById("cleanBox").innerText
-        .split("\\n")
-        .map(normalizeKey)
-        .filter(Boolean);
 
-    let out = "";
+@quiz_importer(
+    "gift", "GIFT (Moodle)", extensions=(".gift",),
+    sniff=lambda head: re.search(r"\{\s*(?:[=~]|T(?:RUE)?\s*\}|F(?:ALSE)?\s*\})", head) is not None,
+)
+def read_gift_quiz(upload, report):
+    """
+    Multiple choice (=right ~wrong, ~%50%partial) and true/false
+    questions, one per blank-line separated block. Short-answer,
+    numeric and matching questions are skipped and logged.
+    """
+    index = 0
+    block = []
+    depth = 0
+
+    def flush():
+        nonlocal index
+        text = "\n".join(block).strip()
+        block.clear()
+        if text:
+            index += 1
+            return _gift_question(report, index, text)
+        return None
 
-    // REMOVED
-    for (const line of origLines) {
-        if (!cleanLines.includes(line)) {
-            out += "<span class='diff-removed'>[REMOVED] " + line + "</span><br>";
+    with upload.open_text() as text:
+        for line in text:
+            stripped = line.strip()
+            if depth == 0 and (stripped.startswith("//") or stripped.startswith("$CATEGORY:")):
+                continue
 
+            if not stripped and depth == 0:
+                q = flush()
+                if q:
+                    yield q
+                continue
 
-        }
-    }
+            block.append(line.rstrip("\n"))
+            for mark, _ in _gift_split(line, "{}"):
+                if mark == "{":
+                    depth += 1
+                elif mark == "}":
+                    depth = max(0, depth - 1)
 
-    // ADDED
-    for (const line of cleanLines) {
-        if (!origLines.includes(line)) {
-            out += "<span class='diff-added'>[ADDED] " + line + "</span><br>";
+    q = flush()
+    if q:
+        yield q
 
 
-        }
-    }
+# ---- Aiken (Moodle) ----
+AIKEN_ANSWER = re.compile(r"^ANSWER:\s*([A-Z](?:\s*,\s*[A-Z])*)\s*$")
 
-    if (!out.trim()) {
-        out = "No structural differences detected.";
-    }
 
-    document.getElementById("diffView").innerHTML = out;
-}
-</script>
+@quiz_importer(
+    "aiken", "Aiken", extensions=(".aiken",),
+    sniff=lambda head: re.search(r"(?m)^ANSWER:\s*[A-Z]\s*$", head) is not None,
+)
+def read_aiken_quiz(upload, report):
+    """
+    Question line(s), "A. choice" / "A) choice" lines, then "ANSWER: B".
+    """
+    index = 0
+    q_lines = []
+    choices = []
 
+    with upload.open_text() as text:
+        for line in text:
+            line = line.strip()
+            if not line:
+                continue
 
+            answer = AIKEN_ANSWER.match(line)
+            if answer:
+                index += 1
+                question = " ".join(q_lines)
+                q = imported_question(report, index, index, question, choices,
+                                      re.findall(r"[A-Z]", answer.group(1)))
+                if q:
+                    yield q
+                q_lines, choices = [], []
+                continue
 
-        {% if conf_details %}
-        <h2>🧠 Confidence Analysis</h2>
-        <p>
-            <b>Total blocks:</b> {{conf_summary.total}}<br>
-            ✅ High: {{conf_summary.high}} &nbsp;
-            ⚠ Medium: {{conf_summary.medium}} &nbsp;
-            ❌ Low: {{conf_summary.low}}
-        </p>
+            choice = CHOICE_LINE_RE.match(line)
+            if choice and q_lines:
+                choices.append((choice.group(1).upper(), choice.group(2).strip()))
+                continue
 
-        <ul>
-            {% for item in conf_details %}
-            <li style="margin-bottom:8px;">
-                <b>Block {{item.index}} ({{item.confidence|capitalize}})</b><br>
-                <span style="opacity:.85">{{item.title}}</span><br>
-                <span style="opacity:.6; font-size:12px;">{{item.reason}}</span>
-            </li>
-            {% endfor %}
-        </ul>
-        {% endif %}
+            if choices:
+                # Text after choices without an ANSWER line starts a new question
+                index += 1
+                _import_skip(report, index, index, "no ANSWER line", " ".join(q_lines))
+                q_lines, choices = [], []
+            q_lines.append(line)
 
-        <p style="opacity:.7">
-            If this looks correct, continue. Otherwise, go back and adjust rules.
-        </p>
+    if q_lines:
+        index += 1
+        _import_skip(report, index, index, "no ANSWER line", " ".join(q_lines))
 
-        <form action="/download_cleaned" method="POST" style="display:inline;">
-            <textarea name="clean_text" style="display:none;">{{cleaned}}</textarea>
-            <button type="submit">📥 Download Cleaned Text</button>
-        </form>
 
-        <!-- IMPORTANT: Send CLEANED text forward -->
-        <form action="/process_paste" method="POST">
-            <input type="hidden" name="quiz_title" value="{{ quiz_title }}">
-            <input type="hidden" name="temp_logo_name" value="{{ preview_logo_name }}">
-            <textarea name="quiz_text" style="display:none;">{{ cleaned }}</textarea>
+# =========================
+# PDF / DOCX INGESTION
+# =========================
+# PDF pages are extracted with pypdf's layout mode (optional dependency,
+# pure Python like waitress), which keeps indentation and turns vertical
+# gaps into blank lines. Large PDFs are split into page ranges and
+# extracted in a process pool. The pages are then:
+#   1. stripped of lines that repeat at the top/bottom of most pages
+#      (running headers, footers, page numbers), and
+#   2. rejoined where a line was wrapped by the layout (no vertical gap,
+#      previous line reaches the right margin or the next one is indented,
+#      and the next line is not a question, choice or answer line).
+# DOCX is read with zipfile + iterparse; Word list numbering is rendered
+# ("1.", "A.") so auto-numbered questions and choices still parse. Page
+# headers/footers live in separate parts of a DOCX and are never read.
+DOCUMENT_EXTRACT_PROCESSES = (
+    int(os.environ.get("DLMS_EXTRACT_PROCESSES", "0")) or min(4, os.cpu_count() or 1)
+)
+DOCUMENT_PARALLEL_MIN_PAGES = 16
+DOCUMENT_PAGES_PER_TASK = 8
+DOCUMENT_EDGE_LINES = 3          # lines at the top/bottom of a page that may be header/footer
+DOCUMENT_REPEAT_SHARE = 0.6      # ... when they repeat on this share of pages
+DOCUMENT_WRAP_FILL = 0.75        # a line this close to the right margin was wrapped
 
-            <button type="submit">✅ Yes, Build My Quiz</button>
-        </form>
+DOCUMENT_ANSWER_LINE = re.compile(r"^\s*(?:correct|suggested)\s+answer\b|^\s*answer\s*:", re.IGNORECASE)
+DOCUMENT_EDGE_DIGITS = re.compile(r"\d+")
 
+_document_pool = None
+_document_pool_lock = threading.Lock()
+# Futures submitted to the pool and not finished yet, for /metrics
+_document_tasks = set()
 
-        <br>
-        <button onclick="history.back()">⬅ Go Back & Edit</button>
-        <button onclick="location.href='/'">🏠 Return To Portal</button>
-    </div>
-</div>
-</body>
-</html>
-""",
 
-        quiz_title=quiz_title,
-        original=quiz_text,
-        cleaned=clean_text,
-        conf_summary=conf_summary,
-        conf_details=conf_details,
-        preview_logo_name=preview_logo_name,
-        regex_mode=regex_mode,
-        strip_rules=strip_rules,
-        replace_rules=replace_rules,
-        applied_rules=applied_rules,
-        invis_cleanup_enabled=invis_cleanup_enabled,
-        removed_unicode=removed_unicode,
-        preset_number_prefix_checked=preset_number_prefix_checked,
-        preset_pdf_spacing_checked=preset_pdf_spacing_checked,
-        preset_headers_checked=preset_headers_checked,
-        smart_suggestions=smart_suggestions
-        )
+class DocumentExtractError(ValueError):
+    pass
 
 
+def _require_pypdf():
+    try:
+        import pypdf
+    except ImportError:
+        raise DocumentExtractError("PDF import needs the pypdf package (pip install pypdf).")
+    return pypdf
 
 
+def _extract_pdf_pages(path, start, stop):
+    """
+    Layout text of pages [start, stop). Runs in a pool worker.
+    """
+    pypdf = _require_pypdf()
+    reader = pypdf.PdfReader(path)
+    return [
+        reader.pages[i].extract_text(extraction_mode="layout") or ""
+        for i in range(start, stop)
+    ]
 
 
+def _get_document_pool():
+    global _document_pool
+    with _document_pool_lock:
+        if _document_pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
 
+            # spawn: forking a threaded server can copy held locks
+            _document_pool = ProcessPoolExecutor(
+                max_workers=DOCUMENT_EXTRACT_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _document_pool
 
 
+def _document_task_done(future):
+    with _document_pool_lock:
+        _document_tasks.discard(future)
 
 
-from flask import send_file
-from io import BytesIO
+def submit_document_task(pool, fn, *args):
+    """
+    pool.submit(fn, *args), counted in the document pool gauges until the
+    task finishes.
+    """
+    future = pool.submit(fn, *args)
+    with _document_pool_lock:
+        _document_tasks.add(future)
+    future.add_done_callback(_document_task_done)
+    return future
 
-@app.route("/download_cleaned", methods=["GET","POST"])
-def download_cleaned():
-    cleaned = request.form.get("clean_text", "").strip()
 
-    if not cleaned:
-        return "No cleaned text available.", 400
+def document_pool_load():
+    """
+    (queued, running) tasks of the document pool. A task counts as
+    running once the executor has handed it to its call queue, which
+    holds at most one task more than there are workers.
+    """
+    with _document_pool_lock:
+        running = sum(1 for future in _document_tasks if future.running())
+        return len(_document_tasks) - running, running
 
-    buf = BytesIO()
-    buf.write(cleaned.encode("utf-8"))
-    buf.seek(0)
 
-    return send_file(
-        buf,
-        mimetype="text/plain",
-        as_attachment=True,
-        download_name="cleaned_quiz_text.txt"
-    )
+def extract_pdf_page_texts(path):
+    """
+    One layout-text string per page, extracted in parallel for large PDFs.
+    """
+    global _document_pool
+    pypdf = _require_pypdf()
+
+    try:
+        page_count = len(pypdf.PdfReader(path).pages)
 
+        if DOCUMENT_EXTRACT_PROCESSES > 1 and page_count >= DOCUMENT_PARALLEL_MIN_PAGES:
+            from concurrent.futures.process import BrokenProcessPool
 
+            ranges = [
+                (start, min(start + DOCUMENT_PAGES_PER_TASK, page_count))
+                for start in range(0, page_count, DOCUMENT_PAGES_PER_TASK)
+            ]
+            pool = _get_document_pool()
+            try:
+                futures = [
+                    submit_document_task(pool, _extract_pdf_pages, path, start, stop)
+                    for start, stop in ranges
+                ]
+                return [text for future in futures for text in future.result()]
+            except BrokenProcessPool:
+                print("[DOCUMENT] Extraction pool broke; extracting in-process")
+                with _document_pool_lock:
+                    _document_pool = None
 
+        return _extract_pdf_pages(path, 0, page_count)
+    except pypdf.errors.PyPdfError as e:
+        raise DocumentExtractError(f"Not a readable PDF: {e}")
 
-# =========================
-# PROCESS PASTED QUIZ
-# =========================
-@app.route("/process_paste", methods=["POST"])
-def process_paste():
-    #cleanup_temp_logos()   # 🧹 clean abandoned logos again
 
-    quiz_text = request.form.get("quiz_text", "").strip()
-    quiz_title = request.form.get("quiz_title", "Generated Quiz From Paste")
+def _edge_key(line):
+    return DOCUMENT_EDGE_DIGITS.sub("#", " ".join(line.lower().split()))
 
-    # Checkbox flag (Auto Junk Cleanup)
-    auto_cleanup = request.form.get("auto_cleanup") == "1"
 
-    if not quiz_text:
-        return "No text provided.", 400
+def strip_repeated_page_edges(pages):
+    """
+    pages is a list of line lists. Drops lines in the first/last
+    DOCUMENT_EDGE_LINES non-blank lines of a page whose digit-normalized
+    text appears there on at least DOCUMENT_REPEAT_SHARE of the pages.
+    Question, choice and answer lines are never treated as edges (an
+    answer line repeats whenever a page ends on one). Returns
+    (pages, removed_count).
+    """
+    if len(pages) < 2:
+        return pages, 0
+
+    edges = []
+    counts = Counter()
+    for lines in pages:
+        filled = [i for i, line in enumerate(lines) if line.strip()]
+        zone = {
+            i for i in filled[:DOCUMENT_EDGE_LINES] + filled[-DOCUMENT_EDGE_LINES:]
+            if not _is_structural_line(lines[i].strip())
+        }
+        edges.append(zone)
+        counts.update({_edge_key(lines[i]) for i in zone})
+
+    needed = max(2, math.ceil(len(pages) * DOCUMENT_REPEAT_SHARE))
+    repeated = {key for key, n in counts.items() if n >= needed}
+    if not repeated:
+        return pages, 0
+
+    removed = 0
+    result = []
+    for lines, zone in zip(pages, edges):
+        kept = []
+        for i, line in enumerate(lines):
+            if i in zone and _edge_key(line) in repeated:
+                removed += 1
+                continue
+            kept.append(line)
+        result.append(kept)
+    return result, removed
 
-    clean_text = quiz_text
 
-    # Normalize ALL newline styles (Windows, Linux, Literal \n)
-    clean_text = (
-        clean_text
-        .replace("\\r\\n", "\n")
-        .replace("\\n", "\n")
-        .replace("\r\n", "\n")
-        .replace("\r", "\n")
+def _is_structural_line(text):
+    return bool(
+        QUESTION_START_LINE.match(text)
+        or CHOICE_LINE_RE.match(text)
+        or DOCUMENT_ANSWER_LINE.match(text)
     )
 
-    # Optional auto cleanup (only runs if you wire a checkbox)
-    if auto_cleanup:
-        cleaned_lines = []
-        junk_patterns = [
-            "topic",
-            "chapter",
-            "exam version",
-            "objective",
-            "learning goal",
-            "case study",
-            "scenario",
-            "explanation",
-            "rationale",
-            "reference",
-            "page",
-        ]
-
-        for line in clean_text.splitlines():
-            stripped = line.strip()
-            if not stripped:
-                continue
-            low = stripped.lower()
-            if any(p in low for p in junk_patterns):
-                continue
-            cleaned_lines.append(line)
 
-        clean_text = "\n".join(cleaned_lines)
+def rejoin_layout_lines(lines):
+    """
+    Join layout lines that were wrapped. A blank line (vertical gap)
+    always ends a paragraph.
+    """
+    widths = sorted(len(line.rstrip()) for line in lines if line.strip())
+    if not widths:
+        return []
+    right_margin = widths[int(len(widths) * 0.9)]
 
-    # Save cleaned text (for debugging / consistency)
-    path = os.path.join(UPLOAD_FOLDER, "pasted.txt")
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(clean_text)
+    out = []
+    prev_width = 0
+    para_indent = 0
 
-    # =========================
-    # PARSE QUIZ
-    # =========================
-    quiz_data = parse_questions(clean_text)
+    for line in lines:
+        text = line.strip()
+        if not text:
+            if out and out[-1]:
+                out.append("")
+            prev_width = 0
+            continue
 
-    # Always save a parse log (success or failure)
-    ts = int(time.time())
-    log_filename = f"parse_log_{ts}.txt"
-    with open(os.path.join(DATA_FOLDER, log_filename), "w", encoding="utf-8") as f:
-        f.write("\n".join(PARSE_LOG))
+        indent = len(line) - len(line.lstrip())
+        joinable = (
+            out and out[-1]
+            and prev_width
+            and not _is_structural_line(text)
+            and not DOCUMENT_ANSWER_LINE.match(out[-1])
+            and (prev_width >= right_margin * DOCUMENT_WRAP_FILL or indent > para_indent)
+        )
 
-    # If no questions parsed, show failure UI + log link
-    if not quiz_data:
-        return render_template_string("""
-        <html>
-        <head>
-            <title>Parse Failed</title>
-            <link rel="stylesheet" href="/static/style.css">
-            <link rel="icon" href="/static/favicon.ico">
-        </head>
-        <body>
-        <script>
-        fetch("/config/portal.json")
-        .then(r => r.json())
-        .then(cfg => {
-            if (cfg.background_image) {
-                document.documentElement.style.setProperty(
-                    "--portal-bg",
-                    `url(${cfg.background_image})`
-                );
-            }
-        });
-        </script>
+        if joinable:
+            if out[-1].endswith("-") and text[:1].islower():
+                out[-1] = out[-1][:-1] + text
+            else:
+                out[-1] = out[-1] + " " + text
+        else:
+            out.append(text)
+            para_indent = indent
 
-        <div class="container">
-            <h1 class="hero-title">⚠️ Could Not Parse Any Questions</h1>
+        prev_width = len(line.rstrip())
 
-            <div class="card">
-                <p>No valid questions were parsed. Please check the formatting.</p>
-                <p>You can download the parser log for troubleshooting:</p>
+    return out
 
-                <button onclick="location.href='/data/{{log_filename}}'">
-                    📥 Download Parse Log
-                </button>
 
-                <br><br>
+def extract_pdf_lines(path, report=None):
+    pages = [text.split("\n") for text in extract_pdf_page_texts(path)]
+    pages, removed = strip_repeated_page_edges(pages)
 
-                <button onclick="location.href='/upload'">
-                    ⬅ Back To Upload Page
-                </button>
+    if report is not None:
+        report.info("PDF pages extracted", len(pages))
+        report.info("Repeated header/footer lines removed", removed)
 
-                <button onclick="location.href='/paste'">
-                    📋 Try Paste Mode Instead
-                </button>
+    lines = []
+    for page in pages:
+        lines.extend(rejoin_layout_lines(page))
+        lines.append("")
+    return lines
 
-                <button onclick="location.href='/'">
-                    🏠 Return To Portal
-                </button>
-            </div>
-        </div>
-        </body>
-        </html>
-        """, log_filename=log_filename), 400
 
-    # =========================
-    # HANDLE LOGO (FINAL, SINGLE SOURCE OF TRUTH)
-    # =========================
-    logo_filename = finalize_logo_from_request(
-        app,
-        ts,
-        logo_file=request.files.get("quiz_logo"),
-        temp_logo_name=request.form.get("temp_logo_name"),
-    )
+# ---- DOCX ----
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
 
 
-    # =========================
-    # REGISTRY ID (CANONICAL)
-    # =========================
-    
+def _roman(n):
+    out = ""
+    for value, numeral in ((1000, "m"), (900, "cm"), (500, "d"), (400, "cd"), (100, "c"), (90, "xc"),
+                           (50, "l"), (40, "xl"), (10, "x"), (9, "ix"), (5, "v"), (4, "iv"), (1, "i")):
+        while n >= value:
+            out += numeral
+            n -= value
+    return out
 
 
-    # =========================
-    # SAVE QUIZ
-    # =========================
-    source_file = f"quiz_upload_{ts}_{int(time.time() * 1000)}"
+def _format_list_number(fmt, n):
+    if fmt in ("upperLetter", "lowerLetter"):
+        letter = chr(ord("A") + (n - 1) % 26) * ((n - 1) // 26 + 1)
+        return letter if fmt == "upperLetter" else letter.lower()
+    if fmt in ("upperRoman", "lowerRoman"):
+        return _roman(n).upper() if fmt == "upperRoman" else _roman(n)
+    if fmt == "bullet":
+        return "-"
+    return str(n)
 
-    db_quiz_id = save_quiz_to_db(
-        quiz_title,
-        source_file,
-        quiz_data,
-        logo_filename
-    )
 
+def _docx_numbering(archive):
+    """
+    numId -> {ilvl: (numFmt, lvlText, start)} from word/numbering.xml.
+    """
+    try:
+        root = ET.fromstring(archive.read("word/numbering.xml"))
+    except KeyError:
+        return {}
+
+    def val(node, tag, default):
+        child = node.find(W_NS + tag)
+        return child.get(W_NS + "val", default) if child is not None else default
+
+    abstract = {}
+    for node in root.findall(W_NS + "abstractNum"):
+        levels = {}
+        for lvl in node.findall(W_NS + "lvl"):
+            ilvl = int(lvl.get(W_NS + "ilvl", "0"))
+            levels[ilvl] = (
+                val(lvl, "numFmt", "decimal"),
+                val(lvl, "lvlText", f"%{ilvl + 1}."),
+                int(val(lvl, "start", "1")),
+            )
+        abstract[node.get(W_NS + "abstractNumId")] = levels
 
+    numbering = {}
+    for node in root.findall(W_NS + "num"):
+        numbering[node.get(W_NS + "numId")] = abstract.get(val(node, "abstractNumId", None), {})
+    return numbering
 
 
+def _docx_paragraph_text(p):
+    parts = []
+    for node in p.iter():
+        tag = node.tag
+        if tag == W_NS + "t" and node.text:
+            parts.append(node.text)
+        elif tag == W_NS + "tab":
+            parts.append("\t")
+        elif tag in (W_NS + "br", W_NS + "cr"):
+            parts.append("\n")
+    return "".join(parts)
 
 
-   # =========================
-    # SAVE JSON + HTML quiz (kept for UI compatibility)
-    # =========================
-    json_name = f"quiz_{ts}.json"
-    html_name = f"quiz_{ts}.html"
+def iter_docx_lines(path):
+    """
+    Text lines of word/document.xml, one paragraph at a time, with list
+    numbering rendered as text.
+    """
+    with zipfile.ZipFile(path) as archive:
+        try:
+            archive.getinfo("word/document.xml")
+        except KeyError:
+            raise DocumentExtractError("Not a Word document (word/document.xml is missing).")
+
+        numbering = _docx_numbering(archive)
+        counters = {}
+
+        with archive.open("word/document.xml") as document:
+            for event, elem in ET.iterparse(document, events=("end",)):
+                if elem.tag != W_NS + "p":
+                    continue
+
+                prefix = ""
+                num_pr = elem.find(f"{W_NS}pPr/{W_NS}numPr")
+                if num_pr is not None:
+                    num_id = num_pr.find(W_NS + "numId")
+                    ilvl = num_pr.find(W_NS + "ilvl")
+                    num_id = num_id.get(W_NS + "val") if num_id is not None else None
+                    ilvl = int(ilvl.get(W_NS + "val", "0")) if ilvl is not None else 0
+                    levels = numbering.get(num_id)
+
+                    if levels and ilvl in levels:
+                        counts = counters.setdefault(num_id, {})
+                        fmt, template, start = levels[ilvl]
+                        counts[ilvl] = counts.get(ilvl, start - 1) + 1
+                        for deeper in [k for k in counts if k > ilvl]:
+                            del counts[deeper]
+
+                        prefix = template
+                        for level, (level_fmt, _, level_start) in levels.items():
+                            prefix = prefix.replace(
+                                f"%{level + 1}",
+                                _format_list_number(level_fmt, counts.get(level, level_start))
+                            )
+                        prefix = prefix.strip() + " " if fmt != "bullet" else "- "
+
+                text = _docx_paragraph_text(elem)
+                elem.clear()
+
+                lines = text.split("\n")
+                lines[0] = prefix + lines[0]
+                yield from lines
+
+
+# ---- Registry + preview entry point ----
+@contextmanager
+def upload_local_path(upload):
+    """
+    A real file path for upload: the saved file itself, or a decompressed
+    temporary copy for .gz/.bz2/.zip uploads.
+    """
+    if upload.compression is None:
+        yield upload.path
+        return
 
-    with open(os.path.join(DATA_FOLDER, json_name), "w", encoding="utf-8") as f:
-        json.dump(quiz_data, f, indent=4)
+    import tempfile
 
-    # =========================
-    # REGISTER QUIZ (AFTER html_name EXISTS)
-    # =========================
-    dprint("[DEBUG] Registering quiz:",
-        html_name,
-        quiz_title,
-        logo_filename)
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_FOLDER, prefix="extract_")
+    try:
+        with os.fdopen(fd, "wb") as out, upload.open_binary() as raw:
+            shutil.copyfileobj(raw, out, UPLOAD_CHUNK_SIZE)
+        yield tmp_path
+    finally:
+        os.remove(tmp_path)
 
-    add_quiz_to_registry(
-        db_quiz_id,
-        html_name,
-        quiz_title,
-        logo_filename
-    )
 
+def extract_document_lines(upload, kind, report=None):
+    """
+    Text lines of a PDF or DOCX upload, ready for parse_questions or the
+    paste preview.
+    """
+    with upload_local_path(upload) as path:
+        if kind == "pdf":
+            return extract_pdf_lines(path, report=report)
+        return list(iter_docx_lines(path))
 
 
+def extract_document_upload(file):
+    """
+    (text, error) for a PDF/DOCX file posted to the paste preview. The
+    file is streamed to disk like /process uploads and removed afterwards.
+    """
+    path = os.path.join(UPLOAD_FOLDER, f"document_{time.time_ns()}")
+    save_upload_stream(file, path)
+    try:
+        upload = UploadText(path)
+        kind = detect_quiz_format(upload, file.filename)
+        if kind not in ("pdf", "docx"):
+            return "", "Please choose a PDF or Word (.docx) document."
+        return "\n".join(extract_document_lines(upload, kind)).strip(), None
+    except UPLOAD_READ_ERRORS as e:
+        return "", f"Could not read the document: {e}"
+    finally:
+        os.remove(path)
 
-    build_quiz_html(
-        html_name,
-        json_name,
-        os.path.join(QUIZ_FOLDER, html_name),
-        get_portal_title(),
-        quiz_title,
-        logo_filename,
-        db_quiz_id
-    )
 
+@quiz_importer("pdf", "PDF document", extensions=(".pdf",), sniff=lambda head: head.startswith("%PDF-"))
+def read_pdf_quiz(upload, report):
+    return parse_questions(extract_document_lines(upload, "pdf", report), report=report)
 
-    # FINAL SAFETY: only register logo if file actually exists
-    if logo_filename:
-        final_logo_path = os.path.join(LOGO_FOLDER, logo_filename)
-        if not os.path.exists(final_logo_path):
-            dprint("[LOGO FIX] Prevented registering missing logo:", logo_filename)
-            logo_filename = None
 
-    #add_quiz_to_registry(html_name, quiz_title, logo_filename)
+@quiz_importer("docx", "Word document (.docx)", extensions=(".docx",),
+               sniff=lambda head: head.startswith("PK\x03\x04"))
+def read_docx_quiz(upload, report):
+    return parse_questions(extract_document_lines(upload, "docx", report), report=report)
 
-    return redirect("/library")
 
+# Free text goes last: it is the fallback when nothing else matched
+QUIZ_IMPORTERS.move_to_end("text")
 
 
 @app.route("/process", methods=["POST"])
@@ -7744,56 +11947,92 @@ def process_file():
     quiz_title = request.form.get("quiz_title", "Generated Quiz")
     quiz_logo = request.files.get("quiz_logo")
 
+    temp_logo_name = request.form.get("temp_logo_name", "").strip()
+    on_duplicate = request.form.get("on_duplicate", "")
+
+    # Re-posted from the "already imported" page: the file is already saved
+    pending_upload = request.form.get("pending_upload", "").strip()
+
     logo_filename = None  # ✅ ensure always defined
     source_file = None    # ✅ canonical quiz identifier
 
-    if not file:
-        return "No file uploaded", 400
+    if pending_upload:
+        if not PENDING_UPLOAD_NAME.match(pending_upload):
+            return "Invalid upload reference.", 400
+        source_file = pending_upload
+        upload_name = request.form.get("upload_name", "")
+        path = os.path.join(UPLOAD_FOLDER, source_file)
+        if not os.path.isfile(path):
+            return "Upload expired. Please upload the file again.", 400
+    else:
+        if not file:
+            return "No file uploaded", 400
 
-    # ---- determine source_file (required by schema) ----
-    if file.filename:
-        now = int(time.time())
-        source_file = f"quiz_upload_{now}_{int(time.time() * 1000)}"
+        # ---- determine source_file (required by schema) ----
+        if file.filename:
+            now = int(time.time())
+            source_file = f"quiz_upload_{now}_{int(time.time() * 1000)}"
 
 
 
-    else:
-        source_file = f"manual_paste_{int(time.time())}"
+        else:
+            source_file = f"manual_paste_{int(time.time())}"
 
-    # ---- save uploaded text file ----
-    path = os.path.join(UPLOAD_FOLDER, source_file)
-    file.save(path)
+        upload_name = file.filename or ""
 
+        # ---- save uploaded file (streamed in chunks, size-limited) ----
+        path = os.path.join(UPLOAD_FOLDER, source_file)
+        save_upload_stream(file, path)
 
 
-    # =========================
-    # READ FILE CONTENT (CRITICAL FIX)
-    # =========================
-    with open(path, "r", encoding="utf-8", errors="ignore") as f:
-        raw_text = f.read().strip()
-
-    if not raw_text:
-        return "Uploaded file is empty.", 400
-
-    # Normalize ALL newline styles (MATCH PASTE MODE)
-    clean_text = (
-        raw_text
-        .replace("\\r\\n", "\n")
-        .replace("\\n", "\n")
-        .replace("\r\n", "\n")
-        .replace("\r", "\n")
-    )
 
     # =========================
-    # PARSE QUIZ (SAME AS PASTE MODE)
+    # IMPORT QUIZ (text format is parsed the same as paste mode)
     # =========================
-    quiz_data = parse_questions(clean_text)
+    # The saved file is streamed (decompressed if it is a .gz/.bz2/.zip)
+    # straight into the importer for its format.
+    upload_text = UploadText(path, cleanup=TextCleanup(load_portal_config()))
+    import_format = request.form.get("import_format", "auto")
+    parse_report = ParseReport()
+    try:
+        if not upload_text.head(IMPORT_SNIFF_CHARS).strip():
+            return "Uploaded file is empty.", 400
+
+        if import_format not in QUIZ_IMPORTERS:
+            import_format = detect_quiz_format(upload_text, upload_name)
+
+        # ---- same content imported before? (one hashing pass, no parse) ----
+        content_hash = quiz_content_hash(upload_text, import_format)
+        existing = find_quiz_by_content_hash(content_hash)
+
+        if existing and on_duplicate == "refresh":
+            logo_filename = finalize_logo_from_request(
+                app,
+                int(time.time()),
+                logo_file=quiz_logo,
+                temp_logo_name=temp_logo_name,
+            )
+            refresh_quiz_metadata(existing["id"], quiz_title, logo_filename)
+            os.remove(path)
+            return redirect("/library")
+
+        if existing and on_duplicate != "new":
+            return render_duplicate_quiz(existing, "/process", quiz_title, {
+                "pending_upload": source_file,
+                "upload_name": upload_name,
+                "import_format": import_format,
+                "temp_logo_name": temp_logo_name or save_preview_logo(app, quiz_logo),
+            })
+
+        quiz_data = import_quiz(upload_text, import_format, report=parse_report)
+        if upload_text.cleanup.removed_unicode:
+            parse_report.info("Removed invisible characters", ", ".join(upload_text.cleanup.removed_unicode))
+    except UPLOAD_READ_ERRORS as e:
+        return f"Could not read the uploaded file: {e}", 400
 
     # Always save a parse log (success or failure)
     ts = int(time.time())
-    log_filename = f"parse_log_{ts}.txt"
-    with open(os.path.join(DATA_FOLDER, log_filename), "w", encoding="utf-8") as f:
-        f.write("\n".join(PARSE_LOG))
+    log_filename = parse_report.write(DATA_FOLDER)
 
     if not quiz_data:
         return render_template_string("""
@@ -7847,17 +12086,12 @@ def process_file():
         </html>
         """, log_filename=log_filename), 400
 
-    print("UPLOAD MODE FINAL PARSE COUNT:", len(quiz_data))
+    print("UPLOAD MODE FINAL PARSE COUNT:", len(quiz_data), f"({import_format})")
 
     # =========================
     # PARSE DIAGNOSTICS (TEMP)
     # =========================
-    for i, q in enumerate(quiz_data, 1):
-        choices = q.get("choices", [])
-        has_correct = any(c.get("is_correct") for c in choices)
-
-        if not choices or not has_correct:
-            dprint(f"[PARSE WARNING] Q{i} missing choices or correct answer")
+    check_parsed_questions(quiz_data)
 
 
     # =========================
@@ -7867,6 +12101,7 @@ def process_file():
         app,
         ts,
         logo_file=quiz_logo,
+        temp_logo_name=temp_logo_name,
     )
 
     # =========================
@@ -7878,7 +12113,8 @@ def process_file():
         quiz_title,
         source_file,
         quiz_data,
-        logo_filename
+        logo_filename,
+        content_hash=content_hash,
     )
 
 
@@ -7892,8 +12128,7 @@ def process_file():
     json_name = f"quiz_{ts}.json"
     html_name = f"quiz_{ts}.html"
 
-    with open(os.path.join(DATA_FOLDER, json_name), "w", encoding="utf-8") as f:
-        json.dump(quiz_data, f, indent=4)
+    write_quiz_json(os.path.join(DATA_FOLDER, json_name), quiz_data)
 
     build_quiz_html(
         html_name,
@@ -8435,8 +12670,7 @@ def save_settings():
             )
 
         cfg["background_image"] = filename
-
-
+        BACKGROUND_INDEX.invalidate()
 
         dprint("[SETTINGS] Background saved to:", save_path)
         dprint("[SETTINGS] background_image set to:", cfg["background_image"])
@@ -8930,55 +13164,33 @@ def export_anki_tsv_for_quiz(quiz_id: int) -> str:
     conn = get_db()
     cur = conn.cursor()
 
-    cur.execute("""
-        SELECT
-            q.number AS question_number,
-            q.text   AS question_text,
-            qu.title AS quiz_title,
-            GROUP_CONCAT(
-                c.label || '. ' || c.text,
-                CHAR(10)
-            ) AS choices,
-            GROUP_CONCAT(
-                CASE WHEN c.is_correct = 1 THEN c.label END,
-                ', '
-            ) AS correct_letters,
-            GROUP_CONCAT(
-                CASE WHEN c.is_correct = 1 THEN c.label || '. ' || c.text END,
-                CHAR(10)
-            ) AS correct_text
-        FROM questions q
-        JOIN quizzes qu ON qu.id = q.quiz_id
-        JOIN choices c ON c.question_id = q.id
-        WHERE q.quiz_id = ?
-        GROUP BY q.id
-        ORDER BY q.number
-    """, (quiz_id,))
-
-    rows = cur.fetchall()
-    conn.close()
+    row = cur.execute("SELECT title FROM quizzes WHERE id = ?", (quiz_id,)).fetchone()
+    quiz_title = row[0] if row else None
 
     lines = ["Front\tBack\tTags"]
 
-    for r in rows:
+    # ---------- TAGS ----------
+    tags = (quiz_title or "autoquiz").replace(" ", "_")
+
+    for q in iter_quiz_questions(cur, quiz_id):
+        if not q.choices:
+            continue
+
         # ---------- FRONT ----------
         front = (
-            f"<b>{r['question_text']}</b><br><br>"
-            + "<br>".join((r["choices"] or "").split("\n"))
+            f"<b>{q.question}</b><br><br>"
+            + "<br>".join(f"{c.label}. {c.text}" for c in q.choices)
         ).replace("\t", " ")
 
         # ---------- BACK ----------
         back = (
-            f"<b>Correct answer:</b> {r['correct_letters']}<br><br>"
-            + "<br>".join((r["correct_text"] or "").split("\n"))
+            f"<b>Correct answer:</b> {', '.join(q.correct)}<br><br>"
+            + "<br>".join(f"{c.label}. {c.text}" for c in q.choices if c.is_correct)
         ).replace("\t", " ")
 
-        # ---------- TAGS ----------
-        quiz_tag = (r["quiz_title"] or "autoquiz").replace(" ", "_")
-        tags = quiz_tag
-
         lines.append(f"{front}\t{back}\t{tags}")
 
+    conn.close()
     return "\n".join(lines)
 
 
@@ -9327,253 +13539,325 @@ def api_portal_config():
 
 
 # =========================
-# CONFIDENCE ANALYSIS ENGINE
+# ROBUST PARSER + LOGGING
 # =========================
-def analyze_confidence(text):
-    import re
-
-    blocks = re.split(
-        r"(?=^\s*(?:Question\s*#?\s*\d+|\d+\s*[.) ]))",
-        text,
-        flags=re.IGNORECASE | re.MULTILINE
-    )
-
-    details = []
-    total = len(blocks)
-    high = medium = low = 0
-
-    for block in blocks:
-        b = block.strip()
-        if not b:
-            continue
-
-        score = 0
-        reasons = []
-
-        # --- Choices Check ---
-        choices = re.findall(r"^[A-Z][\.\)]", b, flags=re.MULTILINE)
-        if len(choices) >= 2:
-            score += 40
-            reasons.append("Detected multiple answer choices")
-        else:
-            reasons.append("Missing or too few answer choices")
-
-        # --- Has Correct Answer ---
-        if re.search(r"correct answer|suggested answer", b, re.IGNORECASE):
-            score += 40
-            reasons.append("Detected an answer key line")
-        else:
-            reasons.append("No clear answer key line found")
-
-        # --- Length / Structure ---
-        if len(b) > 120:
-            score += 20
-            reasons.append("Looks like full valid question text")
-        else:
-            reasons.append("Question block looks short/incomplete")
-
-        # ---------- Confidence Bucket ----------
-        if score >= 80:
-            level = "HIGH"
-            high += 1
-        elif score >= 40:
-            level = "MEDIUM"
-            medium += 1
-        else:
-            level = "LOW"
-            low += 1
-
-        details.append({
-            "confidence": level,
-            "score": score,
-            "preview": b[:400],
-            "reasons": reasons
-        })
+# Parse tracing is per call: parse_questions(text, report=ParseReport())
+# collects its own records, so concurrent uploads never share a log.
+# Without a report the parser does no trace work at all.
+PARSE_TRACE_LEVELS = {"debug": 10, "info": 20, "warning": 30}
+PARSE_TRACE_LEVEL = os.environ.get("DLMS_PARSE_TRACE", "info").strip().lower()
 
-    summary = {
-        "total": total,
-        "high": high,
-        "medium": medium,
-        "low": low
-    }
 
-    return summary, details
+class ParseReport:
+    """
+    Structured trace of one parse_questions() call.
 
+    Each record is {"level", "block", "line", "reason", "detail"}; block is
+    the 1-based question block index and line the 1-based line number in
+    the normalized text. Records below the report level are dropped before
+    any string formatting happens.
+    """
 
+    def __init__(self, level=None):
+        level = (level or PARSE_TRACE_LEVEL).lower()
+        self.level = PARSE_TRACE_LEVELS.get(level, PARSE_TRACE_LEVELS["info"])
+        self.records = []
+        self.blocks = 0
+        self.accepted = 0
+        self.skipped = 0
+
+    def wants(self, level):
+        return PARSE_TRACE_LEVELS[level] >= self.level
+
+    def add(self, level, reason, *detail, block=None, line=None):
+        if PARSE_TRACE_LEVELS[level] < self.level:
+            return
+        record = {
+            "level": level,
+            "block": block,
+            "line": line,
+            "reason": reason,
+            "detail": detail,
+        }
+        self.records.append(record)
+        if DEBUG_LOGS:
+            print("[PARSE]", self.format_record(record))
+
+    def debug(self, reason, *detail, block=None, line=None):
+        self.add("debug", reason, *detail, block=block, line=line)
+
+    def info(self, reason, *detail, block=None, line=None):
+        self.add("info", reason, *detail, block=block, line=line)
+
+    def warning(self, reason, *detail, block=None, line=None):
+        self.add("warning", reason, *detail, block=block, line=line)
+
+    @staticmethod
+    def format_record(record):
+        where = []
+        if record["block"] is not None:
+            where.append(f"block {record['block']}")
+        if record["line"] is not None:
+            where.append(f"line {record['line']}")
+
+        text = record["reason"]
+        if record["detail"]:
+            text += ": " + " ".join(str(d) for d in record["detail"])
+        if where:
+            text = f"[{', '.join(where)}] {text}"
+
+        return f"{record['level'].upper():<7} {text}"
+
+    def text(self):
+        lines = [
+            "=== PARSE REPORT ===",
+            f"Blocks: {self.blocks}  Accepted: {self.accepted}  Skipped: {self.skipped}",
+            "",
+        ]
+        lines.extend(self.format_record(r) for r in self.records)
+        return "\n".join(lines)
 
+    def write(self, folder):
+        """
+        Write the report to folder and return the file name.
+        """
+        log_filename = f"parse_log_{time.time_ns()}.txt"
+        with open(os.path.join(folder, log_filename), "w", encoding="utf-8") as f:
+            f.write(self.text())
+        return log_filename
 
-# =========================
-# ROBUST PARSER + LOGGING
-# =========================
-DEBUG_PARSE = True
-PARSE_LOG = []
 
+def analyze_quiz_text(source, report=None):
+    """
+    Single pass over the question blocks of a quiz text. Each block is
+    split into lines once, and the same lines feed the parser, the
+    confidence rating and the structural checks, so all three always
+    agree on block boundaries. Returns:
 
-def dbg(*msg):
-    text = " ".join(str(m) for m in msg)
-    if DEBUG_PARSE:
-        dprint("[PARSE]", text)
-    PARSE_LOG.append(text)
+        {
+            "questions":          parsed questions (parse_questions format),
+            "confidence_summary": {"high", "medium", "low", "total"},
+            "confidence":         [{"index", "title", "confidence", "reason"}],
+            "question_blocks":    blocks that start with a question number,
+            "issues":             human-readable structural problems,
+        }
 
+    source may be quiz text, a path to a text file, or an iterable of
+    lines (see UploadText). Files and line iterables are grouped
+    into blocks as they are read, so the whole text is never held in
+    memory at once.
+    """
+    import os
 
-def parse_questions(source):
-    import re, os
+    trace = report is not None
+    debug = trace and report.wants("debug")
 
-    global PARSE_LOG
-    PARSE_LOG.clear()
-    dbg("=== NEW PARSE SESSION STARTED ===")
+    if trace:
+        report.info("Parse session started")
 
-    # Allow BOTH: file paths OR already-loaded quiz text
+    # Allow file paths, line iterables OR already-loaded quiz text
     if isinstance(source, str) and os.path.isfile(source):
-        dbg("Input detected as FILE path → reading file")
+        if trace:
+            report.info("Input detected as FILE path, streaming file", source)
         with open(source, "r", encoding="utf-8", errors="ignore") as f:
-            raw = f.read()
-    else:
-        dbg("Input detected as RAW TEXT → using directly")
-        raw = source
+            return analyze_quiz_text(iter(f), report=report)
 
-    # Normalize newlines
-    text = raw.replace("\r\n", "\n").replace("\r", "\n")
+    if isinstance(source, str):
+        if trace:
+            report.info("Input detected as RAW TEXT")
 
-    # Remove UTF-8 BOM if present
-    text = text.lstrip("\ufeff")
-    dbg("BOM stripped (if present)")
+        # Normalize newlines
+        text = source.replace("\r\n", "\n").replace("\r", "\n")
 
-    # Split into question blocks
-    blocks = re.split(
-        r"(?=^\s*(?:Question\s*#?\s*\d+|\d+\s*[.) ]))",
-        text,
-        flags=re.IGNORECASE | re.MULTILINE
-    )
+        # Remove UTF-8 BOM if present
+        text = text.lstrip("\ufeff")
 
-    dbg("Total detected blocks:", len(blocks))
+        # Split into question blocks
+        blocks = QUESTION_BLOCK_SPLIT.split(text)
+    else:
+        if trace:
+            report.info("Input detected as LINE STREAM")
+        blocks = iter_question_blocks(source)
 
     questions = []
+    details = []
+    counts = {"high": 0, "medium": 0, "low": 0}
+    issues = []
+    question_blocks = 0
+
     fallback_number = 1
+    block_index = 0
+    next_line = 1
 
     for block in blocks:
         original_block = block
+
+        if trace:
+            block_index += 1
+            report.blocks += 1
+            block_line = next_line
+            next_line += original_block.count("\n")
+            stripped = original_block.lstrip()
+            block_start = block_line + original_block[:len(original_block) - len(stripped)].count("\n")
+
         block = block.strip()
         if not block:
-            dbg("Skipped: empty block")
+            if debug:
+                report.debug("Skipped: empty block", block=block_index, line=block_start)
             continue
 
-        lines = [l.strip() for l in block.split("\n") if l.strip()]
-        if len(lines) < 2:
-            dbg("Skipped: too few lines:", repr(lines))
-            continue
+        raw_lines = block.split("\n")
+        lines = [l.strip() for l in raw_lines if l.strip()]
 
-        qnum_match = re.match(
-            r'^\s*(?:Question\s*#?\s*(\d+)|(\d+)\s*[.)])',
-            lines[0],
-            re.IGNORECASE
-        )
+        qnum_match = QUESTION_NUMBER_RE.match(lines[0])
 
         source_number = None
         if qnum_match:
             source_number = int(qnum_match.group(1) or qnum_match.group(2))
+            question_blocks += 1
 
         q_number = source_number if source_number is not None else fallback_number
 
-        dbg(f"\n--- Parsing Question Candidate #{q_number} ---")
-        dbg(lines[0])
+        if debug:
+            report.debug(f"Parsing question candidate #{q_number}", lines[0][:150],
+                         block=block_index, line=block_start)
+            line_numbers = [block_start + i for i, l in enumerate(raw_lines) if l.strip()]
 
         q_lines = []
         raw_choices = []
         correct_letters = []
         choices_started = False
+        has_answer_line = False
 
-        for line in lines:
+        for i, line in enumerate(lines):
             lower = line.lower()
+            is_answer_line = "correct answer" in lower or "suggested answer" in lower
+            if is_answer_line:
+                has_answer_line = True
 
             # -------- Detect Choices --------
-            mchoice = re.match(r"^\s*([A-Za-z])[\.\)]\s+(.*)", line)
+            mchoice = CHOICE_LINE_RE.match(line)
             if mchoice:
                 label = mchoice.group(1).upper()
                 text_choice = mchoice.group(2).strip()
-                dbg(f"Choice detected: {label} → {text_choice}")
+                if debug:
+                    report.debug("Choice detected", f"{label} → {text_choice}",
+                                 block=block_index, line=line_numbers[i])
                 choices_started = True
 
-                raw_choices.append({
-                    "label": label,
-                    "text": text_choice
-                })
+                raw_choices.append((label, text_choice))
                 continue
 
             # -------- Detect Correct Answer --------
-            if "correct answer" in lower or "suggested answer" in lower:
-                dbg("Found answer line:", line)
-
-                m = re.search(r"[:\-]\s*([A-Za-z]+)", line)
+            if is_answer_line:
+                m = ANSWER_LETTERS_RE.search(line)
                 if m:
                     ans = re.sub(r"[^A-Za-z]", "", m.group(1)).upper()
                     if ans:
                         correct_letters = list(dict.fromkeys(list(ans)))
-                        dbg("Parsed correct letters:", correct_letters)
+                        if debug:
+                            report.debug("Parsed correct letters", correct_letters,
+                                         block=block_index, line=line_numbers[i])
                 continue
 
             # -------- Question Text --------
             if not choices_started:
-                if not (
-                    lower.startswith("correct answer")
-                    or lower.startswith("suggested answer")
-                ):
-                    q_lines.append(line)
+                q_lines.append(line)
+
+        # ================================
+        # CONFIDENCE (same signals the preview always showed)
+        # ================================
+        num_choices = len(raw_choices)
+        reason = [
+            "Found A–Z answer choices" if num_choices else "No A–Z answer choices found",
+            "Found 'Correct/Suggested Answer' line" if has_answer_line
+            else "No explicit correct-answer line found",
+            f"{num_choices} choices detected" if num_choices >= 2
+            else f"{num_choices} choices detected (unusual count)",
+        ]
+        score = (num_choices > 0) + has_answer_line + (num_choices >= 2)
+        conf = "high" if score == 3 else "medium" if score == 2 else "low"
+        counts[conf] += 1
+
+        details.append({
+            "index": len(details) + 1,
+            "title": lines[0][:80],
+            "confidence": conf,
+            "reason": "; ".join(reason),
+        })
+
+        # ================================
+        # STRUCTURE (numbered blocks only; preamble text is not a question)
+        # ================================
+        if qnum_match:
+            if not num_choices:
+                issues.append(f"Question {q_number}: no A/B/C/D answer choices.")
+            if not has_answer_line:
+                issues.append(f"Question {q_number}: no 'Correct Answer' line, so it will be skipped.")
 
         # ================================
         # VALIDATION
         # ================================
+        if len(lines) < 2:
+            if trace:
+                report.skipped += 1
+                report.warning("Skipped: too few lines", repr(lines[:1])[:200],
+                               block=block_index, line=block_start)
+            continue
+
         if not correct_letters:
-            dbg("!! Skipped: NO correct answer found")
-            dbg(original_block[:200])
+            if trace:
+                report.skipped += 1
+                report.warning(f"Skipped #{q_number}: no correct answer found", lines[0][:120],
+                               block=block_index, line=block_start)
             continue
 
         if len(raw_choices) < 2:
-            dbg("!! Skipped: Not enough choices:", raw_choices)
+            if trace:
+                report.skipped += 1
+                report.warning(f"Skipped #{q_number}: not enough choices", len(raw_choices),
+                               block=block_index, line=block_start)
             continue
 
         # Build question text
-        question_text = " ".join(q_lines)
-        question_text = re.sub(
-            r'^(?:Question\s*#?\s*\d+[\).\s-]*|\d+[\).\s-]*)\s*',
-            '',
-            question_text,
-            flags=re.IGNORECASE
-        ).strip()
+        question_text = QUESTION_PREFIX_RE.sub("", " ".join(q_lines), count=1).strip()
 
         # ================================
         # FINALIZE CHOICES (ADD is_correct)
         # ================================
-        choices = []
-        for c in raw_choices:
-            choices.append({
-                "label": c["label"],
-                "text": c["text"],
-                "is_correct": c["label"] in correct_letters
-            })
-
-        dbg("Final Question Built:", question_text[:150])
+        choices = [
+            QuizChoice(label, text_choice, label in correct_letters)
+            for label, text_choice in raw_choices
+        ]
 
-        questions.append({
-            "number": q_number,
-            "question": question_text,
-            "choices": choices,
-            "correct": correct_letters
-        })
+        questions.append(QuizQuestion(q_number, question_text, choices, correct_letters))
 
-        dbg("✓ Question Accepted\n")
+        if trace:
+            report.accepted += 1
+            report.debug(f"Accepted #{q_number}", f"{len(choices)} choices", question_text[:150],
+                         block=block_index, line=block_start)
         fallback_number += 1
 
-    dbg("\n==== PARSE COMPLETE ====")
-    dbg("Total questions parsed:", len(questions))
-
-    return questions
-
+    if question_blocks == 0:
+        issues.insert(0, "No recognizable questions were detected.")
 
+    if trace:
+        report.info("Total detected blocks", report.blocks)
+        report.info("Parse complete", f"{len(questions)} questions parsed")
 
+    counts["total"] = len(details)
 
+    return {
+        "questions": questions,
+        "confidence_summary": counts,
+        "confidence": details,
+        "question_blocks": question_blocks,
+        "issues": issues,
+    }
 
 
+def parse_questions(source, report=None):
+    return analyze_quiz_text(source, report=report)["questions"]
 
 
 # =========================
@@ -9581,92 +13865,11 @@ def parse_questions(source):
 # =========================
 def analyze_confidence(clean_text):
     """
-    Heuristic pre-check of the raw text BEFORE parsing.
-    Used only for preview so the user can see if their input
-    looks parse-friendly.
+    Heuristic pre-check of the text for the preview: (summary, details)
+    from the same pass the parser uses.
     """
-    import re
-
-    blocks = re.split(
-        r"(?=^\s*(?:Question\s*#?\s*\d+|\d+\s*[.) ]))",
-        clean_text,
-        flags=re.IGNORECASE | re.MULTILINE
-    )
-
-    details = []
-    high = med = low = 0
-    idx = 0
-
-    for raw in blocks:
-        block = raw.strip()
-        if not block:
-            continue
-
-        idx += 1
-        lines = [l.strip() for l in block.split("\n") if l.strip()]
-        txt = " ".join(lines)
-
-        # Basic signals
-        # Detect ANY lettered choices A–Z
-        has_choice = any(re.match(r"^[A-Za-z][\.\)]\s+", l) for l in lines)
-
-        has_answer_line = any(
-            ("correct answer" in l.lower()) or ("suggested answer" in l.lower())
-            for l in lines
-        )
-        num_choices = sum(
-            1 for l in lines if re.match(r"^[A-Za-z][\.\)]\s+", l)
-
-        )
-
-        score = 0
-        reason = []
-
-        if has_choice:
-            score += 1
-            reason.append("Found A–Z answer choices")
-        else:
-            reason.append("No A–Z answer choices found")
-
-        if has_answer_line:
-            score += 1
-            reason.append("Found 'Correct/Suggested Answer' line")
-        else:
-            reason.append("No explicit correct-answer line found")
-
-        if num_choices >= 2:
-
-            score += 1
-            reason.append(f"{num_choices} choices detected")
-        else:
-            reason.append(f"{num_choices} choices detected (unusual count)")
-
-        if score == 3:
-            conf = "high"
-            high += 1
-        elif score == 2:
-            conf = "medium"
-            med += 1
-        else:
-            conf = "low"
-            low += 1
-
-        title = lines[0][:80] if lines else "[empty]"
-
-        details.append({
-            "index": idx,
-            "title": title,
-            "confidence": conf,
-            "reason": "; ".join(reason),
-        })
-
-    summary = {
-        "high": high,
-        "medium": med,
-        "low": low,
-        "total": len(details),
-    }
-    return summary, details
+    result = analyze_quiz_text(clean_text)
+    return result["confidence_summary"], result["confidence"]
 
 
 # =========================
@@ -9846,7 +14049,7 @@ def build_quiz_html(name, jsonfile, outpath, portal_title, quiz_title, logo_file
 </html>
 """
 
-    with open(outpath, "w", encoding="utf-8") as f:
+    with atomic_write(outpath) as f:
         f.write(html)
 
 
@@ -9933,8 +14136,9 @@ def get_or_create_question(conn, quiz_id, q):
 # =========================
 def get_db():
     dprint(f"[DB] get_db using DB_PATH = {DB_PATH}")
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, factory=MetricsConnection)
     conn.row_factory = sqlite3.Row
+    attach_sql_trace(conn)
     conn.execute("PRAGMA foreign_keys = ON")
 
     # 🔒 Ensure schema is always up to date
@@ -10098,19 +14302,44 @@ def ensure_schema(conn):
         cur.execute("ALTER TABLE quizzes ADD COLUMN registry_id INTEGER")
         conn.commit()
 
+    # =================================================
+    # QUIZZES TABLE MIGRATION (ADD CONTENT HASH)
+    # =================================================
+    if "content_hash" not in quiz_cols:
+        print("[DB MIGRATION] Adding content_hash column to quizzes")
+        cur.execute("ALTER TABLE quizzes ADD COLUMN content_hash TEXT")
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_quizzes_content_hash ON quizzes(content_hash)"
+        )
+        conn.commit()
+
+    # =================================================
+    # QUIZZES TABLE MIGRATION (ADD CONTENT VERSIONS)
+    # =================================================
+    # version: bumped by every edit to a quiz's questions or choices.
+    # json_version: the version its quiz JSON file was last written at.
+    if "version" not in quiz_cols:
+        print("[DB MIGRATION] Adding version / json_version columns to quizzes")
+        cur.execute("ALTER TABLE quizzes ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        cur.execute("ALTER TABLE quizzes ADD COLUMN json_version INTEGER NOT NULL DEFAULT 0")
+        conn.commit()
+
 
 
 
 
-def resolve_logo_filename(logo_filename):
+def resolve_logo_filename(logo_filename, logo_names=None):
     """
     Returns a valid logo filename or None if missing on disk.
+    logo_names: a LOGO_INDEX.names() snapshot to check against.
     """
     if not logo_filename:
         return None
 
-    logo_path = os.path.join(APP_DATA_DIR, "static", "logos", logo_filename)
-    if not os.path.exists(logo_path):
+    if logo_names is None:
+        logo_names = LOGO_INDEX.names()
+
+    if logo_filename not in logo_names:
         print(f"[LOGO AUTO-HEAL] Missing logo file: {logo_filename}")
         return None
 
@@ -10242,16 +14471,796 @@ def history_db():
 
 
 # =========================
-# RUN
+# REQUEST METRICS (/metrics + /healthz)
 # =========================
-if __name__ == "__main__":
-    #purge_legacy_quizzes()   # REMOVE after one run
+# Per-endpoint latency, status, response size, DB time and query-count
+# metrics, rendered in the Prometheus text exposition format. Everything
+# is in-process (one set per worker process in pre-fork mode).
+import threading
+from bisect import bisect_left
+from flask import g, has_request_context
+
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+METRICS_QUERY_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+
+# /healthz reports "slow" (still HTTP 200) above this DB round trip
+HEALTHZ_SLOW_DB_MS = 250
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram; counts are stored per bucket and made
+    cumulative only when rendered.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # last slot = +Inf
+        self.sum = 0.0
+        self.total = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.total += 1
+
+
+def _prom_labels(labels):
+    return ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    )
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.in_flight = 0
+        self.requests = {}      # (endpoint, method, status) -> count
+        self.latency = {}       # (endpoint, method) -> Histogram (seconds)
+        self.sizes = {}         # (endpoint, method) -> Histogram (bytes)
+        self.db_time = {}       # (endpoint, method) -> Histogram (seconds)
+        self.db_queries = {}    # (endpoint, method) -> Histogram (statements)
+        self.gauges = {}        # name -> {"help": str, "series": {labels: fn}}
+
+    def _hist(self, table, key, buckets):
+        hist = table.get(key)
+        if hist is None:
+            hist = table[key] = Histogram(buckets)
+        return hist
+
+    def observe_request(self, endpoint, method, status, seconds, size, db_seconds, db_queries):
+        key = (endpoint, method)
+        with self.lock:
+            rkey = (endpoint, method, str(status))
+            self.requests[rkey] = self.requests.get(rkey, 0) + 1
+            self._hist(self.latency, key, METRICS_LATENCY_BUCKETS).observe(seconds)
+            self._hist(self.sizes, key, METRICS_SIZE_BUCKETS).observe(size)
+            self._hist(self.db_time, key, METRICS_LATENCY_BUCKETS).observe(db_seconds)
+            self._hist(self.db_queries, key, METRICS_QUERY_BUCKETS).observe(db_queries)
+
+    def register_gauge(self, name, help_text, fn, **labels):
+        """
+        Register a callable sampled at scrape time, e.g. the queue depth
+        of a worker or job pool.
+        """
+        with self.lock:
+            entry = self.gauges.setdefault(name, {"help": help_text, "series": {}})
+            entry["series"][tuple(sorted(labels.items()))] = fn
+
+    def render(self):
+        out = []
+
+        def histogram(name, help_text, table):
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} histogram")
+            for (endpoint, method), hist in sorted(table.items()):
+                base = _prom_labels((("endpoint", endpoint), ("method", method)))
+                running = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    running += count
+                    out.append(f'{name}_bucket{{{base},le="{bound}"}} {running}')
+                out.append(f'{name}_bucket{{{base},le="+Inf"}} {hist.total}')
+                out.append(f"{name}_sum{{{base}}} {hist.sum:.6f}")
+                out.append(f"{name}_count{{{base}}} {hist.total}")
+
+        with self.lock:
+            out.append("# HELP dlms_info Application version.")
+            out.append("# TYPE dlms_info gauge")
+            out.append(f'dlms_info{{version="{APP_VERSION}"}} 1')
+
+            out.append("# HELP dlms_uptime_seconds Seconds since this process started.")
+            out.append("# TYPE dlms_uptime_seconds gauge")
+            out.append(f"dlms_uptime_seconds {time.time() - self.started:.0f}")
+
+            out.append("# HELP dlms_requests_in_flight Requests currently being handled.")
+            out.append("# TYPE dlms_requests_in_flight gauge")
+            out.append(f"dlms_requests_in_flight {self.in_flight}")
+
+            out.append("# HELP dlms_requests_total Requests by endpoint, method and status.")
+            out.append("# TYPE dlms_requests_total counter")
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                labels = _prom_labels((("endpoint", endpoint), ("method", method), ("status", status)))
+                out.append(f"dlms_requests_total{{{labels}}} {count}")
+
+            histogram("dlms_request_duration_seconds", "Request latency.", self.latency)
+            histogram("dlms_response_size_bytes", "Response body size.", self.sizes)
+            histogram("dlms_request_db_seconds", "Time spent in SQLite per request.", self.db_time)
+            histogram("dlms_request_db_queries", "SQL statements executed per request.", self.db_queries)
+
+            gauges = [(name, entry["help"], dict(entry["series"])) for name, entry in sorted(self.gauges.items())]
+
+        # Sample gauges outside the lock; callables may take their own locks
+        for name, help_text, series in gauges:
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} gauge")
+            for labels, fn in sorted(series.items()):
+                try:
+                    value = fn()
+                except Exception as e:
+                    dprint(f"[METRICS] gauge {name} failed: {e}")
+                    continue
+                label_str = _prom_labels(labels)
+                out.append(f"{name}{{{label_str}}} {value}" if label_str else f"{name} {value}")
+
+        return "\n".join(out) + "\n"
+
+
+REQUEST_METRICS = RequestMetrics()
+
+REQUEST_METRICS.register_gauge(
+    "dlms_preview_cache_entries", "Previews held for Build in this process",
+    lambda: PREVIEW_CACHE.stats()[0]
+)
+REQUEST_METRICS.register_gauge(
+    "dlms_preview_cache_bytes", "Estimated memory held by the preview cache",
+    lambda: PREVIEW_CACHE.stats()[1]
+)
+
+# User regex helpers and the PDF/DOCX + autotune process pool
+REQUEST_METRICS.register_gauge(
+    "dlms_pool_queue_depth", "Tasks waiting for a worker in each pool.",
+    lambda: _regex_sandbox_load["waiting"], pool="regex",
+)
+REQUEST_METRICS.register_gauge(
+    "dlms_pool_active_workers", "Busy workers in each pool.",
+    lambda: _regex_sandbox_load["running"], pool="regex",
+)
+REQUEST_METRICS.register_gauge(
+    "dlms_pool_workers", "Configured workers in each pool.",
+    lambda: REGEX_SANDBOX_WORKERS, pool="regex",
+)
+REQUEST_METRICS.register_gauge(
+    "dlms_pool_queue_depth", "Tasks waiting for a worker in each pool.",
+    lambda: document_pool_load()[0], pool="documents",
+)
+REQUEST_METRICS.register_gauge(
+    "dlms_pool_active_workers", "Busy workers in each pool.",
+    lambda: document_pool_load()[1], pool="documents",
+)
+REQUEST_METRICS.register_gauge(
+    "dlms_pool_workers", "Configured workers in each pool.",
+    lambda: DOCUMENT_EXTRACT_PROCESSES, pool="documents",
+)
+
+
+def record_db_call(seconds, statements=1):
+    """
+    Add SQLite time (and statement count) to the current request's totals.
+    No-op outside a request (startup migrations, background threads).
+    """
+    if not has_request_context():
+        return
+    g.db_seconds = g.get("db_seconds", 0.0) + seconds
+    g.db_queries = g.get("db_queries", 0) + statements
+
+    trace = g.get("sql_trace")
+    if trace is not None:
+        trace.add_time(seconds)
+
+
+class MetricsCursor(sqlite3.Cursor):
+    """
+    Cursor that reports execute/fetch time to record_db_call().
+    """
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_db_call(time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_db_call(time.perf_counter() - started)
+
+    def executescript(self, sql_script):
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            record_db_call(time.perf_counter() - started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            record_db_call(time.perf_counter() - started, 0)
+
+    def fetchmany(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(*args, **kwargs)
+        finally:
+            record_db_call(time.perf_counter() - started, 0)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            record_db_call(time.perf_counter() - started, 0)
+
+
+class MetricsConnection(sqlite3.Connection):
+    """
+    Connection whose cursors (including conn.execute shortcuts) are
+    MetricsCursor instances. Used by get_db().
+    """
+
+    def cursor(self, factory=MetricsCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+# =========================
+# SQL QUERY TRACER (N+1 DETECTION)
+# =========================
+# Opt-in with DLMS_SQL_TRACE=1. get_db() connections opened during a
+# request get a set_trace_callback() hook that records every statement
+# SQLite actually runs (with bound values expanded). Cursor timing from
+# MetricsCursor is attributed to the statement that was just traced.
+# At the end of each request one summary line is printed; statement
+# shapes repeated DLMS_SQL_TRACE_N1 times or more are flagged as
+# suspected N+1 loops, and statements slower than DLMS_SQL_TRACE_SLOW_MS
+# are dumped together with their EXPLAIN QUERY PLAN.
+SQL_TRACE_ENABLED = os.getenv("DLMS_SQL_TRACE", "").strip().lower() in ("1", "true", "yes", "on")
+SQL_TRACE_N1_THRESHOLD = int(os.getenv("DLMS_SQL_TRACE_N1", "10") or 10)
+SQL_TRACE_SLOW_MS = float(os.getenv("DLMS_SQL_TRACE_SLOW_MS", "50") or 50)
+SQL_TRACE_MAX_PLANS = 5
+
+_SQL_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_SQL_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SQL_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SQL_WHITESPACE = re.compile(r"\s+")
+_SQL_TX_STATEMENTS = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE")
+
+
+def sql_statement_shape(sql):
+    """
+    Reduce an expanded statement to its shape: literals become ?,
+    IN-lists collapse, whitespace is normalized.
+    """
+    shape = _SQL_STRING_LITERAL.sub("?", sql)
+    shape = _SQL_NUMBER_LITERAL.sub("?", shape)
+    shape = _SQL_IN_LIST.sub("(?...)", shape)
+    return _SQL_WHITESPACE.sub(" ", shape).strip()
+
+
+class SqlTrace:
+    """
+    Statements executed during one request: [expanded_sql, seconds].
+    """
+
+    def __init__(self):
+        self.statements = []
+
+    def on_statement(self, sql):
+        self.statements.append([sql, 0.0])
+
+    def add_time(self, seconds):
+        if self.statements:
+            self.statements[-1][1] += seconds
+
+    def report(self):
+        shapes = {}
+        for sql, seconds in self.statements:
+            shape = sql_statement_shape(sql)
+            entry = shapes.setdefault(shape, {"count": 0, "seconds": 0.0})
+            entry["count"] += 1
+            entry["seconds"] += seconds
+
+        suspects = sorted(
+            (
+                (shape, entry) for shape, entry in shapes.items()
+                if entry["count"] >= SQL_TRACE_N1_THRESHOLD
+                and not shape.upper().startswith(_SQL_TX_STATEMENTS)
+            ),
+            key=lambda item: item[1]["count"],
+            reverse=True,
+        )
+
+        slow = []
+        seen = set()
+        for sql, seconds in sorted(self.statements, key=lambda st: st[1], reverse=True):
+            if seconds * 1000 < SQL_TRACE_SLOW_MS or len(slow) >= SQL_TRACE_MAX_PLANS:
+                break
+            shape = sql_statement_shape(sql)
+            if shape in seen:
+                continue
+            seen.add(shape)
+            slow.append((sql, seconds))
+
+        return {
+            "statements": len(self.statements),
+            "distinct_shapes": len(shapes),
+            "seconds": sum(seconds for _, seconds in self.statements),
+            "suspected_n_plus_one": suspects,
+            "slow": slow,
+        }
+
+
+def explain_query_plan(sql):
+    """
+    EXPLAIN QUERY PLAN on a separate read-only connection (the request's
+    own connection is usually closed by the time we report).
+    """
+    if sql.strip().upper().startswith(("PRAGMA", "EXPLAIN") + _SQL_TX_STATEMENTS):
+        return []
+    try:
+        conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+        try:
+            rows = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        return [f"(plan unavailable: {e})"]
+
+    return [row[-1] for row in rows]
+
+
+def attach_sql_trace(conn):
+    """
+    Called by get_db(): hook the connection into the current request's trace.
+    """
+    if not SQL_TRACE_ENABLED or not has_request_context():
+        return
+    trace = g.get("sql_trace")
+    if trace is None:
+        trace = g.sql_trace = SqlTrace()
+    conn.set_trace_callback(trace.on_statement)
+
+
+def log_sql_trace(endpoint, method, path):
+    trace = g.get("sql_trace")
+    if trace is None:
+        return
+
+    summary = trace.report()
+
+    print(
+        f"[SQL TRACE] {method} {path} endpoint={endpoint} "
+        f"queries={summary['statements']} shapes={summary['distinct_shapes']} "
+        f"db_time={summary['seconds'] * 1000:.1f}ms"
+    )
+
+    for shape, entry in summary["suspected_n_plus_one"]:
+        print(
+            f"[SQL TRACE]   suspected N+1: {entry['count']}x "
+            f"({entry['seconds'] * 1000:.1f}ms) {shape[:300]}"
+        )
+
+    for sql, seconds in summary["slow"]:
+        one_line = _SQL_WHITESPACE.sub(" ", sql).strip()
+        print(f"[SQL TRACE]   slow {seconds * 1000:.1f}ms: {one_line[:500]}")
+        for step in explain_query_plan(sql):
+            print(f"[SQL TRACE]     plan: {step}")
+
+
+@app.before_request
+def _metrics_before_request():
+    g.metrics_started = time.perf_counter()
+    g.db_seconds = 0.0
+    g.db_queries = 0
+    g.metrics_recorded = False
+    with REQUEST_METRICS.lock:
+        REQUEST_METRICS.in_flight += 1
+
+
+def _metrics_observe(status, size):
+    endpoint = request.url_rule.endpoint if request.url_rule else "unmatched"
+    REQUEST_METRICS.observe_request(
+        endpoint,
+        request.method,
+        status,
+        time.perf_counter() - g.metrics_started,
+        size,
+        g.get("db_seconds", 0.0),
+        g.get("db_queries", 0),
+    )
+    g.metrics_recorded = True
+
+
+@app.after_request
+def _metrics_after_request(response):
+    if "metrics_started" in g:
+        _metrics_observe(response.status_code, response.content_length or 0)
+    return response
+
+
+@app.teardown_request
+def _metrics_teardown_request(exc):
+    if "metrics_started" not in g:
+        return
+    # Unhandled exceptions skip after_request; count them as 500s
+    if not g.get("metrics_recorded"):
+        _metrics_observe(500, 0)
+    with REQUEST_METRICS.lock:
+        REQUEST_METRICS.in_flight -= 1
+
+    if SQL_TRACE_ENABLED:
+        endpoint = request.url_rule.endpoint if request.url_rule else "unmatched"
+        log_sql_trace(endpoint, request.method, request.path)
+
+
+def register_waitress_gauges(server):
+    """
+    Expose the Waitress task queue (requests waiting for a worker thread)
+    and busy-thread count.
+    """
+    dispatcher = server.task_dispatcher
+    REQUEST_METRICS.register_gauge(
+        "dlms_pool_queue_depth", "Tasks waiting for a worker in each pool.",
+        lambda: len(dispatcher.queue), pool="waitress",
+    )
+    REQUEST_METRICS.register_gauge(
+        "dlms_pool_active_workers", "Busy workers in each pool.",
+        lambda: dispatcher.active_count, pool="waitress",
+    )
+    REQUEST_METRICS.register_gauge(
+        "dlms_pool_workers", "Configured workers in each pool.",
+        lambda: len(dispatcher.threads), pool="waitress",
+    )
+
+
+@app.route("/metrics")
+def metrics():
+    return Response(
+        REQUEST_METRICS.render(),
+        mimetype="text/plain",
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
+
+
+@app.route("/healthz")
+def healthz():
+    """
+    Liveness + DB check: opens a connection the way routes do and reads
+    from the schema table. 503 if the database is unreachable.
+    """
+    started = time.perf_counter()
+    try:
+        conn = get_db()
+        conn.execute("SELECT version FROM schema_meta WHERE id = 1").fetchone()
+        conn.close()
+    except sqlite3.Error as e:
+        print("[HEALTHZ] DB check failed:", e)
+        return jsonify(status="error", error=str(e)), 503
+
+    db_ms = (time.perf_counter() - started) * 1000
+
+    return jsonify(
+        status="ok" if db_ms < HEALTHZ_SLOW_DB_MS else "slow",
+        db_latency_ms=round(db_ms, 2),
+        version=APP_VERSION,
+    )
+
+
+# =========================
+# PRODUCTION SERVER (WAITRESS)
+# =========================
+# app.run() is Werkzeug's development server: fine for a desktop session,
+# not for a long-running systemd service. Production mode serves the same
+# Flask app through Waitress, a pure-Python WSGI server that bundles into
+# the PyInstaller binary like any other import.
+#
+# Every setting can come from the command line or a DLMS_* environment
+# variable (command line wins), so a systemd unit only needs Environment=
+# lines:
+#
+#   python app.py --production --threads 16
+#   DLMS_SERVER=production DLMS_THREADS=16 ./DLMS
+SERVER_DEFAULTS = {
+    "server": "dev",            # "dev" (Werkzeug) or "production" (Waitress)
+    "host": "0.0.0.0",
+    "port": 9001,
+    "threads": 8,               # Waitress worker threads per process
+    "processes": 1,             # >1 pre-forks workers on one socket (POSIX only)
+    "connection_limit": 100,    # max open client connections per process
+    "channel_timeout": 120,     # seconds an idle keep-alive / stalled client may hold a connection
+    "backlog": 1024,            # listen() backlog
+    "max_request_body_size": 1073741824,  # 1 GiB (Waitress default)
+    "access_log": "-",          # "-" = stdout, a file path, or "off"
+}
+
+# Set in pre-forked workers so /api/shutdown stops the whole server,
+# not just the worker that happened to take the request.
+SERVER_MASTER_PID = None
+
+
+def load_server_settings(argv=None):
+    """
+    Resolve server settings: defaults < DLMS_* environment < command line.
+    """
+    import argparse
+
+    settings = dict(SERVER_DEFAULTS)
+
+    for key, default in SERVER_DEFAULTS.items():
+        raw = os.getenv(f"DLMS_{key.upper()}")
+        if raw is None or raw.strip() == "":
+            continue
+        try:
+            settings[key] = type(default)(raw.strip())
+        except ValueError:
+            print(f"[SERVER] Ignoring invalid DLMS_{key.upper()}={raw!r}")
+
+    parser = argparse.ArgumentParser(description=f"{APP_NAME} {APP_VERSION}")
+    parser.add_argument("--production", dest="server", action="store_const", const="production",
+                        help="serve with Waitress instead of the Werkzeug dev server")
+    parser.add_argument("--dev", dest="server", action="store_const", const="dev",
+                        help="serve with the Werkzeug dev server (default)")
+    parser.add_argument("--host")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--connection-limit", dest="connection_limit", type=int)
+    parser.add_argument("--channel-timeout", dest="channel_timeout", type=int)
+    parser.add_argument("--backlog", type=int)
+    parser.add_argument("--max-request-body-size", dest="max_request_body_size", type=int)
+    parser.add_argument("--access-log", dest="access_log",
+                        help='"-" for stdout, a file path, or "off"')
+
+    args = parser.parse_args(argv)
+
+    for key, value in vars(args).items():
+        if value is not None:
+            settings[key] = value
+
+    settings["server"] = str(settings["server"]).strip().lower()
+    settings["threads"] = max(1, settings["threads"])
+    settings["processes"] = max(1, settings["processes"])
+
+    return settings
+
+
+class AccessLogMiddleware:
+    """
+    WSGI middleware writing one Common Log Format line per request,
+    plus the request duration in milliseconds.
+    """
+
+    def __init__(self, wsgi_app, logger):
+        self.wsgi_app = wsgi_app
+        self.logger = logger
+
+    def __call__(self, environ, start_response):
+        started = time.perf_counter()
+        state = {"status": "-", "size": 0}
+
+        def _start_response(status, headers, exc_info=None):
+            state["status"] = status.split(" ", 1)[0]
+            return start_response(status, headers, exc_info)
+
+        result = self.wsgi_app(environ, _start_response)
+        return _AccessLoggedResponse(result, environ, state, started, self.logger)
+
+
+class _AccessLoggedResponse:
+    """
+    Wraps a WSGI response iterable; logs once the server closes it,
+    so the line carries the real byte count and full duration.
+    """
+
+    def __init__(self, result, environ, state, started, logger):
+        self.result = result
+        self.environ = environ
+        self.state = state
+        self.started = started
+        self.logger = logger
+
+    def __iter__(self):
+        for chunk in self.result:
+            self.state["size"] += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self.result, "close"):
+                self.result.close()
+        finally:
+            env = self.environ
+            path = env.get("PATH_INFO", "")
+            if env.get("QUERY_STRING"):
+                path += "?" + env["QUERY_STRING"]
+
+            self.logger.info(
+                '%s - - [%s] "%s %s %s" %s %s %.1fms',
+                env.get("REMOTE_ADDR", "-"),
+                datetime.now().strftime("%d/%b/%Y:%H:%M:%S"),
+                env.get("REQUEST_METHOD", "-"),
+                path,
+                env.get("SERVER_PROTOCOL", "-"),
+                self.state["status"],
+                self.state["size"] or "-",
+                (time.perf_counter() - self.started) * 1000,
+            )
+
+
+def build_access_logger(target):
+    """
+    Returns a logger for access lines, or None when logging is "off".
+    """
+    target = (target or "").strip()
+    if not target or target.lower() == "off":
+        return None
+
+    access_logger = logging.getLogger("dlms.access")
+    access_logger.setLevel(logging.INFO)
+    access_logger.propagate = False
+
+    if target == "-":
+        handler = logging.StreamHandler(sys.stdout)
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+        handler = logging.FileHandler(target, encoding="utf-8")
+
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    access_logger.handlers = [handler]
+    return access_logger
+
+
+def serve_production(settings):
+    """
+    Serve the app with Waitress. With processes > 1 (POSIX only) the
+    listening socket is bound once and shared by pre-forked workers.
+
+    Note: in-process state (preview cache, metrics) is per worker process.
+    """
+    global SERVER_MASTER_PID
+
+    import socket
+    from waitress.server import create_server
+
+    wsgi_app = app
+    access_logger = build_access_logger(settings["access_log"])
+    if access_logger:
+        wsgi_app = AccessLogMiddleware(app, access_logger)
+
+    waitress_kw = {
+        "threads": settings["threads"],
+        "connection_limit": settings["connection_limit"],
+        "channel_timeout": settings["channel_timeout"],
+        "backlog": settings["backlog"],
+        "max_request_body_size": settings["max_request_body_size"],
+        "ident": f"{APP_NAME}/{APP_VERSION}",
+    }
+
+    processes = settings["processes"]
+    if processes > 1 and not hasattr(os, "fork"):
+        print("[SERVER] Multiple processes need fork(); running a single process")
+        processes = 1
+
+    if processes > 1 and PREVIEW_CACHE.enabled:
+        # Build may land on a different worker than Preview did
+        print("[SERVER] Preview cache disabled with multiple processes")
+        PREVIEW_CACHE.enabled = False
+
+    print(
+        f"[SERVER] Waitress on http://{settings['host']}:{settings['port']}/ "
+        f"processes={processes} threads={settings['threads']} "
+        f"channel_timeout={settings['channel_timeout']}s "
+        f"connection_limit={settings['connection_limit']}"
+    )
+
+    if processes == 1:
+        server = create_server(wsgi_app, host=settings["host"], port=settings["port"], **waitress_kw)
+        register_waitress_gauges(server)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        try:
+            server.run()
+        except KeyboardInterrupt:
+            print("[SERVER] Stopped")
+        return
+
+    family = socket.AF_INET6 if ":" in settings["host"] else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((settings["host"], settings["port"]))
+    sock.listen(settings["backlog"])
+
+    SERVER_MASTER_PID = os.getpid()
+    children = []
+
+    for _ in range(processes):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            server = create_server(wsgi_app, sockets=[sock], **waitress_kw)
+            register_waitress_gauges(server)
+            server.run()
+            os._exit(0)
+        children.append(pid)
+
+    def stop_children(signum, frame):
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    # Explicit handlers: SIGINT may be inherited as ignored (e.g. when
+    # started in the background), and /api/shutdown relies on it.
+    signal.signal(signal.SIGINT, stop_children)
+    signal.signal(signal.SIGTERM, stop_children)
+
+    for child in children:
+        try:
+            os.waitpid(child, 0)
+        except ChildProcessError:
+            pass
+
+    sock.close()
+    print("[SERVER] Stopped")
+
+
+def run_server(argv=None):
+    settings = load_server_settings(argv)
+
+    if settings["server"] == "production":
+        try:
+            import waitress  # noqa: F401
+        except ImportError:
+            print("[SERVER] waitress is not installed (pip install waitress); "
+                  "falling back to the development server")
+        else:
+            serve_production(settings)
+            return
 
     app.run(
-        host="0.0.0.0",
-        port=9001,
+        host=settings["host"],
+        port=settings["port"],
         debug=False,
         use_reloader=False
     )
 
 
+# =========================
+# RUN
+# =========================
+if __name__ == "__main__":
+    #purge_legacy_quizzes()   # REMOVE after one run
+
+    # Document extraction workers are spawned; needed by the frozen binary
+    import multiprocessing
+    multiprocessing.freeze_support()
+
+    run_server()
+
+
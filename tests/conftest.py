@@ -0,0 +1,23 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+TOOLS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tools")
+sys.path.insert(0, TOOLS)
+
+from seed import load_app  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def dlms():
+    """
+    app.py imported once against a throwaway data directory.
+    """
+    return load_app(tempfile.mkdtemp(prefix="dlms-tests-"))
+
+
+@pytest.fixture
+def client(dlms):
+    return dlms.app.test_client()
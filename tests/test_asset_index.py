@@ -0,0 +1,36 @@
+import os
+from io import BytesIO
+
+from werkzeug.datastructures import FileStorage
+
+
+def keep_mtime(folder):
+    """
+    Put folder's mtime back after a write, like a filesystem whose
+    timestamps are too coarse to see it.
+    """
+    stat = os.stat(folder)
+    return lambda: os.utime(folder, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def test_invalidate_lists_the_folder_again(dlms, tmp_path):
+    index = dlms.AssetIndex(str(tmp_path))
+    assert "a.png" not in index
+
+    restore = keep_mtime(tmp_path)
+    (tmp_path / "a.png").write_bytes(b"")
+    restore()
+    assert "a.png" not in index
+
+    index.invalidate()
+    assert "a.png" in index
+
+
+def test_uploaded_logo_is_seen_at_once(dlms):
+    dlms.LOGO_INDEX.names()
+
+    restore = keep_mtime(dlms.LOGO_FOLDER)
+    upload = FileStorage(BytesIO(b"\x89PNG\r\n"), filename="logo.png")
+    name = dlms.finalize_logo_from_request(dlms.app, 424242, logo_file=upload)
+    restore()
+    assert name in dlms.LOGO_INDEX
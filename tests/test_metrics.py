@@ -0,0 +1,37 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def pool_gauge(client, name, pool):
+    text = client.get("/metrics").get_data(as_text=True)
+    prefix = f'{name}{{pool="{pool}"}} '
+    return next(float(line[len(prefix):]) for line in text.splitlines() if line.startswith(prefix))
+
+
+def test_regex_and_document_pools_are_listed(dlms, client):
+    for pool, workers in (("regex", dlms.REGEX_SANDBOX_WORKERS), ("documents", dlms.DOCUMENT_EXTRACT_PROCESSES)):
+        assert pool_gauge(client, "dlms_pool_queue_depth", pool) == 0
+        assert pool_gauge(client, "dlms_pool_active_workers", pool) == 0
+        assert pool_gauge(client, "dlms_pool_workers", pool) == workers
+
+
+def test_document_tasks_are_counted_until_done(dlms, client):
+    release = threading.Event()
+    started = threading.Event()
+
+    def task():
+        started.set()
+        release.wait(10)
+
+    # One worker: the first task runs, the second waits for it
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        futures = [dlms.submit_document_task(pool, task) for _ in range(2)]
+        assert started.wait(10)
+        assert pool_gauge(client, "dlms_pool_active_workers", "documents") == 1
+        assert pool_gauge(client, "dlms_pool_queue_depth", "documents") == 1
+
+        release.set()
+        for future in futures:
+            future.result()
+
+    assert dlms.document_pool_load() == (0, 0)
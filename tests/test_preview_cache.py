@@ -0,0 +1,50 @@
+import re
+
+from quizgen import generate_quiz_text
+
+
+def test_put_never_evicts_the_new_entry(dlms):
+    cache = dlms.PreviewCache(max_bytes=100, ttl=60)
+
+    first = cache.put({"n": 1}, 60)
+    second = cache.put({"n": 2}, 60)
+
+    assert cache.get(first) is None
+    assert cache.get(second) == {"n": 2}
+    assert cache.stats() == (1, 60)
+
+
+def test_entry_larger_than_the_cache_is_not_cached(dlms):
+    cache = dlms.PreviewCache(max_bytes=100, ttl=60)
+
+    assert cache.put({"n": 1}, 101) == ""
+    assert cache.stats() == (0, 0)
+
+
+def test_oversized_preview_builds_from_posted_text(dlms, client, monkeypatch):
+    monkeypatch.setattr(dlms.PREVIEW_CACHE, "max_bytes", 1024 * 1024)
+
+    text = generate_quiz_text(1500, seed=33)
+    assert len(text) > 500_000
+
+    page = client.post("/preview_paste", data={"quiz_title": "Oversized", "quiz_text": text})
+    assert page.status_code == 200
+    html = page.get_data(as_text=True)
+
+    assert 'name="preview_token"' not in html
+    build_form = html[html.index('action="/process_paste"'):]
+    cleaned = re.search(r'<textarea name="quiz_text"[^>]*>(.*?)</textarea>', build_form, re.S).group(1)
+
+    built = client.post("/process_paste", data={"quiz_title": "Oversized", "quiz_text": cleaned})
+    assert built.status_code == 302
+    assert "Preview expired" not in built.get_data(as_text=True)
+
+    conn = dlms.get_db()
+    try:
+        row = conn.execute(
+            "SELECT COUNT(*) FROM questions q JOIN quizzes z ON z.id = q.quiz_id WHERE z.title = ?",
+            ("Oversized",)
+        ).fetchone()
+    finally:
+        conn.close()
+    assert row[0] == 1500
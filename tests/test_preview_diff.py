@@ -0,0 +1,47 @@
+import re
+
+from quizgen import generate_quiz_text
+
+
+def preview_token(client, text):
+    html = client.post("/preview_paste", data={
+        "quiz_title": "Diff",
+        "quiz_text": text,
+        "strip_text": "Exam dump page",
+    }).get_data(as_text=True)
+    return re.search(r'name="preview_token" value="([^"]+)"', html).group(1)
+
+
+def noisy_text(count):
+    blocks = generate_quiz_text(count, seed=43).split("\n\n")
+    return "\n\n".join(f"{block}\nExam dump page {n}" for n, block in enumerate(blocks))
+
+
+def test_diff_cache_keeps_only_opcodes_and_counts_them(dlms, client):
+    token = preview_token(client, noisy_text(200))
+    _, before = dlms.PREVIEW_CACHE.stats()
+
+    first = client.get(f"/api/preview/diff?token={token}&page=1").get_json()
+    assert first["changed_blocks"] > 0
+    assert first["blocks"][0]["hunks"][0]["removed"]
+
+    cached = dlms.PREVIEW_CACHE.get(token)["diff"]
+    assert "a_lines" not in cached and "b_lines" not in cached
+    _, after = dlms.PREVIEW_CACHE.stats()
+    assert after > before
+
+    # Served from the cached opcodes, with the lines split again
+    again = client.get(f"/api/preview/diff?token={token}&page=1").get_json()
+    assert again["blocks"] == first["blocks"]
+    assert again["cleaned_lines"] == first["cleaned_lines"]
+
+
+def test_diff_that_does_not_fit_is_not_cached(dlms, client, monkeypatch):
+    token = preview_token(client, noisy_text(200))
+    own_size = dlms.PREVIEW_CACHE.entries[token][1]
+    monkeypatch.setattr(dlms.PREVIEW_CACHE, "max_bytes", own_size)
+
+    page = client.get(f"/api/preview/diff?token={token}&page=1").get_json()
+    assert page["changed_blocks"] > 0
+    assert "diff" not in dlms.PREVIEW_CACHE.get(token)
+    assert dlms.PREVIEW_CACHE.entries[token][1] == own_size
@@ -0,0 +1,48 @@
+import pytest
+
+from quizgen import generate_quiz_text
+
+
+@pytest.fixture
+def choice(dlms, client):
+    """
+    (quiz_id, choice_id, is_correct) of a freshly built quiz.
+    """
+    client.post("/process_paste", data={
+        "quiz_title": "Patch",
+        "quiz_text": generate_quiz_text(3, seed=47),
+    })
+    conn = dlms.get_db()
+    try:
+        row = conn.execute("""
+            SELECT z.id, c.id, c.is_correct FROM choices c
+            JOIN questions q ON q.id = c.question_id
+            JOIN quizzes z ON z.id = q.quiz_id
+            WHERE z.title = ? ORDER BY z.id DESC, c.id LIMIT 1
+        """, ("Patch",)).fetchone()
+    finally:
+        conn.close()
+    return tuple(row)
+
+
+@pytest.mark.parametrize("value", ["false", 0, 1, None, [], {}])
+def test_is_correct_must_be_a_boolean(dlms, value):
+    with pytest.raises(dlms.QuizPatchError):
+        dlms.parse_quiz_patch([{"op": "replace", "path": "/choices/1/is_correct", "value": value}])
+
+
+def test_non_boolean_is_correct_is_a_400(dlms, client, choice):
+    quiz_id, choice_id, is_correct = choice
+
+    resp = client.patch(f"/api/quiz/{quiz_id}", json=[
+        {"op": "replace", "path": f"/choices/{choice_id}/is_correct", "value": "false"},
+    ])
+    assert resp.status_code == 400
+    assert "true or false" in resp.get_json()["error"]
+
+    conn = dlms.get_db()
+    try:
+        row = conn.execute("SELECT is_correct FROM choices WHERE id = ?", (choice_id,)).fetchone()
+    finally:
+        conn.close()
+    assert row[0] == is_correct
@@ -0,0 +1,62 @@
+import pytest
+
+RULE = "Exam dump page => "
+STEP = ("replace", RULE.strip())
+
+
+@pytest.fixture
+def in_process(dlms, monkeypatch):
+    # Remembered timeouts are what is under test, not the sandbox itself
+    monkeypatch.setattr(dlms, "REGEX_RULE_TIMEOUT", 0)
+    monkeypatch.setattr(dlms, "_regex_timed_out", type(dlms._regex_timed_out)())
+    return dlms
+
+
+def test_timeout_skips_texts_at_least_as_long(in_process):
+    dlms = in_process
+    dlms._remember_regex_timeout(STEP, 1000)
+
+    long_text = "Exam dump page\n" * 100
+    text, applied = dlms.run_user_regex_rules(long_text, "", RULE)
+    assert text == long_text
+    assert applied == ["[REGEX TIMEOUT] Exam dump page"]
+
+    text, applied = dlms.run_user_regex_rules("Exam dump page 1\n", "", RULE)
+    assert text == " 1\n"
+    assert applied == ["Exam dump page"]
+
+
+def test_timeout_is_forgotten_after_the_ttl(in_process, monkeypatch):
+    dlms = in_process
+    monkeypatch.setattr(dlms, "REGEX_TIMEOUT_TTL", 0)
+    dlms._remember_regex_timeout(STEP, 10)
+
+    text, applied = dlms.run_user_regex_rules("Exam dump page\n" * 100, "", RULE)
+    assert applied == ["Exam dump page"]
+    assert STEP not in dlms._regex_timed_out
+
+
+def test_shorter_timeout_lowers_the_remembered_length(in_process):
+    dlms = in_process
+    dlms._remember_regex_timeout(STEP, 1000)
+    dlms._remember_regex_timeout(STEP, 400)
+    dlms._remember_regex_timeout(STEP, 800)
+
+    assert not dlms._regex_rule_timed_out(STEP, 399)
+    assert dlms._regex_rule_timed_out(STEP, 400)
+
+
+def test_preview_lists_skipped_rules(in_process, client, monkeypatch):
+    dlms = in_process
+    monkeypatch.setattr(dlms, "load_portal_config", lambda: {"enable_regex_replace": True})
+    dlms._remember_regex_timeout(STEP, 1)
+
+    html = client.post("/preview_paste", data={
+        "quiz_title": "Skipped",
+        "quiz_text": "1. Question?\nA. Yes\nB. No\nAnswer: A\nExam dump page",
+        "replace_rules": RULE,
+    }).get_data(as_text=True)
+
+    assert "Rules Skipped (Too Slow)" in html
+    assert "⚠️ Exam dump page" in html
+    assert "[REGEX TIMEOUT]" not in html
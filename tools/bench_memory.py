@@ -0,0 +1,160 @@
+"""
+Memory benchmark for the question model: how much a parsed question bank
+keeps alive as QuizQuestion / QuizChoice objects versus the nested dicts
+they replace, what a full garbage collection costs with each held, and
+the peak memory of writing and exporting a quiz.
+
+    python tools/bench_memory.py                    # default sizes
+    python tools/bench_memory.py --sizes 1000 100000
+    python tools/bench_memory.py --json /tmp/memory.json
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from quizgen import generate_quiz_text
+from seed import load_app
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+
+def object_bytes(questions):
+    """
+    sys.getsizeof of every question / choice container (records, dicts
+    and lists), leaving out the strings both representations share.
+    """
+    total = sys.getsizeof(questions)
+    for q in questions:
+        total += sys.getsizeof(q) + sys.getsizeof(q["choices"])
+        if isinstance(q, dict):
+            total += sys.getsizeof(q["correct"])
+        for c in q["choices"]:
+            total += sys.getsizeof(c)
+    return total
+
+
+def traced(fn):
+    """
+    (result, bytes still allocated afterwards, peak bytes)
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = fn()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current, peak
+
+
+def timed(fn):
+    """
+    Seconds for one call, outside tracemalloc (which slows allocation
+    heavy code several times over).
+    """
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def gc_seconds(repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        gc.collect()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(sizes):
+    data_dir = tempfile.mkdtemp(prefix="dlms-memory-bench-")
+    dlms = load_app(data_dir)
+    client = dlms.app.test_client()
+    out_path = os.path.join(data_dir, "bench.json")
+
+    results = {}
+    print(f"{'questions':>9} {'measure':<26} {'objects':>12} {'dicts':>12}")
+
+    def row(size, name, compact, legacy, unit):
+        results[f"{name}@{size}"] = {"objects": compact, "dicts": legacy}
+        if unit == "MB":
+            print(f"{size:>9} {name:<26} {compact / 1048576:>10.1f}MB {legacy / 1048576:>10.1f}MB")
+        else:
+            print(f"{size:>9} {name:<26} {compact:>11.3f}s {legacy:>11.3f}s")
+
+    for size in sizes:
+        text = generate_quiz_text(size, seed=size)
+
+        questions, retained, _ = traced(lambda: dlms.parse_questions(text))
+        dicts, dict_retained, _ = traced(lambda: [q.to_dict() for q in questions])
+
+        # The dicts share the parsed strings, so what they add on top of
+        # the objects is their container overhead
+        strings = retained - object_bytes(questions)
+        row(size, "retained after parse", retained, strings + dict_retained, "MB")
+        row(size, "question containers", object_bytes(questions), object_bytes(dicts), "MB")
+
+        dicts = None
+        compact_gc = gc_seconds()
+        dicts, questions = [q.to_dict() for q in questions], None
+        legacy_gc = gc_seconds()
+        dicts = None
+        row(size, "gc.collect() with bank", compact_gc, legacy_gc, "s")
+        questions = dlms.parse_questions(text)
+
+        _, _, stream_peak = traced(lambda: dlms.write_quiz_json(out_path, questions))
+
+        def dump_dicts():
+            with open(out_path, "w", encoding="utf-8") as f:
+                json.dump([q.to_dict() for q in questions], f, indent=4)
+
+        _, _, dump_peak = traced(dump_dicts)
+        row(size, "quiz JSON write peak", stream_peak, dump_peak, "MB")
+
+        quiz_id = dlms.save_quiz_to_db(f"Memory {size}", f"memory_{size}.html", questions)
+        questions = None
+
+        def export_txt():
+            client.get(f"/export/quiz/{quiz_id}.txt")
+
+        seconds = timed(export_txt)
+        _, _, peak = traced(export_txt)
+        results[f"export_txt@{size}"] = {"seconds": seconds, "peak_bytes": peak}
+        print(f"{size:>9} {'/export/quiz/<id>.txt':<26} {peak / 1048576:>10.1f}MB peak in {seconds:.3f}s")
+
+        def rebuild():
+            conn = dlms.get_db()
+            try:
+                dlms.write_quiz_json(out_path, dlms.iter_quiz_questions(conn.cursor(), quiz_id))
+            finally:
+                conn.close()
+
+        seconds = timed(rebuild)
+        _, _, peak = traced(rebuild)
+        results[f"rebuild_json@{size}"] = {"seconds": seconds, "peak_bytes": peak}
+        print(f"{size:>9} {'quiz JSON from database':<26} {peak / 1048576:>10.1f}MB peak in {seconds:.3f}s")
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.sizes)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Parser benchmark suite: time and peak memory of the paste/upload pipeline
+on synthetic quiz text (see quizgen.py) from 10 up to 100k questions.
+
+    python tools/bench_parser.py                          # default sizes
+    python tools/bench_parser.py --sizes 10 1000 100000
+    python tools/bench_parser.py --save-baseline tools/bench_parser_baseline.json
+    python tools/bench_parser.py --check tools/bench_parser_baseline.json --threshold 0.25
+
+--check exits with status 1 when any target is slower (or uses more peak
+memory) than the baseline by more than --threshold, so it can gate CI.
+Times are compared as multiples of a fixed calibration loop timed in the
+same run, so a machine that is uniformly faster or slower (CPU
+frequency, a noisy neighbour) does not move them. Each target is timed
+--repeat times; the spread between its fastest and slowest run is kept
+in the baseline and added to --threshold for that target.
+"""
+import argparse
+import json
+import platform
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from quizgen import generate_noisy_text
+from seed import load_app
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+# Differences below these floors are treated as noise by --check
+TIME_FLOOR_S = 0.005
+MEMORY_FLOOR_BYTES = 256 * 1024
+
+# Calibration: line scanning and regex matching like the parser's, but
+# in code that does not change with the app
+CALIBRATION_QUESTIONS = 300
+CALIBRATION_ROUNDS = 20
+CALIBRATION_LINE = re.compile(r"^\s*(?:question\s*#?\d+|\d+[.)]|[a-f][.)]|correct answer)", re.IGNORECASE)
+
+STRIP_RULES = "\n".join([
+    "Exam Version",
+    "Confidential",
+])
+
+REPLACE_RULES = "\n".join([
+    r"\(Choose \w+\.\) => ",
+    r"[ \t]+$ => ",
+])
+
+
+def build_targets(dlms):
+    """
+    name -> (callable(text), max_size or None)
+    """
+    client = dlms.app.test_client()
+
+    def preview_paste(text):
+        resp = client.post("/preview_paste", data={
+            "quiz_title": "Benchmark",
+            "quiz_text": text,
+            "strip_text": STRIP_RULES,
+            "replace_rules": REPLACE_RULES,
+            "preset_number_prefix": "",
+            "preset_pdf_spacing": "1",
+            "preset_headers": "1",
+        })
+        if resp.status_code != 200:
+            raise RuntimeError(f"/preview_paste returned {resp.status_code}")
+
+    return {
+        "parse_questions": (dlms.parse_questions, None),
+        "analyze_confidence": (dlms.analyze_confidence, None),
+        "analyze_quiz_text": (dlms.analyze_quiz_text, None),
+        "build_smart_suggestions": (lambda text: dlms.build_smart_suggestions(text, text), None),
+        "preview_paste": (preview_paste, None),
+    }
+
+
+def enable_preview_features(dlms):
+    """
+    Turn on everything /preview_paste can do so the whole pipeline runs.
+    """
+    cfg = dlms.load_portal_config()
+    cfg.update({
+        "show_confidence": True,
+        "enable_regex_replace": True,
+        "enable_regex_strip": False,
+        "auto_bom_clean": True,
+    })
+    with open(dlms.PORTAL_CONFIG, "w", encoding="utf-8") as f:
+        json.dump(cfg, f, indent=2)
+
+
+def calibration_workload(text):
+    hits = 0
+    for _ in range(CALIBRATION_ROUNDS):
+        for line in text.split("\n"):
+            if CALIBRATION_LINE.match(line):
+                hits += 1
+            hits += len(line.lower().split()) & 1
+    return hits
+
+
+def calibrate(repeat):
+    """
+    Best-of-N seconds of calibration_workload; the unit --check divides
+    every target's time by.
+    """
+    text = generate_noisy_text(CALIBRATION_QUESTIONS, seed=0)
+    best = None
+    for _ in range(max(repeat, 5)):
+        started = time.perf_counter()
+        calibration_workload(text)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def measure(fn, text, repeat):
+    """
+    Returns (best seconds, spread, peak bytes). spread is how much slower
+    the slowest of the repeat runs was than the fastest, as a fraction.
+    """
+    # The traced run also warms caches, so it is not among the timed ones
+    tracemalloc.start()
+    try:
+        fn(text)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(text)
+        times.append(time.perf_counter() - started)
+
+    best = min(times)
+    return best, max(times) / best - 1, peak
+
+
+def run(sizes, only, repeat):
+    data_dir = tempfile.mkdtemp(prefix="dlms-parser-bench-")
+    dlms = load_app(data_dir)
+    enable_preview_features(dlms)
+    targets = build_targets(dlms)
+
+    results = {}
+    calibration = calibrate(repeat)
+    print(f"calibration loop: {calibration:.4f}s\n")
+    print(
+        f"{'target':<28} {'questions':>9} {'input KB':>9} {'seconds':>9} "
+        f"{'x calib':>9} {'spread':>7} {'peak MB':>9}"
+    )
+
+    for size in sizes:
+        text = generate_noisy_text(size, seed=size)
+        for name, (fn, max_size) in targets.items():
+            if only and name not in only:
+                continue
+            if max_size is not None and size > max_size:
+                print(f"{name:<28} {size:>9} {'':>9} {'skipped (> ' + str(max_size) + ')':>19}")
+                continue
+
+            seconds, spread, peak = measure(fn, text, repeat)
+            results[f"{name}@{size}"] = {
+                "seconds": seconds,
+                "ratio": seconds / calibration,
+                "spread": spread,
+                "peak_bytes": peak,
+            }
+            print(
+                f"{name:<28} {size:>9} {len(text) / 1024:>9.0f} {seconds:>9.4f} "
+                f"{seconds / calibration:>9.3f} {spread:>7.0%} {peak / 1048576:>9.1f}"
+            )
+
+    # A second calibration after the suite; the faster of the two is the
+    # machine's speed with the least interference
+    second = calibrate(repeat)
+    if second < calibration:
+        calibration = second
+        for entry in results.values():
+            entry["ratio"] = entry["seconds"] / calibration
+
+    return calibration, results
+
+
+def check(calibration, results, baseline, threshold):
+    failures = []
+    for key, base in baseline["results"].items():
+        cur = results.get(key)
+        if cur is None:
+            continue
+
+        # Allow for the run-to-run noise seen in either run
+        allowed = threshold + max(base["spread"], cur["spread"])
+        limit = base["ratio"] * (1 + allowed)
+        if cur["ratio"] > limit and (cur["ratio"] - base["ratio"]) * calibration > TIME_FLOOR_S:
+            failures.append(
+                f"{key}: {cur['ratio']:.3f}x calibration vs baseline {base['ratio']:.3f}x "
+                f"(+{cur['ratio'] / base['ratio'] - 1:.0%}, allowed +{allowed:.0%})"
+            )
+
+        limit = base["peak_bytes"] * (1 + threshold)
+        if cur["peak_bytes"] > limit and cur["peak_bytes"] - base["peak_bytes"] > MEMORY_FLOOR_BYTES:
+            failures.append(
+                f"{key}: peak {cur['peak_bytes'] / 1048576:.1f}MB vs baseline "
+                f"{base['peak_bytes'] / 1048576:.1f}MB"
+            )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--only", nargs="+", help="run only these targets")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per target; the fastest counts")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--check", metavar="PATH", help="compare against a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown / memory growth as a fraction (default 0.25)")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.check:
+        with open(args.check, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if "calibration_seconds" not in baseline:
+            sys.exit(f"{args.check} has no calibration; record it again with --save-baseline")
+
+    calibration, results = run(args.sizes, set(args.only or []), args.repeat)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "calibration_seconds": calibration,
+                "results": results,
+            }, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.save_baseline}")
+
+    if baseline is not None:
+        print(
+            f"\ncalibration {calibration:.4f}s vs baseline {baseline['calibration_seconds']:.4f}s "
+            f"({calibration / baseline['calibration_seconds']:.2f}x)"
+        )
+        failures = check(calibration, results, baseline, args.threshold)
+        if failures:
+            print(f"\nREGRESSIONS (> {args.threshold:.0%} over baseline):")
+            for line in failures:
+                print("  " + line)
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.threshold:.0%} of baseline.")
+
+
+if __name__ == "__main__":
+    main()
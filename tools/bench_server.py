@@ -0,0 +1,148 @@
+"""
+Throughput comparison: Werkzeug dev server vs. Waitress production mode.
+
+Seeds a temporary data directory, starts app.py once per server mode and
+hammers /library and /api/attempts with concurrent keep-alive clients:
+
+    python tools/bench_server.py --clients 16 --duration 10
+"""
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from seed import REPO_ROOT, seed_data_dir
+
+ENDPOINTS = ["/library", "/api/attempts"]
+
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/help/")
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not come up")
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(pct / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+def hammer(port, path, clients, duration):
+    """
+    Run `clients` keep-alive connections against path for `duration` seconds.
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def worker():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        local = []
+        local_errors = 0
+        while time.perf_counter() < stop_at:
+            t0 = time.perf_counter()
+            try:
+                conn.request("GET", path)
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status != 200:
+                    local_errors += 1
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                continue
+            local.append(time.perf_counter() - t0)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+    }
+
+
+def run_mode(label, args, data_dir, port, bench_args):
+    env = dict(os.environ, QUIZAPP_DATA_DIR=data_dir)
+    cmd = [sys.executable, os.path.join(REPO_ROOT, "app.py"), "--port", str(port),
+           "--access-log", "off"] + args
+
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        results = {}
+        for path in ENDPOINTS:
+            hammer(port, path, bench_args.clients, 1.0)  # warm-up
+            results[path] = hammer(port, path, bench_args.clients, bench_args.duration)
+        return label, results
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--quizzes", type=int, default=200)
+    parser.add_argument("--attempts", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--port", type=int, default=9101)
+    bench_args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="dlms-bench-")
+    print(f"Seeding {data_dir} ...")
+    seed_data_dir(data_dir, quizzes=bench_args.quizzes, questions=20, attempts=bench_args.attempts)
+
+    modes = [
+        ("dev (Werkzeug)", ["--dev"]),
+        (f"production (Waitress, {bench_args.processes}p x {bench_args.threads}t)",
+         ["--production", "--threads", str(bench_args.threads),
+          "--processes", str(bench_args.processes)]),
+    ]
+
+    print(f"\n{bench_args.clients} concurrent keep-alive clients, {bench_args.duration:.0f}s per endpoint\n")
+    print(f"{'server':<40} {'endpoint':<15} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+
+    for i, (label, mode_args) in enumerate(modes):
+        label, results = run_mode(label, mode_args, data_dir, bench_args.port + i, bench_args)
+        for path, r in results.items():
+            print(f"{label:<40} {path:<15} {r['rps']:>8.1f} {r['p50_ms']:>8.1f} "
+                  f"{r['p95_ms']:>8.1f} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Classroom load test: many students taking quizzes at the same time.
+
+Seeds a temporary QUIZAPP_DATA_DIR with N quizzes and M historical
+attempts, starts app.py against it, then runs one thread per student:
+
+    open quiz page -> load quiz JSON -> answer (think time)
+    -> POST /record_attempt with missedDetails -> poll /api/attempts + dashboard
+
+and reports p50/p95/p99 latency, error rates and "database is locked"
+counts per endpoint:
+
+    python tools/loadtest.py --students 30 --duration 60
+    python tools/loadtest.py --students 60 --server dev
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bench_server import percentile, wait_for_port
+from seed import REPO_ROOT, make_attempt_payload, seed_data_dir
+
+LOCKED_MARKER = "database is locked"
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}     # endpoint -> [seconds]
+        self.errors = {}        # endpoint -> count
+        self.locked = {}        # endpoint -> count of "database is locked" responses
+
+    def record(self, endpoint, seconds, ok, locked=False):
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            if locked:
+                self.locked[endpoint] = self.locked.get(endpoint, 0) + 1
+
+
+class Student(threading.Thread):
+    def __init__(self, number, port, quizzes, stats, args, stop_at):
+        super().__init__(name=f"student-{number}", daemon=True)
+        self.number = number
+        self.port = port
+        self.quizzes = quizzes
+        self.stats = stats
+        self.args = args
+        self.stop_at = stop_at
+        self.rng = random.Random(number)
+        self.conn = None
+
+    def request(self, endpoint, method, path, body=None):
+        headers = {}
+        if body is not None:
+            body = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+
+        started = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+            self.conn.request(method, path, body=body, headers=headers)
+            resp = self.conn.getresponse()
+            data = resp.read()
+            ok = resp.status < 400
+            locked = LOCKED_MARKER in data[:4096].decode("utf-8", "replace")
+        except (OSError, http.client.HTTPException):
+            if self.conn is not None:
+                self.conn.close()
+            self.conn = None
+            ok, locked = False, False
+
+        self.stats.record(endpoint, time.perf_counter() - started, ok, locked)
+
+    def think(self, scale=1.0):
+        if self.args.think > 0:
+            time.sleep(self.rng.uniform(0.5, 1.5) * self.args.think * scale)
+
+    def run(self):
+        self.think()
+        attempt = 0
+        while time.time() < self.stop_at:
+            quiz = self.rng.choice(self.quizzes)
+
+            self.request("GET /quizzes/<quiz>.html", "GET", f"/quizzes/{quiz['html']}")
+            self.request("GET /data/<quiz>.json", "GET", f"/data/{quiz['json']}")
+
+            # Taking the quiz
+            self.think(scale=3.0)
+
+            attempt += 1
+            payload = make_attempt_payload(
+                self.rng, quiz["id"], quiz["questions"],
+                f"load-{self.number}-{attempt}-{time.time_ns()}"
+            )
+            payload["mode"] = "Exam"
+            self.request("POST /record_attempt", "POST", "/record_attempt", payload)
+
+            for _ in range(self.args.polls):
+                self.think()
+                self.request("GET /api/attempts", "GET", "/api/attempts")
+                self.request("GET /dashboard", "GET", "/dashboard")
+
+        if self.conn is not None:
+            self.conn.close()
+
+
+def report(stats, elapsed, log_locked):
+    print(f"\n{'endpoint':<28} {'reqs':>6} {'err%':>6} {'locked':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+
+    total_reqs = total_errors = total_locked = 0
+    summary = {}
+
+    for endpoint in sorted(stats.latencies):
+        lat = stats.latencies[endpoint]
+        errors = stats.errors.get(endpoint, 0)
+        locked = stats.locked.get(endpoint, 0)
+        total_reqs += len(lat)
+        total_errors += errors
+        total_locked += locked
+
+        row = {
+            "requests": len(lat),
+            "errors": errors,
+            "locked": locked,
+            "p50_ms": percentile(lat, 50) * 1000,
+            "p95_ms": percentile(lat, 95) * 1000,
+            "p99_ms": percentile(lat, 99) * 1000,
+            "max_ms": max(lat) * 1000,
+        }
+        summary[endpoint] = row
+
+        print(f"{endpoint:<28} {row['requests']:>6} {errors * 100 / len(lat):>6.1f} {locked:>7} "
+              f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['max_ms']:>8.1f}")
+
+    print(f"\n{total_reqs} requests in {elapsed:.1f}s ({total_reqs / elapsed:.1f} req/s), "
+          f"{total_errors} errors ({total_errors * 100 / max(1, total_reqs):.2f}%)")
+    print(f'"{LOCKED_MARKER}": {total_locked} in responses, {log_locked} in server log')
+
+    return {
+        "elapsed_s": elapsed,
+        "requests": total_reqs,
+        "errors": total_errors,
+        "locked_responses": total_locked,
+        "locked_log_lines": log_locked,
+        "endpoints": summary,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--students", type=int, default=30)
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of load")
+    parser.add_argument("--quizzes", type=int, default=20, help="quizzes to seed")
+    parser.add_argument("--questions", type=int, default=50, help="questions per seeded quiz")
+    parser.add_argument("--history", type=int, default=500, help="historical attempts to seed")
+    parser.add_argument("--think", type=float, default=0.5,
+                        help="mean think time in seconds between actions (0 = flat out)")
+    parser.add_argument("--polls", type=int, default=2, help="dashboard polls after each attempt")
+    parser.add_argument("--server", choices=["production", "dev"], default="production")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--port", type=int, default=9301)
+    parser.add_argument("--json", metavar="PATH", help="also write the summary as JSON")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="dlms-loadtest-")
+    print(f"Seeding {data_dir}: {args.quizzes} quizzes x {args.questions} questions, "
+          f"{args.history} attempts ...")
+    quizzes = seed_data_dir(data_dir, quizzes=args.quizzes, questions=args.questions,
+                            attempts=args.history)
+
+    log_path = os.path.join(data_dir, "server.log")
+    cmd = [sys.executable, os.path.join(REPO_ROOT, "app.py"), f"--{args.server}",
+           "--port", str(args.port), "--access-log", "off",
+           "--threads", str(args.threads), "--processes", str(args.processes)]
+
+    with open(log_path, "w", encoding="utf-8") as log:
+        proc = subprocess.Popen(cmd, env=dict(os.environ, QUIZAPP_DATA_DIR=data_dir),
+                                stdout=log, stderr=subprocess.STDOUT)
+        try:
+            wait_for_port(args.port)
+            print(f"Server: {args.server} (threads={args.threads}, processes={args.processes}); "
+                  f"{args.students} students for {args.duration:.0f}s")
+
+            stats = Stats()
+            stop_at = time.time() + args.duration
+            students = [Student(n, args.port, quizzes, stats, args, stop_at)
+                        for n in range(args.students)]
+
+            started = time.perf_counter()
+            for s in students:
+                s.start()
+            for s in students:
+                s.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+        log_locked = sum(1 for line in f if LOCKED_MARKER in line)
+
+    summary = report(stats, elapsed, log_locked)
+    summary["config"] = vars(args)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+    print(f"\nServer log: {log_path}")
+
+
+if __name__ == "__main__":
+    main()
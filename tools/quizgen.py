@@ -0,0 +1,183 @@
+"""
+Deterministic synthetic quiz-text generator.
+
+Produces paste/upload text in every layout parse_questions() accepts,
+optionally with the noise real PDF copy-pastes carry:
+
+    python tools/quizgen.py 1000 --noise > /tmp/quiz_1000.txt
+
+Same (count, seed, options) always yields the same text.
+"""
+import argparse
+import random
+
+WORDS = (
+    "which the following best describes network subnet router switch packet "
+    "firewall protocol server client cache storage volume cluster kernel process "
+    "thread memory latency backup policy identity token certificate encryption "
+    "domain address port service administrator configure deploy monitor "
+    "troubleshoot secure redundant availability performance"
+).split()
+
+NUMBER_STYLES = ("question_hash", "dot", "paren")
+ANSWER_STYLES = ("Correct Answer", "Suggested Answer")
+ZERO_WIDTH = ("\u200b", "\u200c", "\u200d", "\u2060")
+
+HEADER_LINES = (
+    "CompTIA Practice Exam - Confidential",
+    "Exam Version 3.2",
+)
+FOOTER_TEMPLATES = (
+    "Page {page} of {pages}",
+    "Copyright 2026 Example Exams. All Rights Reserved.",
+)
+
+
+def _sentence(rng, low, high):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(low, high))]
+    return " ".join(words).capitalize()
+
+
+def _question_header(style, n):
+    if style == "question_hash":
+        return f"Question #{n}"
+    if style == "dot":
+        return f"{n}."
+    return f"{n})"
+
+
+def _wrap(rng, text, width):
+    """
+    Break text the way PDF extraction does: hard newlines mid-sentence,
+    sometimes with a hyphenated word split.
+    """
+    lines = []
+    current = ""
+    for word in text.split(" "):
+        if current and len(current) + len(word) + 1 > width:
+            if len(word) > 6 and rng.random() < 0.3:
+                cut = len(word) // 2
+                lines.append(f"{current} {word[:cut]}-")
+                current = word[cut:]
+                continue
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        lines.append(current)
+    return lines
+
+
+def _sprinkle_zero_width(rng, line, rate):
+    if rng.random() >= rate or not line:
+        return line
+    pos = rng.randint(0, len(line))
+    return line[:pos] + rng.choice(ZERO_WIDTH) + line[pos:]
+
+
+def generate_question(rng, n, style=None, pdf_wrap=False, zero_width_rate=0.0):
+    """
+    Return the lines of one question block.
+    """
+    style = style or rng.choice(NUMBER_STYLES)
+
+    # Mostly 4-5 choices, occasionally long A-Z lists
+    choice_count = rng.choice([4, 4, 4, 5, 5, 3, 6]) if rng.random() > 0.01 else rng.randint(7, 26)
+    labels = [chr(ord("A") + i) for i in range(choice_count)]
+    correct = sorted(rng.sample(labels, 2 if rng.random() < 0.15 else 1))
+
+    question = _sentence(rng, 10, 35) + "?"
+    if len(correct) > 1:
+        question += f" (Choose {len(correct)}.)"
+
+    header = _question_header(style, n)
+    lines = []
+
+    if style == "question_hash":
+        lines.append(header)
+        body = _wrap(rng, question, 70) if pdf_wrap else [question]
+        lines.extend(body)
+    else:
+        body = _wrap(rng, question, 70) if pdf_wrap else [question]
+        lines.append(f"{header} {body[0]}")
+        lines.extend(body[1:])
+
+    for label in labels:
+        sep = "." if rng.random() < 0.8 else ")"
+        lines.append(f"{label}{sep} {_sentence(rng, 2, 12)}")
+
+    lines.append(f"{rng.choice(ANSWER_STYLES)}: {''.join(correct)}")
+
+    if zero_width_rate:
+        lines = [_sprinkle_zero_width(rng, line, zero_width_rate) for line in lines]
+
+    return lines
+
+
+def generate_quiz_text(count, seed=1, style=None, pdf_wrap=False, headers=False,
+                       zero_width_rate=0.0, bom=False, crlf=False, per_page=5):
+    """
+    Build a quiz text of `count` questions.
+
+    style           "question_hash" | "dot" | "paren" | None (mixed)
+    pdf_wrap        hard-wrap question text mid-sentence with hyphen splits
+    headers         insert repeated page headers/footers every `per_page` questions
+    zero_width_rate probability per line of an injected zero-width character
+    bom / crlf      leading U+FEFF / Windows line endings
+    """
+    rng = random.Random(seed)
+    out = []
+    pages = max(1, (count + per_page - 1) // per_page)
+
+    for n in range(1, count + 1):
+        if headers and (n - 1) % per_page == 0:
+            page = (n - 1) // per_page + 1
+            if page > 1:
+                out.append(FOOTER_TEMPLATES[0].format(page=page - 1, pages=pages))
+                out.append(FOOTER_TEMPLATES[1])
+            out.extend(HEADER_LINES)
+            out.append("")
+
+        out.extend(generate_question(rng, n, style, pdf_wrap, zero_width_rate))
+        out.append("")
+
+    if headers:
+        out.append(FOOTER_TEMPLATES[0].format(page=pages, pages=pages))
+        out.append(FOOTER_TEMPLATES[1])
+
+    text = "\n".join(out)
+    if crlf:
+        text = text.replace("\n", "\r\n")
+    if bom:
+        text = "\ufeff" + text
+    return text
+
+
+def generate_noisy_text(count, seed=1):
+    """
+    Typical PDF copy-paste: mixed numbering, wraps, headers/footers,
+    zero-width characters, BOM and CRLF.
+    """
+    return generate_quiz_text(count, seed=seed, pdf_wrap=True, headers=True,
+                              zero_width_rate=0.05, bom=True, crlf=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("count", type=int)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--style", choices=NUMBER_STYLES)
+    parser.add_argument("--noise", action="store_true", help="PDF wraps, headers, zero-width, BOM, CRLF")
+    args = parser.parse_args()
+
+    if args.noise:
+        text = generate_noisy_text(args.count, args.seed)
+    else:
+        text = generate_quiz_text(args.count, seed=args.seed, style=args.style)
+
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Seed a throwaway DLMS data directory with quizzes and attempt history.
+
+Used by the benchmark / load-test scripts in this folder so they never
+touch a real user profile:
+
+    python tools/seed.py /tmp/dlms-bench --quizzes 20 --questions 50 --attempts 500
+"""
+import argparse
+import os
+import random
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = (
+    "network subnet router switch packet firewall protocol server client cache "
+    "storage volume cluster kernel process thread memory latency backup policy "
+    "identity token certificate encryption domain address port service"
+).split()
+
+
+def load_app(data_dir):
+    """
+    Import app.py against data_dir. QUIZAPP_DATA_DIR must be set before
+    the import because app.py resolves its folders at import time.
+    """
+    os.environ["QUIZAPP_DATA_DIR"] = data_dir
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+
+    import app as dlms
+
+    if os.path.abspath(dlms.APP_DATA_DIR) != os.path.abspath(data_dir):
+        raise RuntimeError(f"app.py already imported with data dir {dlms.APP_DATA_DIR}")
+
+    return dlms
+
+
+def make_sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def make_quiz(rng, question_count):
+    quiz_data = []
+
+    for n in range(1, question_count + 1):
+        labels = "ABCDE"[:rng.randint(3, 5)]
+        correct = rng.sample(labels, rng.choice([1, 1, 1, 2]))
+
+        quiz_data.append({
+            "number": n,
+            "question": make_sentence(rng, rng.randint(8, 20)) + "?",
+            "choices": [
+                {
+                    "label": label,
+                    "text": make_sentence(rng, rng.randint(2, 8)),
+                    "is_correct": label in correct,
+                }
+                for label in labels
+            ],
+            "correct": sorted(correct),
+        })
+
+    return quiz_data
+
+
+def make_attempt_payload(rng, quiz_id, quiz_data, attempt_id):
+    """
+    Build a /record_attempt body the way static/script.js sends it.
+    """
+    total = len(quiz_data)
+    missed = rng.sample(quiz_data, rng.randint(0, max(0, total // 3)))
+
+    missed_details = []
+    for q in sorted(missed, key=lambda q: q["number"]):
+        labels = [c["label"] for c in q["choices"]]
+        text_by_label = {c["label"]: c["text"] for c in q["choices"]}
+        wrong = [label for label in labels if label not in q["correct"]] or labels
+        selected = [rng.choice(wrong)]
+
+        missed_details.append({
+            "attemptQuestionNumber": q["number"],
+            "number": q["number"],
+            "question": q["question"],
+            "choices": [{"label": c["label"], "text": c["text"]} for c in q["choices"]],
+            "correctLetters": q["correct"],
+            "correctText": [f"{label} — {text_by_label[label]}" for label in q["correct"]],
+            "selectedIndexes": [ord(label) - 65 for label in selected],
+            "selectedLetters": selected,
+            "selectedText": [f"{label} — {text_by_label[label]}" for label in selected],
+        })
+
+    score = total - len(missed)
+
+    return {
+        "quizId": quiz_id,
+        "quizTitle": f"Seed Quiz {quiz_id}",
+        "attemptId": attempt_id,
+        "score": score,
+        "total": total,
+        "percent": round(score * 100 / total) if total else 0,
+        "startedAt": "2026-01-01T10:00:00",
+        "completedAt": "2026-01-01T10:30:00",
+        "timeRemaining": 0,
+        "mode": rng.choice(["Study", "Exam"]),
+        "missedDetails": missed_details,
+    }
+
+
+def seed_data_dir(data_dir, quizzes=20, questions=50, attempts=200, seed=1):
+    """
+    Populate data_dir and return one dict per quiz:
+    {"id", "title", "html", "json", "questions"}.
+    """
+    import json
+
+    dlms = load_app(data_dir)
+    rng = random.Random(seed)
+    seeded = []
+
+    for i in range(quizzes):
+        title = f"Seed Quiz {i + 1}"
+        quiz_data = make_quiz(rng, questions)
+        html_name = f"seed_quiz_{i + 1}.html"
+        json_name = f"seed_quiz_{i + 1}.json"
+
+        quiz_id = dlms.save_quiz_to_db(title, html_name, quiz_data)
+
+        with open(os.path.join(dlms.DATA_FOLDER, json_name), "w", encoding="utf-8") as f:
+            json.dump(quiz_data, f, indent=4)
+
+        dlms.add_quiz_to_registry(quiz_id, html_name, title)
+        dlms.build_quiz_html(
+            html_name,
+            json_name,
+            os.path.join(dlms.QUIZ_FOLDER, html_name),
+            dlms.get_portal_title(),
+            title,
+            None,
+            quiz_id
+        )
+        seeded.append({
+            "id": quiz_id,
+            "title": title,
+            "html": html_name,
+            "json": json_name,
+            "questions": quiz_data,
+        })
+
+    client = dlms.app.test_client()
+    for n in range(attempts):
+        quiz = rng.choice(seeded)
+        payload = make_attempt_payload(rng, quiz["id"], quiz["questions"], f"seed-{seed}-{n}")
+        resp = client.post("/record_attempt", json=payload)
+        if resp.status_code != 200:
+            raise RuntimeError(f"seeding attempt failed: {resp.status_code} {resp.data[:200]!r}")
+
+    return seeded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("data_dir")
+    parser.add_argument("--quizzes", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--attempts", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    seeded = seed_data_dir(args.data_dir, args.quizzes, args.questions, args.attempts, args.seed)
+    print(f"Seeded {len(seeded)} quizzes and {args.attempts} attempts into {args.data_dir}")
+
+
+if __name__ == "__main__":
+    main()